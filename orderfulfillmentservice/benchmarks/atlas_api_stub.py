@@ -0,0 +1,553 @@
+"""Local stand-in for the parts of the Atlas Admin API the setup scripts call.
+
+Implements clusters, flexClusters, stream instances, stream connections and
+stream processors in memory, including the 409 conflicts the scripts treat as
+"already exists". Latency, error rates and a rate limit (429 with Retry-After)
+can be injected, and digest authentication can be required, so provisioning
+code can be exercised and timed offline. Point the scripts at it with:
+
+    python -m benchmarks.atlas_api_stub --port 8089 --latency-ms 150
+    export ATLAS_API_BASE_URL=http://127.0.0.1:8089/api/atlas/v2
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = "/api/atlas/v2"
+REALM = "MMS Public API"
+
+
+def md5(value):
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms=0.0,
+        latency_jitter_ms=0.0,
+        error_rate=0.0,
+        rate_limit=0.0,
+        digest=False,
+        public_key="stub",
+        private_key="stub",
+        cluster_ready_seconds=0.0,
+        stats_rate=100.0,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.digest = digest
+        self.public_key = public_key
+        self.private_key = private_key
+        self.cluster_ready_seconds = cluster_ready_seconds
+        self.stats_rate = stats_rate
+
+
+class StubState:
+    """In-memory Atlas resources and request counters, shared by all handler threads."""
+
+    def __init__(self, config, flex_clusters=()):
+        self.config = config
+        self.seed_flex_clusters = list(flex_clusters)
+        self.lock = threading.Lock()
+        self.nonce = uuid.uuid4().hex
+        self.counters = {"requests": 0, "challenges": 0, "rate_limited": 0, "errors": 0}
+        self.by_route = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.reset()
+
+    def reset(self):
+        """Drop all resources, back to an empty project; request counters keep counting"""
+        with self.lock:
+            self.clusters = {}
+            self.flex_clusters = {}
+            self.instances = {}
+            self.connections = {}
+            self.processors = {}
+            self.tokens = self.config.rate_limit
+            self.tokens_at = time.monotonic()
+            for name in self.seed_flex_clusters:
+                self.add_flex_cluster(name)
+
+    def take_token(self):
+        """Token bucket of rate_limit requests/sec; returns seconds to wait, or 0 if allowed"""
+        if not self.config.rate_limit:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.config.rate_limit, self.tokens + (now - self.tokens_at) * self.config.rate_limit
+            )
+            self.tokens_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.config.rate_limit
+
+    def add_flex_cluster(self, name):
+        host = f"{name.lower()}.stub.mongodb.net"
+        self.flex_clusters[name] = {
+            "name": name,
+            "stateName": "IDLE",
+            "providerSettings": {"backingProviderName": "AWS", "regionName": "US_EAST_1"},
+            "connectionStrings": {"standardSrv": f"mongodb+srv://{host}"},
+        }
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "max_in_flight": self.max_in_flight,
+                "by_route": dict(self.by_route),
+            }
+
+
+def error(status, error_code, detail):
+    return status, {"error": status, "errorCode": error_code, "detail": detail}
+
+
+def processor_view(processor, stats_rate):
+    """A processor as the API returns it, with counters that grow while it is started"""
+    view = {k: v for k, v in processor.items() if not k.startswith("_")}
+    running = processor["_running_seconds"]
+    if processor["state"] == "STARTED":
+        running += time.monotonic() - processor["_started_at"]
+    events = int(running * stats_rate)
+    view["stats"] = {
+        "inputMessageCount": events,
+        "inputMessageSize": events * 400,
+        "outputMessageCount": events,
+        "outputMessageSize": events * 350,
+        "dlqMessageCount": 0,
+        "dlqMessageSize": 0,
+    }
+    return view
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set on the server's handler class
+
+    # (method, path pattern below API_PREFIX, handler method, which also names the route in stats)
+    ROUTES = [
+        ("GET", r"/groups/([^/]+)/clusters", "list_clusters"),
+        ("POST", r"/groups/([^/]+)/clusters", "create_cluster"),
+        ("GET", r"/groups/([^/]+)/clusters/([^/]+)", "get_cluster"),
+        ("GET", r"/groups/([^/]+)/flexClusters", "list_flex_clusters"),
+        ("GET", r"/groups/([^/]+)/flexClusters/([^/]+)", "get_flex_cluster"),
+        ("POST", r"/groups/([^/]+)/streams", "create_instance"),
+        ("GET", r"/groups/([^/]+)/streams/([^/]+)", "get_instance"),
+        ("GET", r"/groups/([^/]+)/streams/([^/]+)/connections", "list_connections"),
+        ("POST", r"/groups/([^/]+)/streams/([^/]+)/connections", "create_connection"),
+        ("GET", r"/groups/([^/]+)/streams/([^/]+)/processors", "list_processors"),
+        ("POST", r"/groups/([^/]+)/streams/([^/]+)/processor", "create_processor"),
+        ("GET", r"/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+)", "get_processor"),
+        ("PATCH", r"/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+)", "modify_processor"),
+        ("DELETE", r"/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+)", "delete_processor"),
+        ("POST", r"/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+):start", "start_processor"),
+        ("POST", r"/groups/([^/]+)/streams/([^/]+)/processor/([^/:]+):stop", "stop_processor"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def authorized(self, method):
+        config = self.state.config
+        if not config.digest:
+            return True
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Digest "):
+            params = dict(re.findall(r'(\w+)="?([^",]+)"?', auth))
+            ha1 = md5(f"{config.public_key}:{REALM}:{config.private_key}")
+            ha2 = md5(f"{method}:{params.get('uri', '')}")
+            expected = md5(
+                f"{ha1}:{params.get('nonce')}:{params.get('nc')}:{params.get('cnonce')}:auth:{ha2}"
+            )
+            if params.get("nonce") == self.state.nonce and params.get("response") == expected:
+                return True
+        with self.state.lock:
+            self.state.counters["challenges"] += 1
+        self.read_json()
+        self.reply(
+            401,
+            {"error": 401, "detail": "You are not authorized for this resource."},
+            {"WWW-Authenticate": f'Digest realm="{REALM}", qop="auth", nonce="{self.state.nonce}", algorithm=MD5'},
+        )
+        return False
+
+    def dispatch(self, method):
+        state = self.state
+        config = state.config
+        url = urlsplit(self.path)
+        path = url.path
+        if path == "/_stub/stats" and method == "GET":
+            return self.reply(200, state.snapshot())
+        if path == "/_stub/reset" and method == "POST":
+            self.read_json()
+            state.reset()
+            return self.reply(200, {})
+
+        with state.lock:
+            state.counters["requests"] += 1
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            if not self.authorized(method):
+                return
+            wait = state.take_token()
+            if wait:
+                with state.lock:
+                    state.counters["rate_limited"] += 1
+                self.read_json()
+                return self.reply(
+                    429,
+                    {"error": 429, "errorCode": "RATE_LIMITED", "detail": "Too many requests."},
+                    {"Retry-After": f"{wait:.2f}"},
+                )
+            if config.latency_ms or config.latency_jitter_ms:
+                delay = config.latency_ms + random.uniform(0, config.latency_jitter_ms)
+                time.sleep(delay / 1000)
+            if config.error_rate and random.random() < config.error_rate:
+                with state.lock:
+                    state.counters["errors"] += 1
+                self.read_json()
+                return self.reply(*error(503, "SERVICE_UNAVAILABLE", "Injected failure."))
+
+            relative = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else None
+            for route_method, pattern, name in self.ROUTES:
+                match = re.fullmatch(pattern, relative or "")
+                if route_method == method and match:
+                    with state.lock:
+                        state.by_route[name] = state.by_route.get(name, 0) + 1
+                    body = self.read_json() if method in ("POST", "PATCH") else None
+                    query = parse_qs(url.query)
+                    return self.reply(*getattr(self, name)(*match.groups(), body=body, query=query))
+            self.read_json()
+            self.reply(*error(404, "RESOURCE_NOT_FOUND", f"No stub route for {method} {path}"))
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def page(self, items, query):
+        per_page = int(query.get("itemsPerPage", ["100"])[0])
+        page_num = int(query.get("pageNum", ["1"])[0])
+        start = (page_num - 1) * per_page
+        return {"results": items[start:start + per_page], "totalCount": len(items)}
+
+    # Clusters
+
+    def cluster_view(self, cluster):
+        view = {k: v for k, v in cluster.items() if not k.startswith("_")}
+        ready = time.monotonic() - cluster["_created_at"] >= self.state.config.cluster_ready_seconds
+        view["stateName"] = "IDLE" if ready else "CREATING"
+        return view
+
+    def list_clusters(self, group, body, query):
+        with self.state.lock:
+            clusters = [self.cluster_view(c) for c in self.state.clusters.values()]
+        return 200, self.page(clusters, query)
+
+    def create_cluster(self, group, body, query):
+        name = body.get("name")
+        with self.state.lock:
+            if name in self.state.clusters or name in self.state.flex_clusters:
+                return error(409, "DUPLICATE_CLUSTER_NAME", f"Cluster {name} already exists.")
+            host = f"{name.lower()}.stub.mongodb.net"
+            self.state.clusters[name] = {
+                **body,
+                "id": uuid.uuid4().hex[:24],
+                "groupId": group,
+                "connectionStrings": {"standardSrv": f"mongodb+srv://{host}"},
+                "providerSettings": {"providerName": "TENANT", "regionName": "US_EAST_1"},
+                "_created_at": time.monotonic(),
+            }
+            view = self.cluster_view(self.state.clusters[name])
+        return 201, view
+
+    def get_cluster(self, group, name, body, query):
+        with self.state.lock:
+            cluster = self.state.clusters.get(name)
+            view = self.cluster_view(cluster) if cluster else None
+        if view is None:
+            return error(404, "CLUSTER_NOT_FOUND", f"No cluster named {name} exists in group {group}.")
+        return 200, view
+
+    def list_flex_clusters(self, group, body, query):
+        with self.state.lock:
+            clusters = list(self.state.flex_clusters.values())
+        return 200, self.page(clusters, query)
+
+    def get_flex_cluster(self, group, name, body, query):
+        with self.state.lock:
+            cluster = self.state.flex_clusters.get(name)
+            standard = name in self.state.clusters
+        if cluster is None and standard:
+            return error(
+                400, "CANNOT_USE_NON_FLEX_CLUSTER_IN_FLEX_API", f"Cluster {name} is not a flex cluster."
+            )
+        if cluster is None:
+            return error(404, "CLUSTER_NOT_FOUND", f"No cluster named {name} exists in group {group}.")
+        return 200, cluster
+
+    # Stream instances and connections
+
+    def create_instance(self, group, body, query):
+        name = body.get("name")
+        with self.state.lock:
+            if name in self.state.instances:
+                return error(
+                    409, "STREAM_TENANT_NAME_ALREADY_EXISTS", f"A Stream instance with the name {name} already exists."
+                )
+            self.state.instances[name] = {**body, "_id": uuid.uuid4().hex[:24], "groupId": group}
+            self.state.connections[name] = {}
+            self.state.processors[name] = {}
+            instance = dict(self.state.instances[name])
+        return 200, instance
+
+    def get_instance(self, group, name, body, query):
+        with self.state.lock:
+            instance = self.state.instances.get(name)
+        if instance is None:
+            return error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {name} not found.")
+        return 200, instance
+
+    def instance_items(self, kind, instance):
+        """The connections or processors of an instance, or None if it doesn't exist"""
+        return getattr(self.state, kind).get(instance)
+
+    def list_connections(self, group, instance, body, query):
+        with self.state.lock:
+            connections = self.instance_items("connections", instance)
+            items = list(connections.values()) if connections is not None else None
+        if items is None:
+            return error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {instance} not found.")
+        return 200, self.page(items, query)
+
+    def create_connection(self, group, instance, body, query):
+        name = body.get("name")
+        with self.state.lock:
+            connections = self.instance_items("connections", instance)
+            if connections is None:
+                return error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {instance} not found.")
+            if name in connections:
+                return error(
+                    409, "STREAM_CONNECTION_NAME_ALREADY_EXISTS", f"Connection {name} already exists."
+                )
+            connections[name] = dict(body)
+        return 200, body
+
+    # Stream processors
+
+    def find_processor(self, instance, name):
+        """(processor, None), or (None, error response) if it doesn't exist"""
+        processors = self.instance_items("processors", instance)
+        if processors is None:
+            return None, error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {instance} not found.")
+        if name not in processors:
+            return None, error(404, "STREAM_PROCESSOR_NOT_FOUND", f"Stream processor {name} not found.")
+        return processors[name], None
+
+    def list_processors(self, group, instance, body, query):
+        with self.state.lock:
+            processors = self.instance_items("processors", instance)
+            items = (
+                [processor_view(p, self.state.config.stats_rate) for p in processors.values()]
+                if processors is not None
+                else None
+            )
+        if items is None:
+            return error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {instance} not found.")
+        return 200, self.page(items, query)
+
+    def create_processor(self, group, instance, body, query):
+        name = body.get("name")
+        with self.state.lock:
+            processors = self.instance_items("processors", instance)
+            if processors is None:
+                return error(404, "STREAM_TENANT_NOT_FOUND", f"Stream instance {instance} not found.")
+            if name in processors:
+                return error(409, "STREAM_PROCESSOR_ALREADY_EXISTS", f"Stream processor {name} already exists.")
+            processors[name] = {
+                "_id": uuid.uuid4().hex[:24],
+                "name": name,
+                "pipeline": body.get("pipeline", []),
+                "options": body.get("options", {}),
+                "state": "CREATED",
+                "_running_seconds": 0.0,
+                "_started_at": None,
+            }
+            view = processor_view(processors[name], self.state.config.stats_rate)
+        return 200, view
+
+    def get_processor(self, group, instance, name, body, query):
+        with self.state.lock:
+            processor, not_found = self.find_processor(instance, name)
+            if not_found:
+                return not_found
+            view = processor_view(processor, self.state.config.stats_rate)
+        return 200, view
+
+    def modify_processor(self, group, instance, name, body, query):
+        with self.state.lock:
+            processor, not_found = self.find_processor(instance, name)
+            if not_found:
+                return not_found
+            if processor["state"] == "STARTED":
+                return error(
+                    400, "STREAM_PROCESSOR_MUST_BE_STOPPED", f"Stream processor {name} must be stopped to be modified."
+                )
+            for field in ("pipeline", "options"):
+                if field in body:
+                    processor[field] = body[field]
+            view = processor_view(processor, self.state.config.stats_rate)
+        return 200, view
+
+    def delete_processor(self, group, instance, name, body, query):
+        with self.state.lock:
+            _, not_found = self.find_processor(instance, name)
+            if not_found:
+                return not_found
+            del self.state.processors[instance][name]
+        return 204, {}
+
+    def start_processor(self, group, instance, name, body, query):
+        with self.state.lock:
+            processor, not_found = self.find_processor(instance, name)
+            if not_found:
+                return not_found
+            if processor["state"] == "STARTED":
+                return error(
+                    400, "STREAM_PROCESSOR_ALREADY_STARTED", f"Stream processor {name} has already been started."
+                )
+            processor["state"] = "STARTED"
+            processor["_started_at"] = time.monotonic()
+        return 200, {}
+
+    def stop_processor(self, group, instance, name, body, query):
+        with self.state.lock:
+            processor, not_found = self.find_processor(instance, name)
+            if not_found:
+                return not_found
+            if processor["state"] != "STARTED":
+                return error(
+                    400, "STREAM_PROCESSOR_NOT_STARTED", f"Stream processor {name} is not started."
+                )
+            processor["state"] = "STOPPED"
+            processor["_running_seconds"] += time.monotonic() - processor["_started_at"]
+        return 200, {}
+
+
+class AtlasApiStub:
+    """Runs the stand-in server on a background thread."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0, flex_clusters=()):
+        self.state = StubState(config or StubConfig(), flex_clusters)
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="atlas-api-stub", daemon=True).start()
+        return self
+
+    def reset(self):
+        self.state.reset()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency added to every call")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0, help="Random extra latency, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of calls that fail with 503")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Calls/sec before answering 429 (0 disables)")
+    parser.add_argument("--digest", action="store_true", help="Require digest authentication")
+    parser.add_argument(
+        "--cluster-ready-seconds", type=float, default=0, help="Seconds before created clusters become IDLE"
+    )
+
+
+def config_from_args(args, public_key="stub", private_key="stub"):
+    return StubConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        digest=args.digest,
+        public_key=public_key,
+        private_key=private_key,
+        cluster_ready_seconds=args.cluster_ready_seconds,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--public-key", default="stub", help="Digest username (ATLAS_API_PUBLIC_KEY)")
+    parser.add_argument("--private-key", default="stub", help="Digest password (ATLAS_API_PRIVATE_KEY)")
+    parser.add_argument("--flex-cluster", action="append", default=[], help="Flex cluster to pre-create")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    stub = AtlasApiStub(
+        config_from_args(args, args.public_key, args.private_key),
+        host=args.host,
+        port=args.port,
+        flex_clusters=args.flex_cluster,
+    )
+    print(f"Atlas Admin API stand-in listening, set ATLAS_API_BASE_URL={stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
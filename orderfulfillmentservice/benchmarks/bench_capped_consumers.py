@@ -0,0 +1,191 @@
+"""Compare the tailable-cursor and change-stream consumers of the capped events collection.
+
+Both consumers apply the cart projection from
+shoppingCartEventsCappedCollectionToShoppingCartStreamProcessor into a sink with
+unordered bulk upserts; only the way they read the capped collection differs.
+Change streams need a replica set, so point this at a local replica set member:
+
+    python -m benchmarks.bench_capped_consumers --mongo-uri "mongodb://localhost:27017/?replicaSet=rs0"
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from pymongo import MongoClient
+
+from capped_collection_tailer import CappedCollectionTailer, project_change_event
+from change_stream_consumer import CheckpointStore
+from stream_projection import latest_replacements
+
+BENCH_DB = "bench_capped_consumers"
+
+
+class ChangeStreamApplier:
+    """The change-stream path: watch inserts on the capped collection and apply them."""
+
+    def __init__(self, source, sink, batch_size=500, max_await_ms=200, on_flush=None):
+        self.source = source
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_await_ms = max_await_ms
+        self.on_flush = on_flush
+
+    def flush(self, changes):
+        self.sink.bulk_write(latest_replacements(changes, project_change_event), ordered=False)
+        if self.on_flush:
+            self.on_flush([c["fullDocument"] for c in changes])
+
+    def run(self, stop_event):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        with self.source.watch(pipeline, max_await_time_ms=self.max_await_ms) as stream:
+            pending = []
+            while not stop_event.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    pending.append(change)
+                    if len(pending) < self.batch_size:
+                        continue
+                if pending:
+                    self.flush(pending)
+                    pending = []
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_event(customer_id):
+    cart = {
+        "_id": str(uuid.uuid4()),
+        "customer_id": customer_id,
+        "items": [random.randint(1, 100) for _ in range(random.randint(1, 5))],
+        "status": "update_shopping_cart",
+        "timestamp": int(time.time() * 1000),
+    }
+    return {
+        "_id": str(uuid.uuid4()),
+        "timestamp": cart["timestamp"],
+        "event_type": cart["status"],
+        "cart_data": cart,
+        "emit_ns": time.time_ns(),
+    }
+
+
+def run_consumer(client, kind, args):
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    db.create_collection("incoming_shopping_cart_events", capped=True, size=args.capped_size)
+    source = db["incoming_shopping_cart_events"]
+    sink = db["shoppingcart"]
+
+    latencies_ms = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_flush(events):
+        now = time.time_ns()
+        with lock:
+            latencies_ms.extend((now - e["emit_ns"]) / 1e6 for e in events)
+            if len(latencies_ms) >= args.events:
+                done.set()
+
+    if kind == "tailer":
+        consumer = CappedCollectionTailer(
+            source,
+            sink,
+            CheckpointStore(db["consumer_checkpoints"]),
+            batch_size=args.batch_size,
+            on_flush=on_flush,
+        )
+    else:
+        consumer = ChangeStreamApplier(source, sink, batch_size=args.batch_size, on_flush=on_flush)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=consumer.run, args=(stop,), daemon=True)
+    thread.start()
+    # Let the change stream open before producing, so no events are missed
+    time.sleep(1)
+
+    interval = 1 / args.rate if args.rate else 0
+    start = time.perf_counter()
+    for i in range(args.events):
+        source.insert_one(make_event(random.randint(1, 25)))
+        if interval:
+            sleep_for = start + (i + 1) * interval - time.perf_counter()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+    produced = time.perf_counter()
+
+    done.wait(timeout=args.timeout)
+    consumed = time.perf_counter()
+    stop.set()
+    thread.join(timeout=5)
+
+    latencies_ms.sort()
+    return {
+        "consumer": kind,
+        "events": len(latencies_ms),
+        "produce_seconds": produced - start,
+        "throughput_per_sec": len(latencies_ms) / (consumed - start),
+        "latency_ms": {
+            "p50": percentile(latencies_ms, 50),
+            "p95": percentile(latencies_ms, 95),
+            "p99": percentile(latencies_ms, 99),
+            "max": latencies_ms[-1] if latencies_ms else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", required=True, help="Local replica set to benchmark against")
+    parser.add_argument("--events", type=int, default=20000, help="Events to produce per run")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Producer events/sec (0 produces as fast as possible)"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Consumer bulk write size")
+    parser.add_argument(
+        "--capped-size",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Capped collection size in bytes (large enough that no event is overwritten)",
+    )
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the consumer")
+    parser.add_argument(
+        "--consumer",
+        action="append",
+        choices=["tailer", "change-stream"],
+        help="Consumer to benchmark (defaults to both)",
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+    results = []
+    try:
+        for kind in args.consumer or ["tailer", "change-stream"]:
+            results.append(run_consumer(client, kind, args))
+    finally:
+        client.drop_database(BENCH_DB)
+        client.close()
+
+    print(f"\n{'consumer':<15}{'events':>8}{'events/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(
+            f"{r['consumer']:<15}{r['events']:>8}{r['throughput_per_sec']:>12.0f}"
+            f"{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}{lat['max']:>10.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Measure the startup cost of every driver.py command.
+
+For each command this finds the scripts it runs (by calling it with run_script
+replaced by a recorder) and the modules those scripts import, then times:
+
+    driver      starting Python and importing driver.py
+    subprocess  what running the scripts in new interpreters costs on top of
+                that: a fresh `python` importing the scripts' modules
+    in-process  importing the same modules inside a process that has already
+                imported driver.py, as commands run now (the first command of a
+                session; later commands reuse whatever is already imported)
+
+Run it from the service directory:
+
+    python -m benchmarks.bench_driver_startup
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from unittest import mock
+
+# Scripts whose modules setup-all imports in-process
+SETUP_ALL_SCRIPTS = [
+    "create_db_collections.py",
+    "create_stream_processor_instance.py",
+    "create_stream_processor_connections.py",
+    "create_stream_processors.py",
+]
+
+# Placeholders so modules that read required settings at import time can be imported
+BENCH_ENVIRONMENT = {
+    "ATLAS_API_PUBLIC_KEY": "bench",
+    "ATLAS_API_PRIVATE_KEY": "bench",
+    "ATLAS_PROJECT_ID": "bench",
+    "ATLAS_CLUSTER_NAME": "BenchCluster",
+    "STREAM_PROCESSOR_INSTANCE_NAME": "benchStreamInstance",
+    "CLOUD_PROVIDER": "AWS",
+    "CLOUD_REGION": "VIRGINIA_USA",
+    "ORDER_SERVICE_URL": "http://localhost:5002",
+    "MONGO_URL": "@localhost",
+    "MONGO_USER": "bench",
+    "MONGO_PASS": "bench",
+}
+
+
+def command_scripts():
+    """{command name: [script, ...]} for every command that runs scripts"""
+    import driver
+
+    commands = {}
+    for command in driver.initialize_registry().list_all():
+        if command.name in driver.NGROK_COMMANDS or command.name == "setup-all":
+            continue
+        scripts = []
+
+        def record(script, args=None, in_process=True):
+            scripts.append(script)
+
+        with mock.patch.object(driver, "run_script", record), \
+                mock.patch.object(driver, "prompt_for_env_vars", lambda *a, **k: None), \
+                mock.patch("builtins.print"):
+            command.execute({}, [])
+        if scripts:
+            commands[command.name] = scripts
+    commands["setup-all"] = SETUP_ALL_SCRIPTS
+    return commands
+
+
+def script_imports(script):
+    """Top-level modules a script imports"""
+    with open(script) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def run_python(code):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env={**os.environ, **BENCH_ENVIRONMENT}
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return elapsed, result.stdout
+
+
+def timed_imports(modules):
+    """Seconds to import `modules` in a new interpreter that has already imported driver.py"""
+    imports = "; ".join(f"import {m}" for m in modules)
+    code = (
+        "import time\n"
+        + "import driver\n"
+        + "start = time.perf_counter()\n"
+        + f"{imports}\n"
+        + "from src.config import get_config; get_config().get('MONGO_URL')\n"
+        + "print(time.perf_counter() - start)\n"
+    )
+    return float(run_python(code)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement (the median is reported)")
+    parser.add_argument("--command", action="append", help="Only measure this command")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    driver_seconds = statistics.median(
+        run_python("import driver; driver.initialize_registry()")[0] for _ in range(args.runs)
+    )
+
+    results = []
+    for name, scripts in command_scripts().items():
+        if args.command and name not in args.command:
+            continue
+        modules = list(dict.fromkeys(m for script in scripts for m in script_imports(script)))
+        # Each script run in a new interpreter pays for the interpreter and its imports
+        subprocess_seconds = sum(
+            statistics.median(
+                run_python("; ".join(f"import {m}" for m in script_imports(script)))[0]
+                for _ in range(args.runs)
+            )
+            for script in scripts
+        )
+        in_process_seconds = statistics.median(
+            timed_imports(modules) for _ in range(args.runs)
+        )
+        results.append(
+            {
+                "command": name,
+                "scripts": scripts,
+                "subprocess_ms": (driver_seconds + subprocess_seconds) * 1000,
+                "in_process_ms": (driver_seconds + in_process_seconds) * 1000,
+            }
+        )
+
+    print(f"\ndriver.py startup: {driver_seconds * 1000:.0f} ms\n")
+    width = max(len("command"), *(len(r["command"]) for r in results))
+    print(f"{'command':<{width}}{'subprocess ms':>15}{'in-process ms':>15}{'saved':>8}")
+    for r in results:
+        saved = 1 - r["in_process_ms"] / r["subprocess_ms"]
+        print(f"{r['command']:<{width}}{r['subprocess_ms']:>15.0f}{r['in_process_ms']:>15.0f}{saved:>8.0%}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"driver_ms": driver_seconds * 1000, "commands": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
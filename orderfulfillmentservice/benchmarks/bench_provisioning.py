@@ -0,0 +1,199 @@
+"""Time stream processing provisioning against the local Atlas Admin API stand-in.
+
+Starts benchmarks.atlas_api_stub in-process, points the setup scripts at it
+through ATLAS_API_BASE_URL and times each scenario from an empty project:
+
+    scripts       the instance, connection, processor and start scripts run one
+                  after another as subprocesses (setup-all before it ran in-process)
+    provisioner   the same steps through src.provisioner, as setup-all runs them,
+                  then all processors started in parallel
+    deploy-noop   deploy_stream_processors.py when nothing changed
+    deploy-one    deploy_stream_processors.py after one deployed pipeline drifted
+    discovery     cluster listing and connection info lookup from src.atlas_api
+
+Run it from the service directory, e.g. with cloud-like latency and digest auth:
+
+    python -m benchmarks.bench_provisioning --latency-ms 150 --digest
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.atlas_api_stub import AtlasApiStub, add_config_arguments, config_from_args
+
+PUBLIC_KEY = "bench-public-key"
+PRIVATE_KEY = "bench-private-key"
+PROJECT_ID = "bench0000000000000000000"
+INSTANCE_NAME = "benchStreamInstance"
+CLUSTER_NAME = "BenchCluster"
+FLEX_CLUSTER_NAME = "BenchFlexCluster"
+
+SCENARIOS = ["scripts", "provisioner", "deploy-noop", "deploy-one", "discovery"]
+
+
+def bench_environment(stub):
+    return {
+        "ATLAS_API_BASE_URL": stub.base_url,
+        "ATLAS_API_PUBLIC_KEY": PUBLIC_KEY,
+        "ATLAS_API_PRIVATE_KEY": PRIVATE_KEY,
+        "ATLAS_PROJECT_ID": PROJECT_ID,
+        "ATLAS_CLUSTER_NAME": CLUSTER_NAME,
+        "STREAM_PROCESSOR_INSTANCE_NAME": INSTANCE_NAME,
+        "CLOUD_PROVIDER": "AWS",
+        "CLOUD_REGION": "VIRGINIA_USA",
+        "ORDER_SERVICE_URL": "https://order-service.example.com",
+    }
+
+
+def run_script(*args):
+    subprocess.run([sys.executable, *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def scenario_scripts(stub):
+    stub.reset()
+    run_script("create_stream_processor_instance.py")
+    run_script("create_stream_processor_connections.py")
+    run_script("create_stream_processors.py")
+    run_script("start_stream_processors.py")
+
+
+def provision(stub):
+    """The stream processing steps of setup-all, through the provisioner"""
+    import create_stream_processor_connections as connections
+    import create_stream_processor_instance as instance
+    import create_stream_processors as processors
+    import start_stream_processors as starter
+    from concurrent.futures import ThreadPoolExecutor
+
+    from src.provisioner import Provisioner
+
+    stub.reset()
+    provisioner = Provisioner(max_workers=8)
+    instance_step = provisioner.add("stream processor instance", instance.create_stream_processor_instance)
+    connection_steps = [
+        provisioner.add(f"connection {c['name']}", lambda c=c: connections.create_connection(c), deps=[instance_step])
+        for c in connections.connections
+    ]
+    for p in processors.stream_processors + [processors.kafka_stream_processor]:
+        provisioner.add(f"processor {p['name']}", lambda p=p: processors.create_processor(p), deps=connection_steps)
+    if not provisioner.run():
+        raise RuntimeError("Provisioning against the stand-in failed")
+    with ThreadPoolExecutor(max_workers=len(starter.stream_processors)) as pool:
+        if not all(pool.map(starter.start_processor, starter.stream_processors)):
+            raise RuntimeError("Starting processors against the stand-in failed")
+
+
+def scenario_provisioner(stub):
+    provision(stub)
+
+
+def scenario_deploy_noop(stub):
+    run_script("deploy_stream_processors.py")
+
+
+def scenario_deploy_one(stub):
+    # Drift one deployed pipeline so exactly one processor is redeployed
+    with stub.state.lock:
+        processor = next(iter(stub.state.processors[INSTANCE_NAME].values()))
+        processor["pipeline"] = processor["pipeline"][:-1]
+    run_script("deploy_stream_processors.py")
+
+
+def scenario_discovery(stub):
+    from src.atlas_api import get_cluster_connection_info, list_all_clusters
+
+    list_all_clusters(PROJECT_ID, PUBLIC_KEY, PRIVATE_KEY)
+    get_cluster_connection_info(PROJECT_ID, FLEX_CLUSTER_NAME, PUBLIC_KEY, PRIVATE_KEY)
+    get_cluster_connection_info(PROJECT_ID, CLUSTER_NAME, PUBLIC_KEY, PRIVATE_KEY)
+
+
+def prepare(stub, scenario):
+    """State a scenario starts from, set up outside the timed section"""
+    if scenario.startswith("deploy"):
+        provision(stub)
+    elif scenario == "discovery":
+        from src.atlas_api import DiscoveryCache
+
+        # Time the API calls, not the on-disk cache
+        DiscoveryCache().invalidate(PROJECT_ID)
+        stub.reset()
+        with stub.state.lock:
+            stub.state.clusters[CLUSTER_NAME] = {
+                "name": CLUSTER_NAME,
+                "connectionStrings": {"standardSrv": "mongodb+srv://benchcluster.stub.mongodb.net"},
+                "providerSettings": {"providerName": "AWS", "regionName": "US_EAST_1"},
+                "_created_at": 0.0,
+            }
+
+
+def run_scenario(stub, scenario, runs):
+    func = globals()[f"scenario_{scenario.replace('-', '_')}"]
+    timings = []
+    stats = None
+    for _ in range(runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare(stub, scenario)
+        before = stub.state.snapshot()
+        with stub.state.lock:
+            stub.state.max_in_flight = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(stub)
+        timings.append(time.perf_counter() - start)
+        after = stub.state.snapshot()
+        stats = {
+            key: after[key] - before[key] for key in ("requests", "challenges", "rate_limited", "errors")
+        }
+        stats["max_in_flight"] = after["max_in_flight"]
+    return {
+        "scenario": scenario,
+        "runs": runs,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_config_arguments(parser)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per scenario (the median is reported)")
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="Scenario to run (defaults to all)"
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    stub = AtlasApiStub(
+        config_from_args(args, PUBLIC_KEY, PRIVATE_KEY), flex_clusters=[FLEX_CLUSTER_NAME]
+    ).start()
+    # Set before the setup scripts are imported or started, so they talk to the stand-in
+    os.environ.update(bench_environment(stub))
+    results = []
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            results.append(run_scenario(stub, scenario, args.runs))
+    finally:
+        stub.stop()
+
+    print(
+        f"\n{'scenario':<14}{'median s':>10}{'min s':>9}{'calls':>7}{'401s':>6}{'429s':>6}{'5xx':>6}{'in flight':>11}"
+    )
+    for r in results:
+        print(
+            f"{r['scenario']:<14}{r['median_seconds']:>10.2f}{r['min_seconds']:>9.2f}{r['requests']:>7}"
+            f"{r['challenges']:>6}{r['rate_limited']:>6}{r['errors']:>6}{r['max_in_flight']:>11}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""Micro- and macro-benchmarks of the generator, the order service and the order flow.
+
+Micro-benchmarks time the hot paths in isolation, with fakes for MongoDB and
+Kafka so only this repo's code is measured:
+
+    generator.cart_events     building one event in generate_cart_events
+    send_event.mongodb        EventDestination.send_event, per destination
+    send_event.kafka
+    service.processOrder      one request through the Flask app's test client
+    service.shipOrder
+    service.getOrderHistory
+
+Macro-benchmarks run the order flow end to end against a local mongod: events
+are written to the capped collection, projected into carts, turned into orders,
+validated and shipped through the service's handlers, and read back with
+getOrderHistory. The stream processors are stood in for by the same
+projections the local consumers use, so this times the service and database
+side of the flow, not Atlas Stream Processing.
+
+Results are written as JSON. With --baseline, each benchmark is compared with
+the same benchmark in an earlier results file and the run fails if any is more
+than --threshold slower:
+
+    ./driver.py bench --suite micro --save-baseline bench_baseline.json
+    ./driver.py bench --baseline bench_baseline.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from unittest import mock
+
+from constants import CREATE_ORDER, STATUS
+
+# Placeholders so the service can be imported without a .env
+BENCH_ENVIRONMENT = {
+    "MONGO_URL": "@localhost",
+    "MONGO_USER": "bench",
+    "MONGO_PASS": "bench",
+}
+
+MACRO_DB_PREFIX = "bench_order_flow_"
+
+
+class FakeCollection:
+    """Stands in for a pymongo collection in the micro-benchmarks."""
+
+    def __init__(self, doc=None):
+        self.doc = doc or {}
+
+    def insert_one(self, doc):
+        return None
+
+    def find_one(self, *args, **kwargs):
+        return dict(self.doc)
+
+
+class FakeProducer:
+    def send(self, topic, key=None, value=None):
+        return None
+
+    def flush(self):
+        return None
+
+
+class RecordingDestination:
+    """An EventDestination that only keeps the events it is sent."""
+
+    def __init__(self):
+        self.events = []
+
+    def send_event(self, event, destination):
+        self.events.append(dict(event))
+
+
+def quiet_logging():
+    """Keep log records formatted, as they are in the scripts, but written nowhere."""
+    from src.structured_logging import configure_logging
+
+    devnull = open(os.devnull, "w")
+    for handler in configure_logging().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(devnull)
+
+
+def import_generator():
+    import shopping_cart_event_generator as generator
+
+    quiet_logging()
+    return generator
+
+
+def import_service():
+    """The order service, with its MongoClient replaced so nothing is contacted on import."""
+    for name, value in BENCH_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    with mock.patch("pymongo.MongoClient"):
+        import order_processing_service as service
+    return service
+
+
+def measure(func, number, repeat):
+    """Microseconds per call of `func` for each of `repeat` batches of `number` calls"""
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        results.append((time.perf_counter() - start) * 1e6 / number)
+    return results
+
+
+def result(name, per_op_us, unit="op", **extra):
+    median = statistics.median(per_op_us)
+    return {
+        "name": name,
+        "median_us": median,
+        "min_us": min(per_op_us),
+        "ops_per_second": 1e6 / median if median else None,
+        "unit": unit,
+        **extra,
+    }
+
+
+def sample_cart_event():
+    """A cart converted to an order, as generate_cart_events sends it"""
+    return {
+        "_id": str(uuid.uuid4()),
+        "customer_id": 7,
+        "items": [12, 48, 93],
+        STATUS: CREATE_ORDER,
+        "order_id": str(uuid.uuid4()),
+        "timestamp": int(time.time() * 1000),
+    }
+
+
+def sample_order():
+    """An order as orderValidationStreamProcessor posts it to /processOrder"""
+    cart = sample_cart_event()
+    return {
+        "_id": cart["order_id"],
+        "cart_id": cart["_id"],
+        "order_id": cart["order_id"],
+        "status": "order_created",
+        "items": cart["items"],
+        "customer_id": cart["customer_id"],
+    }
+
+
+def bench_generator(number, repeat):
+    generator = import_generator()
+    per_event_us = []
+    events = 0
+    with mock.patch.object(generator.time, "sleep"):
+        for _ in range(repeat):
+            destination = RecordingDestination()
+            start = time.perf_counter()
+            for _ in range(max(1, number // 100)):
+                generator.generate_cart_events(destination, "mongodb")
+            elapsed = time.perf_counter() - start
+            events = len(destination.events)
+            per_event_us.append(elapsed * 1e6 / events)
+    return [result("generator.cart_events", per_event_us, unit="event", events_per_run=events)]
+
+
+def bench_send_event(number, repeat):
+    generator = import_generator()
+    results = []
+    event = sample_cart_event()
+
+    mongodb = generator.EventDestination.__new__(generator.EventDestination)
+    mongodb.collection = FakeCollection()
+    results.append(
+        result("send_event.mongodb", measure(lambda: mongodb.send_event(event, "mongodb"), number, repeat))
+    )
+
+    kafka = generator.EventDestination.__new__(generator.EventDestination)
+    kafka.producer = FakeProducer()
+    kafka.kafka_topic = "shopping-cart-events"
+    results.append(
+        result("send_event.kafka", measure(lambda: kafka.send_event(event, "kafka"), number, repeat))
+    )
+    return results
+
+
+def bench_service(number, repeat):
+    service = import_service()
+    order = sample_order()
+    history = {
+        "_id": order["order_id"],
+        "customer_id": order["customer_id"],
+        "create_order_status_event": {"status": "order_created", "cart_id": order["cart_id"]},
+        "create_fulfilled_order_status_event": {"status": "order_fulfilled", "cart_id": order["cart_id"]},
+    }
+    client = service.app.test_client()
+    body = {"fullDocument": order}
+
+    def post(path):
+        response = client.post(path, json=body)
+        assert response.status_code == 200, response.status_code
+
+    def get_history():
+        response = client.get(f"/getOrderHistory?orderId={order['order_id']}")
+        assert response.status_code == 200, response.status_code
+
+    results = []
+    with mock.patch.object(service, "order_history_collection", FakeCollection(history)), \
+            mock.patch.object(service, "order_history_view", None), \
+            contextlib.redirect_stdout(io.StringIO()) as output:
+        for name, func in [
+            ("service.processOrder", lambda: post("/processOrder")),
+            ("service.shipOrder", lambda: post("/shipOrder")),
+            ("service.getOrderHistory", get_history),
+        ]:
+            func()
+            results.append(result(name, measure(func, number, repeat), unit="request"))
+            output.seek(0)
+            output.truncate()
+    return results
+
+
+def run_micro(number, repeat):
+    results = []
+    for bench in (bench_generator, bench_send_event, bench_service):
+        results.extend(bench(number, repeat))
+    return results
+
+
+class Stage:
+    """Records the seconds spent in a `with` block under `name`."""
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stages[self.name] = time.perf_counter() - self.start
+
+
+def order_flow(db, service, generator, rounds):
+    """One pass of the order flow against `db`, returning seconds per stage and counts"""
+    from pymongo import ReplaceOne, UpdateOne
+
+    from capped_collection_tailer import project_cart
+    from stream_projection import latest_replacements
+
+    client = service.app.test_client()
+    events = db["incoming_shopping_cart_events"]
+    carts = db["shoppingcart"]
+    orders = db["orders"]
+    order_history = db["order_history"]
+    stages = {}
+
+    destination = generator.EventDestination.__new__(generator.EventDestination)
+    destination.collection = events
+    with Stage(stages, "ingest"), mock.patch.object(generator.time, "sleep"):
+        for _ in range(rounds):
+            generator.generate_cart_events(destination, "mongodb")
+
+    with Stage(stages, "cart_projection"):
+        carts.bulk_write(latest_replacements(events.find().sort("$natural", 1), project_cart), ordered=False)
+
+    with Stage(stages, "order_creation"):
+        created = [
+            {
+                "_id": cart["order_id"],
+                "cart_id": cart["_id"],
+                "order_id": cart["order_id"],
+                "status": "order_created",
+                "items": cart["items"],
+                "customer_id": cart["customer_id"],
+            }
+            for cart in carts.find({"status": CREATE_ORDER})
+        ]
+        if created:
+            orders.insert_many(created)
+            order_history.bulk_write(
+                [
+                    ReplaceOne(
+                        {"_id": o["_id"]},
+                        {
+                            "customer_id": o["customer_id"],
+                            "create_order_status_event": {"status": o["status"], "cart_id": o["cart_id"]},
+                        },
+                        upsert=True,
+                    )
+                    for o in created
+                ],
+                ordered=False,
+            )
+
+    def call(path, order):
+        response = client.post(path, json={"fullDocument": order})
+        return response.get_json()["message"]
+
+    with Stage(stages, "process_order"):
+        fulfilled = []
+        for order in created:
+            validated = call("/processOrder", order)
+            db[("fulfilled_orders" if validated["status"] == "order_fulfilled" else "invalid_orders")].insert_one(
+                validated
+            )
+            event = "create_fulfilled_order_status_event" if validated["status"] == "order_fulfilled" \
+                else "create_invalid_order_status_event"
+            order_history.update_one(
+                {"_id": validated["_id"]},
+                {"$set": {event: {"status": validated["status"], "cart_id": validated["cart_id"]}}},
+            )
+            if validated["status"] == "order_fulfilled":
+                fulfilled.append(validated)
+
+    with Stage(stages, "ship_order"):
+        updates = []
+        for order in fulfilled:
+            shipped = call("/shipOrder", order)
+            db[("shipped_orders" if shipped["status"] == "order_shipped" else "delayed_orders")].insert_one(shipped)
+            updates.append(
+                UpdateOne(
+                    {"_id": shipped["order_id"]},
+                    {"$set": {"create_shipment_status_event": {"status": shipped["status"]}}},
+                )
+            )
+        if updates:
+            order_history.bulk_write(updates, ordered=False)
+
+    with Stage(stages, "get_order_history"):
+        for order in created:
+            response = client.get(f"/getOrderHistory?orderId={order['_id']}")
+            assert response.status_code == 200, response.status_code
+
+    return stages, {"events": events.count_documents({}), "orders": len(created), "shipped": len(fulfilled)}
+
+
+def run_macro(mongo_uri, rounds, repeat):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    mongo = MongoClient(mongo_uri, serverSelectionTimeoutMS=2000)
+    try:
+        mongo.admin.command("ping")
+    except PyMongoError as e:
+        print(f"Skipping macro-benchmarks, no mongod at {mongo_uri}: {e.__class__.__name__}")
+        return []
+
+    service = import_service()
+    generator = import_generator()
+    runs = []
+    counts = None
+    try:
+        for _ in range(repeat):
+            db = mongo[f"{MACRO_DB_PREFIX}{uuid.uuid4().hex[:8]}"]
+            db.create_collection("incoming_shopping_cart_events", capped=True, size=64 * 1024 * 1024)
+            try:
+                with mock.patch.object(service, "order_history_collection", db["order_history"]), \
+                        mock.patch.object(service, "order_history_view", None), \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    stages, counts = order_flow(db, service, generator, rounds)
+                runs.append(stages)
+            finally:
+                mongo.drop_database(db.name)
+    finally:
+        mongo.close()
+
+    results = []
+    for name in runs[0]:
+        results.append(
+            result(f"order_flow.{name}", [run[name] * 1e6 for run in runs], unit="run", **counts)
+        )
+    total_us = [sum(run.values()) * 1e6 for run in runs]
+    results.append(result("order_flow.total", total_us, unit="run", **counts))
+    results.append(
+        result("order_flow.per_order", [t / max(counts["orders"], 1) for t in total_us], unit="order", **counts)
+    )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """(name, baseline us, current us, change) for every benchmark in both, and whether any regressed"""
+    previous = {r["name"]: r for r in baseline["results"]}
+    rows = []
+    regressed = False
+    for r in results:
+        old = previous.get(r["name"])
+        if not old:
+            continue
+        change = r["median_us"] / old["median_us"] - 1
+        rows.append((r["name"], old["median_us"], r["median_us"], change))
+        regressed = regressed or change > threshold
+    return rows, regressed
+
+
+def print_results(results):
+    width = max(len("benchmark"), *(len(r["name"]) for r in results))
+    print(f"\n{'benchmark':<{width}}{'median us':>14}{'min us':>14}{'ops/s':>12}  per")
+    for r in results:
+        print(
+            f"{r['name']:<{width}}{r['median_us']:>14.1f}{r['min_us']:>14.1f}"
+            f"{r['ops_per_second'] or 0:>12.1f}  {r['unit']}"
+        )
+
+
+def print_comparison(rows, threshold):
+    width = max(len("benchmark"), *(len(name) for name, *_ in rows))
+    print(f"\n{'benchmark':<{width}}{'baseline us':>14}{'current us':>14}{'change':>9}")
+    for name, old, new, change in rows:
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<{width}}{old:>14.1f}{new:>14.1f}{change:>+9.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suite", choices=["micro", "macro", "all"], default="all", help="Benchmarks to run")
+    parser.add_argument("--number", type=int, default=2000, help="Calls per micro-benchmark batch")
+    parser.add_argument("--repeat", type=int, default=5, help="Batches (micro) or runs (macro); the median is reported")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017", help="Local mongod for the macro-benchmarks")
+    parser.add_argument("--rounds", type=int, default=3, help="generate_cart_events rounds per macro run")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="Slowdown against the baseline that fails the run (0.10 = 10%%)"
+    )
+    parser.add_argument("--save-baseline", help="Also write the results to this file, to compare later runs against")
+    args = parser.parse_args()
+
+    results = []
+    if args.suite in ("micro", "all"):
+        results.extend(run_micro(args.number, args.repeat))
+    if args.suite in ("macro", "all"):
+        results.extend(run_macro(args.mongo_uri, args.rounds, args.repeat))
+    if not results:
+        print("No benchmarks ran.")
+        sys.exit(1)
+
+    print_results(results)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(results, baseline, args.threshold)
+        if rows:
+            print_comparison(rows, args.threshold)
+        if regressed:
+            print(f"\nAt least one benchmark is more than {args.threshold:.0%} slower than {args.baseline}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
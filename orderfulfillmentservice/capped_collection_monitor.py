@@ -0,0 +1,212 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from src.config import get_config
+from pymongo import CursorType
+from pymongo.errors import PyMongoError
+
+from capped_collection_tailer import SINK, SOURCE, advance_position, resume_query
+from change_stream_consumer import CheckpointStore
+from create_db_collections import get_mongodb_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Configuration from .env and the environment
+config = get_config()
+
+
+class WriteTracker:
+    """Tails the capped collection to record the timestamp of every event the generator writes.
+
+    Events are only overwritten once they are old, so the tracker remembers what
+    was written even after the capped collection has dropped it, which is what
+    lets the monitor confirm lost events.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.timestamps = []
+        self.total_written = 0
+        self.lock = threading.Lock()
+
+    def run(self, stop_event):
+        # Same position as the tailer's, so events sharing a millisecond aren't skipped
+        position = {"timestamp": None, "ids": []}
+        while not stop_event.is_set():
+            cursor = self.source.find(
+                resume_query(position), {"timestamp": 1}, cursor_type=CursorType.TAILABLE_AWAIT
+            ).max_await_time_ms(500)
+            try:
+                while cursor.alive and not stop_event.is_set():
+                    event = cursor.try_next()
+                    if event is None:
+                        continue
+                    position = advance_position(position, [event])
+                    with self.lock:
+                        self.timestamps.append(event["timestamp"])
+                        self.total_written += 1
+            except PyMongoError as e:
+                # e.g. CappedPositionLost when the cursor fell behind the writes
+                logging.warning(f"Tailing {self.source.full_name} for writes failed ({e}), reopening")
+            finally:
+                cursor.close()
+            time.sleep(0.5)
+
+    def pop_lost(self, consumer_timestamp, oldest_retained):
+        """Forget events that can no longer be consumed, returning how many were never consumed."""
+        with self.lock:
+            evicted = bisect_left(self.timestamps, oldest_retained)
+            consumed = bisect_right(self.timestamps, consumer_timestamp, hi=evicted)
+            del self.timestamps[:evicted]
+            return evicted - consumed
+
+    def forget_before(self, oldest_retained):
+        """Forget events the capped collection has dropped, while no consumer position is known"""
+        with self.lock:
+            del self.timestamps[:bisect_left(self.timestamps, oldest_retained)]
+
+
+def consumer_position(client, checkpoint_name):
+    """Timestamp (ms) of the last event the consumer applied."""
+    if checkpoint_name:
+        checkpoint = CheckpointStore.for_client(client).load(checkpoint_name)
+        return checkpoint["timestamp"] if checkpoint else None
+    latest = client[SINK["db"]][SINK["coll"]].find_one(
+        {}, {"timestamp": 1}, sort=[("timestamp", -1)]
+    )
+    return latest["timestamp"] if latest else None
+
+
+def sample(client, source, tracker, args, previous, previous_time):
+    stats = source.database.command("collStats", source.name)
+    newest = source.find_one({}, {"timestamp": 1}, sort=[("$natural", -1)])
+    oldest = source.find_one({}, {"timestamp": 1}, sort=[("$natural", 1)])
+    consumer_ts = consumer_position(client, args.checkpoint)
+    now = time.monotonic()
+
+    result = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "events_retained": stats.get("count", 0),
+        "max_bytes": stats.get("maxSize"),
+        "total_written": tracker.total_written,
+        "consumer_timestamp": consumer_ts,
+        "lag_events": None,
+        "lag_seconds": None,
+        "utilization": None,
+        "seconds_to_overrun": None,
+        "lost_events": previous.get("lost_events", 0),
+    }
+    if newest is None:
+        return result, now
+    if consumer_ts is None:
+        tracker.forget_before(oldest["timestamp"])
+        return result, now
+
+    avg_bytes = stats.get("avgObjSize") or 0
+    lag_events = source.count_documents({"timestamp": {"$gt": consumer_ts}})
+    result["lag_events"] = lag_events
+    result["lag_seconds"] = max(0, newest["timestamp"] - consumer_ts) / 1000
+    result["utilization"] = lag_events * avg_bytes / stats["maxSize"] if stats.get("maxSize") else None
+    result["lost_events"] += tracker.pop_lost(consumer_ts, oldest["timestamp"])
+
+    # The unconsumed backlog grows by (write rate - consume rate); project when it fills the collection
+    if previous.get("lag_events") is not None and avg_bytes:
+        elapsed = now - previous_time
+        growth = (lag_events - previous["lag_events"]) / elapsed if elapsed > 0 else 0
+        if growth > 0:
+            free_events = stats["maxSize"] / avg_bytes - lag_events
+            result["seconds_to_overrun"] = max(0.0, free_events / growth)
+    return result, now
+
+
+def report(result, previous, args):
+    if result["lag_events"] is None:
+        logging.info("Waiting for events and consumer progress...")
+        return
+    logging.info(
+        f"written={result['total_written']} lag={result['lag_events']} events / "
+        f"{result['lag_seconds']:.1f}s utilization={result['utilization'] or 0:.0%} "
+        f"lost={result['lost_events']}"
+    )
+    if result["utilization"] is not None and result["utilization"] >= args.alert_utilization:
+        logging.warning(
+            f"Unconsumed events fill {result['utilization']:.0%} of the capped collection, "
+            "the consumer is about to lose events"
+        )
+    if result["seconds_to_overrun"] is not None and result["seconds_to_overrun"] <= args.alert_seconds:
+        logging.warning(
+            f"At the current backlog growth the capped collection overruns the consumer in "
+            f"{result['seconds_to_overrun']:.0f}s"
+        )
+    if result["lost_events"] > previous.get("lost_events", 0):
+        logging.error(
+            f"{result['lost_events']} events were overwritten before the consumer applied them"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Monitor consumer lag on the incoming shopping cart events capped collection"
+    )
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between samples")
+    parser.add_argument(
+        "--checkpoint",
+        help="Track a local consumer by its checkpoint name (e.g. capped_collection_tailer) "
+        "instead of the latest shoppingcart timestamp",
+    )
+    parser.add_argument(
+        "--alert-utilization",
+        type=float,
+        default=0.8,
+        help="Warn when unconsumed events fill this fraction of the capped collection",
+    )
+    parser.add_argument(
+        "--alert-seconds",
+        type=float,
+        default=60,
+        help="Warn when the projected time to overrun drops below this many seconds",
+    )
+    parser.add_argument("--json", help="Append every sample to this JSON lines file")
+    parser.add_argument(
+        "--mongo-uri",
+        help="Use this MongoDB URI instead of the Atlas cluster in .env (e.g. a local mongod)",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client(args.mongo_uri)
+    source_db = config.get("SHOPPING_CART_DB_NAME", SOURCE["db"])
+    source_coll = config.get("SHOPPING_CART_COLLECTION_NAME", SOURCE["coll"])
+    source = client[source_db][source_coll]
+
+    tracker = WriteTracker(source)
+    stop = threading.Event()
+    threading.Thread(target=tracker.run, args=(stop,), daemon=True).start()
+
+    logging.info(f"Monitoring {source_db}.{source_coll}")
+    previous, previous_time = {}, time.monotonic()
+    try:
+        while True:
+            time.sleep(args.interval)
+            result, previous_time = sample(client, source, tracker, args, previous, previous_time)
+            report(result, previous, args)
+            if args.json:
+                with open(args.json, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+            previous = result
+    except KeyboardInterrupt:
+        logging.info("Shutting down monitor...")
+    finally:
+        stop.set()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
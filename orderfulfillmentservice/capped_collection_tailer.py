@@ -0,0 +1,171 @@
+import argparse
+import logging
+import time
+
+from src.config import get_config
+from pymongo import CursorType
+
+from change_stream_consumer import CheckpointStore
+from create_db_collections import get_mongodb_client
+from stream_processors_config import stream_processors
+from stream_projection import compile_projection, find_stage, latest_replacements
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Configuration from .env and the environment
+config = get_config()
+
+CONSUMER_NAME = "capped_collection_tailer"
+
+# Same source, mapping and sink as shoppingCartEventsCappedCollectionToShoppingCartStreamProcessor
+CAPPED_PROCESSOR = next(
+    p
+    for p in stream_processors
+    if p["name"] == "shoppingCartEventsCappedCollectionToShoppingCartStreamProcessor"
+)
+SOURCE = find_stage(CAPPED_PROCESSOR, "$source")
+SINK = find_stage(CAPPED_PROCESSOR, "$merge")["into"]
+project_change_event = compile_projection(find_stage(CAPPED_PROCESSOR, "$project"))
+
+
+def project_cart(event_doc):
+    """Project a raw capped collection document the way the processor projects its insert event."""
+    return project_change_event({"fullDocument": event_doc})
+
+
+def resume_query(position):
+    """Query for the events after `position`, a {"timestamp", "ids"} dict.
+
+    Several events can share a millisecond timestamp, so the position keeps the
+    ids already seen at its timestamp and the query excludes those rather than
+    skipping the whole millisecond.
+    """
+    if position["timestamp"] is None:
+        return {}
+    return {"timestamp": {"$gte": position["timestamp"]}, "_id": {"$nin": position["ids"]}}
+
+
+def advance_position(position, events):
+    """The position after `events`, which follow `position` in order"""
+    last_timestamp = events[-1]["timestamp"]
+    ids = list(position["ids"]) if last_timestamp == position["timestamp"] else []
+    ids.extend(e["_id"] for e in events if e["timestamp"] == last_timestamp)
+    return {"timestamp": last_timestamp, "ids": ids}
+
+
+class CappedCollectionTailer:
+    """Applies events from a capped collection to a sink using a tailable await-data cursor.
+
+    The position is the `timestamp` of the last applied event plus the ids applied
+    at that timestamp, since several events can share a millisecond. It is saved
+    once per flushed batch.
+    """
+
+    def __init__(
+        self,
+        source,
+        sink,
+        checkpoints,
+        name=CONSUMER_NAME,
+        batch_size=500,
+        max_await_ms=200,
+        on_flush=None,
+    ):
+        self.source = source
+        self.sink = sink
+        self.checkpoints = checkpoints
+        self.name = name
+        self.batch_size = batch_size
+        self.max_await_ms = max_await_ms
+        self.on_flush = on_flush
+        self.position = {"timestamp": None, "ids": []}
+
+    def load_checkpoint(self):
+        checkpoint = self.checkpoints.load(self.name)
+        if checkpoint:
+            self.position = {"timestamp": checkpoint["timestamp"], "ids": checkpoint["ids"]}
+            logging.info(f"Resuming {self.name} from timestamp {checkpoint['timestamp']}")
+
+    def save_checkpoint(self):
+        self.checkpoints.save(
+            self.name, timestamp=self.position["timestamp"], ids=self.position["ids"]
+        )
+
+    def open_cursor(self):
+        return self.source.find(resume_query(self.position), cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(
+            self.max_await_ms
+        )
+
+    def flush(self, events):
+        self.sink.bulk_write(latest_replacements(events, project_cart), ordered=False)
+
+        self.position = advance_position(self.position, events)
+        self.save_checkpoint()
+        if self.on_flush:
+            self.on_flush(events)
+
+    def run(self, stop_event=None):
+        """Tail the source until `stop_event` is set (or forever)."""
+        while not (stop_event and stop_event.is_set()):
+            cursor = self.open_cursor()
+            pending = []
+            while cursor.alive and not (stop_event and stop_event.is_set()):
+                event = cursor.try_next()
+                if event is not None:
+                    pending.append(event)
+                    if len(pending) < self.batch_size:
+                        continue
+                # Flush when the batch is full or the cursor has caught up
+                if pending:
+                    self.flush(pending)
+                    pending = []
+            if pending:
+                self.flush(pending)
+            cursor.close()
+            # A tailable cursor on an empty collection dies immediately
+            time.sleep(self.max_await_ms / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tail the incoming shopping cart events capped collection into shoppingcart"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Events per bulk write")
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="Ignore the saved position and apply every event still in the capped collection",
+    )
+    parser.add_argument(
+        "--mongo-uri",
+        help="Use this MongoDB URI instead of the Atlas cluster in .env (e.g. a local mongod)",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client(args.mongo_uri)
+    source_db = config.get("SHOPPING_CART_DB_NAME", SOURCE["db"])
+    source_coll = config.get("SHOPPING_CART_COLLECTION_NAME", SOURCE["coll"])
+    tailer = CappedCollectionTailer(
+        client[source_db][source_coll],
+        client[SINK["db"]][SINK["coll"]],
+        CheckpointStore.for_client(client),
+        batch_size=args.batch_size,
+        on_flush=lambda events: logging.info(f"Applied {len(events)} cart events"),
+    )
+    if not args.from_start:
+        tailer.load_checkpoint()
+
+    logging.info(f"Tailing {source_db}.{source_coll} into {SINK['db']}.{SINK['coll']}")
+    try:
+        tailer.run()
+    except KeyboardInterrupt:
+        logging.info("Shutting down tailer...")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
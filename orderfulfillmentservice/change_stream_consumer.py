@@ -0,0 +1,141 @@
+"""Resumable change stream consumers for local services of the order flow.
+
+A consumer hands batches of change events to a handler and persists the change
+stream resume token to a checkpoint collection every N events or T seconds,
+whichever comes first. On startup it resumes after the last checkpoint.
+
+The token is saved only after the handler has returned, so delivery is
+at-least-once: events handled after the last checkpoint are delivered again
+after a restart, and handlers must write to their sinks idempotently (upserts
+keyed by _id, `$set` rather than `$inc`, ...).
+"""
+import logging
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure
+
+CHECKPOINT_DB = "checkpointdb"
+CHECKPOINT_COLLECTION = "consumer_checkpoints"
+
+# Server error code when a resume token is older than the oplog window
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class CheckpointStore:
+    """Stores one position document per named consumer."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @classmethod
+    def for_client(cls, client):
+        return cls(client[CHECKPOINT_DB][CHECKPOINT_COLLECTION])
+
+    def load(self, name):
+        return self.collection.find_one({"_id": name})
+
+    def save(self, name, **position):
+        self.collection.replace_one(
+            {"_id": name},
+            {"_id": name, **position, "updated_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+
+class ChangeStreamConsumer:
+    """Consumes a change stream in batches, checkpointing its resume token.
+
+    `handler` is called with a list of change events. A checkpoint is written
+    once `checkpoint_every` events have been handled since the last one, or
+    once `checkpoint_interval` seconds have passed, so checkpoint writes add a
+    small fraction of the handler's write load.
+    """
+
+    def __init__(
+        self,
+        watchable,
+        name,
+        handler,
+        checkpoints,
+        pipeline=None,
+        full_document=None,
+        batch_size=100,
+        checkpoint_every=500,
+        checkpoint_interval=5.0,
+        max_await_ms=500,
+    ):
+        self.watchable = watchable
+        self.name = name
+        self.handler = handler
+        self.checkpoints = checkpoints
+        self.pipeline = pipeline or []
+        self.full_document = full_document
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.max_await_ms = max_await_ms
+        self.resume_token = None
+        self.saved_token = None
+        self.handled_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+
+    def load_checkpoint(self):
+        checkpoint = self.checkpoints.load(self.name)
+        if checkpoint:
+            self.resume_token = self.saved_token = checkpoint["resume_token"]
+            logging.info(f"Resuming {self.name} from checkpoint saved at {checkpoint['updated_at']}")
+
+    def checkpoint(self, force=False):
+        if self.resume_token is None or self.resume_token == self.saved_token:
+            return
+        due = (
+            self.handled_since_checkpoint >= self.checkpoint_every
+            or time.monotonic() - self.last_checkpoint >= self.checkpoint_interval
+        )
+        if force or due:
+            self.checkpoints.save(self.name, resume_token=self.resume_token)
+            self.saved_token = self.resume_token
+            self.handled_since_checkpoint = 0
+            self.last_checkpoint = time.monotonic()
+
+    def handle(self, batch, stream):
+        self.handler(batch)
+        self.handled_since_checkpoint += len(batch)
+        # Everything the stream has returned so far is handled, so its current
+        # token (the last event's, or the post batch token when idle) is safe to save
+        self.resume_token = stream.resume_token
+
+    def run(self, stop_event=None):
+        """Consume until `stop_event` is set (or forever), then save a final checkpoint."""
+        try:
+            with self.watchable.watch(
+                self.pipeline,
+                full_document=self.full_document,
+                resume_after=self.resume_token,
+                max_await_time_ms=self.max_await_ms,
+            ) as stream:
+                batch = []
+                try:
+                    while not (stop_event and stop_event.is_set()):
+                        change = stream.try_next()
+                        if change is not None:
+                            batch.append(change)
+                            if len(batch) < self.batch_size:
+                                continue
+                        if batch:
+                            self.handle(batch, stream)
+                            batch = []
+                        elif stream.resume_token is not None:
+                            self.resume_token = stream.resume_token
+                        self.checkpoint()
+                finally:
+                    # Only checkpoint events the handler has completed
+                    self.checkpoint(force=True)
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                raise RuntimeError(
+                    f"The checkpoint of {self.name} is older than the oplog window, "
+                    "delete it to restart the consumer from the current time"
+                ) from e
+            raise
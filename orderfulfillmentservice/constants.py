@@ -2,3 +2,13 @@ CREATE_ORDER = "create_order"
 CREATE_SHOPPING_CART = "create_shopping_cart"
 UPDATE_SHOPPING_CART = "update_shopping_cart"
 STATUS = "status"
+
+# Status event fields written to order_history by the order tracking stream
+# processors, from the earliest to the latest stage of an order
+STATUS_EVENT_FIELDS = [
+    "create_order_status_event",
+    "create_fulfilled_order_status_event",
+    "create_invalid_order_status_event",
+    "create_shipped_order_status_event",
+    "create_delayed_shipped_order_status_event",
+]
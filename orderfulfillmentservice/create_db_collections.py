@@ -1,15 +1,17 @@
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
+from pymongo import MongoClient, IndexModel
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import bson
+from src.config import get_config
 import pprint
 from urllib.parse import quote_plus
 
-load_dotenv()
+config = get_config()
 
 # MongoDB connection setup
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_PASS = os.getenv("MONGO_PASS")
+MONGO_URL = config.get("MONGO_URL")
+MONGO_USER = config.get("MONGO_USER")
+MONGO_PASS = config.get("MONGO_PASS")
 
 # Define the collections that need change streams enabled
 collections_config = [
@@ -19,6 +21,7 @@ collections_config = [
     {"db": "orderdb", "collection": "invalid_orders"},
     {"db": "shipmentdb", "collection": "delayed_orders"},
     {"db": "shipmentdb", "collection": "shipped_orders"},
+    {"db": "metricsdb", "collection": "order_metrics"},
     {
         "db": "shoppingcartdb",
         "collection": "incoming_shopping_cart_events",
@@ -27,9 +30,37 @@ collections_config = [
     },
 ]
 
+# Secondary indexes for the read endpoints, local consumers and analytics.
+# Applied idempotently by name, anything else found on these collections is reported as drift.
+index_plan = [
+    {"db": "orderhistorydb", "collection": "order_history", "keys": [("customer_id", 1)]},
+    {"db": "shoppingcartdb", "collection": "shoppingcart", "keys": [("customer_id", 1)]},
+    {"db": "shoppingcartdb", "collection": "shoppingcart", "keys": [("status", 1)]},
+    # Latest applied event, used by the capped collection monitor
+    {"db": "shoppingcartdb", "collection": "shoppingcart", "keys": [("timestamp", -1)]},
+    # Resume position of the tailable cursor consumer and lag counts of the monitor
+    {"db": "shoppingcartdb", "collection": "incoming_shopping_cart_events", "keys": [("timestamp", 1)]},
+    {"db": "orderdb", "collection": "orders", "keys": [("cart_id", 1)]},
+    {"db": "orderdb", "collection": "orders", "keys": [("status", 1)]},
+    # Shipments are looked up by order when replaying dead letters
+    {"db": "shipmentdb", "collection": "shipped_orders", "keys": [("order_id", 1)]},
+    {"db": "shipmentdb", "collection": "delayed_orders", "keys": [("order_id", 1)]},
+    {"db": "metricsdb", "collection": "order_metrics", "keys": [("metric", 1), ("window_start", -1)]},
+]
+
+# Index entry overhead on top of the key itself, used to estimate sizes of missing indexes
+INDEX_ENTRY_OVERHEAD_BYTES = 16
+
+# Used to size capped collections when the average event size is not known yet
+DEFAULT_AVG_EVENT_BYTES = 400
+# Extra room so bursts above the target rate don't overrun the consumer
+CAPPED_SIZE_HEADROOM = 1.5
+
 
-def get_mongodb_client():
-    """Create and return a MongoDB client"""
+def get_mongodb_client(uri=None):
+    """Create and return a MongoDB client for `uri` (e.g. a local mongod), by default the Atlas cluster in .env"""
+    if uri:
+        return MongoClient(uri, serverSelectionTimeoutMS=5000)
     encoded_user = quote_plus(MONGO_USER)
     encoded_pass = quote_plus(MONGO_PASS)
 
@@ -38,6 +69,43 @@ def get_mongodb_client():
     return MongoClient(auth_mongo_url, serverSelectionTimeoutMS=5000)
 
 
+def capped_collection_size(events_per_second, retention_seconds, avg_event_bytes):
+    """Size in bytes for a capped collection to retain `retention_seconds` of events at the given rate"""
+    size = int(events_per_second * retention_seconds * avg_event_bytes * CAPPED_SIZE_HEADROOM)
+    # MongoDB rounds capped sizes up to a multiple of 256 bytes, with a 4096 byte minimum
+    return max(4096, -(-size // 256) * 256)
+
+
+def average_event_size(client, db_name, collection_name):
+    """Average document size of an existing collection, or the default if it is empty or missing"""
+    try:
+        stats = client[db_name].command("collStats", collection_name)
+        return stats.get("avgObjSize") or DEFAULT_AVG_EVENT_BYTES
+    except Exception:
+        return DEFAULT_AVG_EVENT_BYTES
+
+
+def resize_capped_collection(client, db_name, collection_name, size):
+    """Resize an existing capped collection if its maximum size differs from `size`"""
+    try:
+        db = client[db_name]
+        stats = db.command("collStats", collection_name)
+        if not stats.get("capped"):
+            print(f"{db_name}.{collection_name} is not capped, not resizing")
+            return False
+        if stats.get("maxSize") == size:
+            return True
+        print(
+            f"Resizing capped collection {db_name}.{collection_name} from {stats.get('maxSize')} to {size} bytes"
+        )
+        db.command("collMod", collection_name, cappedSize=size)
+        return True
+
+    except Exception as e:
+        print(f"Error resizing capped collection {db_name}.{collection_name}: {str(e)}")
+        return False
+
+
 def create_database_and_collection(
     client, db_name, collection_name, is_capped_coll, size
 ):
@@ -86,7 +154,164 @@ def enable_change_streams_for_collection(client, db_name, collection_name):
         return False
 
 
+def configure_collection(client, config):
+    """Create a collection from collections_config and enable change streams on it"""
+    db_name, collection_name = config["db"], config["collection"]
+    if not create_database_and_collection(
+        client, db_name, collection_name, config.get("capped", False), config.get("size", 0)
+    ):
+        return False
+    return enable_change_streams_for_collection(client, db_name, collection_name)
+
+
+def index_name(keys):
+    """Default MongoDB name for an index on `keys`"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def index_plan_by_collection():
+    plan = {}
+    for spec in index_plan:
+        plan.setdefault((spec["db"], spec["collection"]), []).append(spec)
+    return plan
+
+
+def index_drift(client, db_name, collection_name, specs):
+    """Compare a collection's indexes with the plan, returning (missing, extra, changed) names"""
+    existing = {
+        index["name"]: list(index["key"].items())
+        for index in client[db_name][collection_name].list_indexes()
+    }
+    planned = {index_name(spec["keys"]): spec["keys"] for spec in specs}
+    missing = [name for name in planned if name not in existing]
+    extra = [name for name in existing if name not in planned and name != "_id_"]
+    changed = [
+        name
+        for name, keys in planned.items()
+        if name in existing and [(f, int(d)) for f, d in existing[name]] != list(keys)
+    ]
+    return missing, extra, changed
+
+
+def estimate_index_size(client, db_name, collection_name, keys, sample_size=100):
+    """Estimate the size of an index from the key sizes of a sample of documents"""
+    collection = client[db_name][collection_name]
+    count = collection.estimated_document_count()
+    if not count:
+        return 0
+    fields = [field for field, _ in keys]
+    sample = list(
+        collection.aggregate(
+            [{"$sample": {"size": sample_size}}, {"$project": {f: 1 for f in fields}}]
+        )
+    )
+    if not sample:
+        return 0
+    key_bytes = sum(
+        len(bson.encode({f: doc.get(f) for f in fields})) for doc in sample
+    ) / len(sample)
+    return int(count * (key_bytes + INDEX_ENTRY_OVERHEAD_BYTES))
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def apply_indexes_for_collection(client, db_name, collection_name, specs, check_only, drop_extra):
+    """Create the planned indexes of one collection in a single createIndexes command"""
+    lines = [f"\nIndexes on {db_name}.{collection_name}"]
+    try:
+        collection = client[db_name][collection_name]
+        missing, extra, changed = index_drift(client, db_name, collection_name, specs)
+        for name in changed:
+            lines.append(f"  {name}: keys differ from the plan, drop it to rebuild")
+        for name in extra:
+            lines.append(f"  {name}: not in the index plan")
+
+        if check_only:
+            for spec in specs:
+                name = index_name(spec["keys"])
+                if name in missing:
+                    size = estimate_index_size(client, db_name, collection_name, spec["keys"])
+                    lines.append(f"  {name}: missing (estimated size {format_bytes(size)})")
+            return lines, not (missing or extra or changed)
+
+        if missing:
+            collection.create_indexes(
+                [
+                    IndexModel(spec["keys"], name=index_name(spec["keys"]))
+                    for spec in specs
+                    if index_name(spec["keys"]) in missing
+                ]
+            )
+            lines.append(f"  Created {', '.join(missing)}")
+        if drop_extra:
+            for name in extra:
+                collection.drop_index(name)
+                lines.append(f"  Dropped {name}")
+
+        index_sizes = client[db_name].command("collStats", collection_name).get("indexSizes", {})
+        for name, size in index_sizes.items():
+            lines.append(f"  {name}: {format_bytes(size)}")
+        return lines, True
+
+    except Exception as e:
+        lines.append(f"  Error applying indexes: {str(e)}")
+        return lines, False
+
+
+def apply_index_plan(client, check_only=False, drop_extra=False):
+    """Apply the index plan to all collections in parallel, returning True if nothing failed or drifted"""
+    plan = index_plan_by_collection()
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        results = list(
+            pool.map(
+                lambda item: apply_indexes_for_collection(
+                    client, item[0][0], item[0][1], item[1], check_only, drop_extra
+                ),
+                plan.items(),
+            )
+        )
+    # Print per collection once all builds finished so output isn't interleaved
+    for lines, _ in results:
+        print("\n".join(lines))
+    return all(ok for _, ok in results)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Create databases and collections")
+    parser.add_argument(
+        "--events-per-second",
+        type=float,
+        help="Expected peak event rate, used with --retention-seconds to size capped collections",
+    )
+    parser.add_argument(
+        "--retention-seconds",
+        type=float,
+        help="How many seconds of events capped collections must retain before overwriting",
+    )
+    parser.add_argument(
+        "--avg-event-bytes",
+        type=int,
+        help="Average event size in bytes (defaults to the existing collection's average)",
+    )
+    parser.add_argument(
+        "--check-indexes",
+        action="store_true",
+        help="Only report index drift and estimated sizes of missing indexes, change nothing",
+    )
+    parser.add_argument(
+        "--drop-extra-indexes",
+        action="store_true",
+        help="Drop indexes on planned collections that are not in the index plan",
+    )
+    args = parser.parse_args()
+    if (args.events_per_second is None) != (args.retention_seconds is None):
+        parser.error("--events-per-second and --retention-seconds must be used together")
+
     client = get_mongodb_client()
 
     try:
@@ -94,6 +319,27 @@ def main():
         client.admin.command("ping")
         print("Successfully connected to MongoDB")
 
+        if args.check_indexes:
+            if apply_index_plan(client, check_only=True):
+                print("\nIndexes match the index plan")
+            return
+
+        # Size capped collections from the target rate and retention time
+        if args.events_per_second is not None:
+            for config in collections_config:
+                if not config.get("capped"):
+                    continue
+                avg_event_bytes = args.avg_event_bytes or average_event_size(
+                    client, config["db"], config["collection"]
+                )
+                config["size"] = capped_collection_size(
+                    args.events_per_second, args.retention_seconds, avg_event_bytes
+                )
+                print(
+                    f"Sizing {config['db']}.{config['collection']} at {config['size']} bytes "
+                    f"({args.events_per_second:g} events/s x {args.retention_seconds:g}s x {avg_event_bytes} bytes)"
+                )
+
         # Create all databases and collections
         for config in collections_config:
             is_capped_coll = config.get("capped", False)
@@ -109,6 +355,10 @@ def main():
                     f"Failed to create {config['db']}.{config['collection']}. Exiting."
                 )
                 return
+            if is_capped_coll and args.events_per_second is not None:
+                resize_capped_collection(
+                    client, config["db"], config["collection"], config["size"]
+                )
 
         # Enable change streams
         success_count = 0
@@ -124,6 +374,10 @@ def main():
             f"\nSummary: Successfully configured {success_count} out of {total_collections} collections"
         )
 
+        # Build secondary indexes
+        if not apply_index_plan(client, drop_extra=args.drop_extra_indexes):
+            print("\nSome indexes could not be applied")
+
     except Exception as e:
         print(f"Error connecting to MongoDB: {str(e)}")
 
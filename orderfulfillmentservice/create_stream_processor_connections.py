@@ -1,29 +1,21 @@
 import pprint
 import sys
-from requests.auth import HTTPDigestAuth
-import requests
-import os
 
-from dotenv import load_dotenv
+from src.config import get_config
 
-load_dotenv()  # Load environment variables from .env file
+from src.atlas_client import get_client, log_calls
 
-PUBLIC_KEY = os.environ["ATLAS_API_PUBLIC_KEY"]
-PRIVATE_KEY = os.environ["ATLAS_API_PRIVATE_KEY"]
-PROJECT_ID = os.environ["ATLAS_PROJECT_ID"]
-STREAM_INSTANCE_NAME = os.environ["STREAM_PROCESSOR_INSTANCE_NAME"]
-ORDER_SERVICE_URL = os.environ["ORDER_SERVICE_URL"]
-KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
-KAFKA_USERNAME = os.getenv("KAFKA_USERNAME", "admin")
-KAFKA_PASSWORD = os.getenv("KAFKA_PASSWORD", "admin")
-ATLAS_CLUSTER_NAME = os.environ["ATLAS_CLUSTER_NAME"]
+config = get_config()
 
-API_URL = f"https://cloud.mongodb.com/api/atlas/v2/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/connections"
+PROJECT_ID = config["ATLAS_PROJECT_ID"]
+STREAM_INSTANCE_NAME = config["STREAM_PROCESSOR_INSTANCE_NAME"]
+ORDER_SERVICE_URL = config["ORDER_SERVICE_URL"]
+KAFKA_BOOTSTRAP_SERVERS = config.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_USERNAME = config.get("KAFKA_USERNAME", "admin")
+KAFKA_PASSWORD = config.get("KAFKA_PASSWORD", "admin")
+ATLAS_CLUSTER_NAME = config["ATLAS_CLUSTER_NAME"]
 
-headers = {
-    "Accept": "application/vnd.atlas.2024-05-30+json",
-    "Content-Type": "application/json",
-}
+API_PATH = f"/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/connections"
 
 send_headers = {
     "Content-Type": "application/json",
@@ -59,20 +51,25 @@ connections = [
     },
 ]
 
-# Create each connection and print the response
-for connection in connections:
+
+def create_connection(connection):
+    """Create a stream processor connection, returning True if it exists afterwards"""
     print(f"\nCreating connection: {connection['name']}")
-    response = requests.post(
-        API_URL,
-        auth=HTTPDigestAuth(PUBLIC_KEY, PRIVATE_KEY),
-        headers=headers,
-        json=connection,
-    )
+    response = get_client().post(API_PATH, json=connection)
     if not (200 <= response.status_code < 300):
         if response.status_code == 409 and response.json().get('errorCode') == 'STREAM_CONNECTION_NAME_ALREADY_EXISTS':
             print(f"Connection {connection['name']} already exists, skipping...")
-            continue
+            return True
         print(f"Error creating connection {connection['name']}:")
         pprint.pprint(response.json())
-        sys.exit(1)
+        return False
     pprint.pprint(response.json())
+    return True
+
+
+if __name__ == "__main__":
+    log_calls()
+    # Create each connection and print the response
+    for connection in connections:
+        if not create_connection(connection):
+            sys.exit(1)
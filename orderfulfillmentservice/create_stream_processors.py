@@ -1,39 +1,35 @@
 import pprint
-from requests.auth import HTTPDigestAuth
-import requests
-import os
 import sys
 from constants import *
-from dotenv import load_dotenv
+from src.config import get_config
+from src.atlas_client import get_client, log_calls
 from stream_processors_config import stream_processors, kafka_stream_processor
 
-load_dotenv()  # Load environment variables from .env file
+config = get_config()
 
-PUBLIC_KEY = os.environ["ATLAS_API_PUBLIC_KEY"]
-PRIVATE_KEY = os.environ["ATLAS_API_PRIVATE_KEY"]
-PROJECT_ID = os.environ["ATLAS_PROJECT_ID"]
-STREAM_INSTANCE_NAME = os.environ["STREAM_PROCESSOR_INSTANCE_NAME"]
-API_URL = f"https://cloud.mongodb.com/api/atlas/v2/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/processor"
+PROJECT_ID = config["ATLAS_PROJECT_ID"]
+STREAM_INSTANCE_NAME = config["STREAM_PROCESSOR_INSTANCE_NAME"]
+API_PATH = f"/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/processor"
 
-headers = {
-    "Accept": "application/vnd.atlas.2024-05-30+json",
-    "Content-Type": "application/json",
-}
 
-# Create each stream processor and print the response
-for processor in stream_processors + [kafka_stream_processor]:
+def create_processor(processor):
+    """Create a stream processor, returning True if it exists afterwards"""
     print(f"\nCreating stream processor: {processor['name']}")
-    response = requests.post(
-        API_URL,
-        auth=HTTPDigestAuth(PUBLIC_KEY, PRIVATE_KEY),
-        headers=headers,
-        json=processor,
-    )
+    response = get_client().post(API_PATH, json=processor)
     if not (200 <= response.status_code < 300):
         if response.status_code == 409 and response.json().get('errorCode') == 'STREAM_PROCESSOR_ALREADY_EXISTS':
             print(f"Stream processor {processor['name']} already exists, skipping...")
-            continue
+            return True
         print(f"Error creating stream processor {processor['name']}:")
         pprint.pprint(response.json())
-        sys.exit(1)
+        return False
     pprint.pprint(response.json())
+    return True
+
+
+if __name__ == "__main__":
+    log_calls()
+    # Create each stream processor and print the response
+    for processor in stream_processors + [kafka_stream_processor]:
+        if not create_processor(processor):
+            sys.exit(1)
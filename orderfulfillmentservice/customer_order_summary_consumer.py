@@ -0,0 +1,174 @@
+import argparse
+import logging
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+from change_stream_consumer import ChangeStreamConsumer, CheckpointStore
+from constants import STATUS_EVENT_FIELDS
+from create_db_collections import get_mongodb_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+ORDER_HISTORY_DB = "orderhistorydb"
+ORDER_HISTORY_COLLECTION = "order_history"
+SUMMARY_COLLECTION = "customer_order_summaries"
+# What has been added to a summary, per order: whether it was counted as an
+# order and its items, and the state it is counted under
+MARKER_COLLECTION = "customer_order_summary_markers"
+CONSUMER_NAME = "customer_order_summary_consumer"
+
+ITEMS_KEY = "items"
+CREATED_KEY = "order_created"
+
+
+def summary_keys(doc):
+    """The one-off contributions an order_history document makes to its customer's summary."""
+    keys = set()
+    if "create_order_status_event" in doc:
+        keys.add(CREATED_KEY)
+    if doc.get("items"):
+        keys.add(ITEMS_KEY)
+    return keys
+
+
+def current_state(doc):
+    """The status of the furthest step the order has reached.
+
+    Taken from the flow's order rather than arrival order, since the processors
+    that write these events run in parallel and their merges can land in any order.
+    """
+    state = None
+    for field in STATUS_EVENT_FIELDS:
+        if field in doc:
+            state = doc[field]["status"]
+    return state
+
+
+def change_time(change):
+    if change.get("wallTime"):
+        return change["wallTime"]
+    return change["clusterTime"].as_datetime()
+
+
+class CustomerOrderSummarizer:
+    """Incrementally maintains one summary document per customer from order_history changes.
+
+    `counts` holds how many of the customer's orders are currently in each
+    state: when an order moves on, it is taken off its previous state's count.
+    The order count and item count of an order are added exactly once. What has
+    been applied is recorded per order in a marker collection, updated in the
+    same transaction as the summaries, so batches replayed after a restart are
+    no-ops.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        db = client[ORDER_HISTORY_DB]
+        self.summaries = db[SUMMARY_COLLECTION]
+        self.markers = db[MARKER_COLLECTION]
+
+    def handle(self, changes):
+        # Full documents are looked up at read time, so the last change per order has everything
+        latest = {}
+        for change in changes:
+            doc = change.get("fullDocument")
+            if doc is not None and doc.get("customer_id") is not None:
+                latest[doc["_id"]] = (doc, change_time(change))
+        if not latest:
+            return
+        with self.client.start_session() as session:
+            session.with_transaction(lambda s: self.apply(latest, s))
+
+    def apply(self, latest, session):
+        markers = {
+            m["_id"]: m for m in self.markers.find({"_id": {"$in": list(latest)}}, session=session)
+        }
+        increments = defaultdict(lambda: defaultdict(int))
+        last_order_times = {}
+        marker_ops = []
+
+        for order_id, (doc, changed_at) in latest.items():
+            marker = markers.get(order_id, {})
+            new_keys = summary_keys(doc) - set(marker.get("applied", []))
+            state = current_state(doc)
+            previous_state = marker.get("state")
+            if not new_keys and state == previous_state:
+                continue
+            customer_id = doc["customer_id"]
+            for key in new_keys:
+                if key == ITEMS_KEY:
+                    increments[customer_id]["lifetime_item_count"] += len(doc["items"])
+                    continue
+                increments[customer_id]["order_count"] += 1
+                previous = last_order_times.get(customer_id)
+                last_order_times[customer_id] = (
+                    max(changed_at, previous) if previous else changed_at
+                )
+            if state != previous_state:
+                if previous_state is not None:
+                    increments[customer_id][f"counts.{previous_state}"] -= 1
+                increments[customer_id][f"counts.{state}"] += 1
+            marker_ops.append(
+                UpdateOne(
+                    {"_id": order_id},
+                    {
+                        "$addToSet": {"applied": {"$each": sorted(new_keys)}},
+                        "$set": {"customer_id": customer_id, "state": state},
+                    },
+                    upsert=True,
+                )
+            )
+
+        if not marker_ops:
+            return
+        summary_ops = []
+        for customer_id, inc in increments.items():
+            update = {"$inc": dict(inc)}
+            if customer_id in last_order_times:
+                update["$max"] = {"last_order_time": last_order_times[customer_id]}
+            summary_ops.append(UpdateOne({"_id": customer_id}, update, upsert=True))
+        self.markers.bulk_write(marker_ops, ordered=False, session=session)
+        self.summaries.bulk_write(summary_ops, ordered=False, session=session)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintain per-customer order summaries from order_history changes"
+    )
+    parser.add_argument("--batch-size", type=int, default=200, help="Changes per transaction")
+    parser.add_argument(
+        "--mongo-uri",
+        help="Use this MongoDB URI instead of the Atlas cluster in .env (e.g. a local replica set)",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client(args.mongo_uri)
+    summarizer = CustomerOrderSummarizer(client)
+    consumer = ChangeStreamConsumer(
+        client[ORDER_HISTORY_DB][ORDER_HISTORY_COLLECTION],
+        CONSUMER_NAME,
+        summarizer.handle,
+        CheckpointStore.for_client(client),
+        pipeline=[{"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}}],
+        full_document="updateLookup",
+        batch_size=args.batch_size,
+    )
+    consumer.load_checkpoint()
+
+    logging.info(
+        f"Summarizing {ORDER_HISTORY_DB}.{ORDER_HISTORY_COLLECTION} into {ORDER_HISTORY_DB}.{SUMMARY_COLLECTION}"
+    )
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        logging.info("Shutting down customer order summary consumer...")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Reconcile the deployed stream processors with stream_processors_config.py.
+
+Each processor's pipeline and options are hashed as canonical JSON, on both the
+config and the deployed side. Only processors whose hash differs are stopped,
+modified and restarted (if they were running); missing processors are created
+and everything else is left alone. Processors are reconciled in parallel.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from src.atlas_client import get_client, log_calls
+from src.config import get_config
+from stream_processors_config import kafka_stream_processor, stream_processors
+
+config = get_config()
+
+PROJECT_ID = config["ATLAS_PROJECT_ID"]
+STREAM_INSTANCE_NAME = config["STREAM_PROCESSOR_INSTANCE_NAME"]
+API_PATH = f"/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}"
+
+RUNNING_STATE = "STARTED"
+
+
+def content_hash(processor):
+    """Hash of the parts of a processor a deployment can change"""
+    spec = {"pipeline": processor.get("pipeline") or [], "options": processor.get("options") or {}}
+    canonical = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+
+def error_detail(response):
+    try:
+        body = response.json()
+        return body.get("detail") or body
+    except ValueError:
+        return response.text
+
+
+def list_deployed(client, page_size=100):
+    """Deployed processors by name"""
+    deployed = {}
+    page = 1
+    while True:
+        response = client.get(
+            f"{API_PATH}/processors", params={"itemsPerPage": page_size, "pageNum": page}
+        )
+        response.raise_for_status()
+        body = response.json()
+        results = body.get("results", [])
+        for processor in results:
+            deployed[processor["name"]] = processor
+        if not results or len(deployed) >= body.get("totalCount", 0):
+            return deployed
+        page += 1
+
+
+def plan(desired, deployed):
+    """(action, processor, deployed processor) for every processor in the config"""
+    actions = []
+    for processor in desired:
+        current = deployed.get(processor["name"])
+        if current is None:
+            actions.append(("create", processor, None))
+        elif content_hash(current) != content_hash(processor):
+            actions.append(("update", processor, current))
+        else:
+            actions.append(("unchanged", processor, current))
+    return actions
+
+
+def print_plan(actions, deployed):
+    width = max(len(p["name"]) for _, p, _ in actions)
+    print(f"\n{'processor':<{width}}  {'action':<10}{'state':<10}{'deployed':<14}config")
+    for action, processor, current in actions:
+        state = current.get("state", "") if current else "-"
+        deployed_hash = content_hash(current) if current else "-"
+        print(
+            f"{processor['name']:<{width}}  {action:<10}{state:<10}"
+            f"{deployed_hash:<14}{content_hash(processor)}"
+        )
+    managed = {p["name"] for _, p, _ in actions}
+    for name in sorted(set(deployed) - managed):
+        print(f"{name:<{width}}  {'unmanaged':<10}{deployed[name].get('state', ''):<10}")
+
+
+def change_state(client, name, verb):
+    response = client.post(f"{API_PATH}/processor/{name}:{verb}")
+    if not (200 <= response.status_code < 300):
+        print(f"Error running {verb} on stream processor {name}: {error_detail(response)}")
+        return False
+    return True
+
+
+def update_processor(client, processor, current):
+    """Stop, modify and restart a processor whose pipeline or options changed"""
+    name = processor["name"]
+    was_running = current.get("state") == RUNNING_STATE
+    if was_running and not change_state(client, name, "stop"):
+        return False
+    response = client.patch(
+        f"{API_PATH}/processor/{name}",
+        json={"name": name, "pipeline": processor["pipeline"], "options": processor.get("options", {})},
+    )
+    if not (200 <= response.status_code < 300):
+        print(f"Error modifying stream processor {name}: {error_detail(response)}")
+        if was_running:
+            # Don't leave the old version stopped
+            change_state(client, name, "start")
+        return False
+    if was_running and not change_state(client, name, "start"):
+        return False
+    print(f"Updated stream processor {name}" + (" and restarted it" if was_running else ""))
+    return True
+
+
+def create_processor(client, processor, start):
+    name = processor["name"]
+    response = client.post(f"{API_PATH}/processor", json=processor)
+    if not (200 <= response.status_code < 300):
+        print(f"Error creating stream processor {name}: {error_detail(response)}")
+        return False
+    if start and not change_state(client, name, "start"):
+        return False
+    print(f"Created stream processor {name}" + (" and started it" if start else ""))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Deploy changed stream processors from stream_processors_config.py"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only show which processors would change"
+    )
+    parser.add_argument(
+        "--processor",
+        action="append",
+        help="Only reconcile this processor (can be given more than once)",
+    )
+    parser.add_argument(
+        "--start-new", action="store_true", help="Start processors that are created"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Processors reconciled at the same time"
+    )
+    args = parser.parse_args()
+    log_calls()
+
+    desired = stream_processors + [kafka_stream_processor]
+    if args.processor:
+        unknown = set(args.processor) - {p["name"] for p in desired}
+        if unknown:
+            print(f"Unknown stream processors: {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        desired = [p for p in desired if p["name"] in args.processor]
+
+    client = get_client()
+    deployed = list_deployed(client)
+    actions = plan(desired, deployed)
+    print_plan(actions, deployed)
+
+    changes = [(action, p, current) for action, p, current in actions if action != "unchanged"]
+    if not changes:
+        print("\nAll stream processors are up to date.")
+        return
+    if args.dry_run:
+        print(f"\n{len(changes)} stream processor(s) would change (dry run).")
+        return
+
+    def apply(change):
+        action, processor, current = change
+        if action == "create":
+            return create_processor(client, processor, args.start_new)
+        return update_processor(client, processor, current)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(apply, changes))
+    failed = results.count(False)
+    print(f"\n{len(changes) - failed} of {len(changes)} stream processor change(s) deployed.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,26 @@ import sys
 import argparse
 from pathlib import Path
 
-from src.commands import CommandRegistry, run_command
+from src.commands import CommandRegistry, run_command, run_script
 from src.env_setup import setup_environment, prompt_for_env_vars
-from src.ngrok_utils import setup_ngrok, start_ngrok
 from src.menu import print_menu, print_simulation_info
 
 NGROK_COMMANDS = ["setup-ngrok", "start-ngrok"]
 
+# The ngrok commands import src.ngrok_utils (and with it requests) only when run
+def setup_ngrok(env_vars, debug=False):
+    """Configure ngrok for local development."""
+    from src import ngrok_utils
+    ngrok_utils.setup_ngrok(env_vars, debug=debug)
+
+def start_ngrok(env_vars=None, debug=False):
+    """Start ngrok tunnels."""
+    from src import ngrok_utils
+    ngrok_utils.start_ngrok(env_vars, debug=debug)
+
 def start_order_service(env_vars=None):
     """Start the local order processing service."""
-    run_command([sys.executable, "order_processing_service.py"])
+    run_script("order_processing_service.py")
 
 def simulate_shopping(env_vars, use_kafka=False):
     """Simulate customers adding items to carts and checking out."""
@@ -27,21 +37,68 @@ def simulate_shopping(env_vars, use_kafka=False):
         destination = "mongodb"
     
     print_simulation_info()
-    run_command([sys.executable, "shopping_cart_event_generator.py", "--destination", destination])
+    run_script("shopping_cart_event_generator.py", ["--destination", destination])
+
+def consume_kafka(env_vars=None, extra_args=None):
+    """Consume shopping cart events from Kafka into MongoDB with a local consumer group."""
+    run_script("shopping_cart_kafka_consumer.py", extra_args, in_process=False)
+
+def tail_capped_collection(env_vars=None, extra_args=None):
+    """Apply capped collection cart events to shoppingcart with a tailable cursor."""
+    run_script("capped_collection_tailer.py", extra_args)
+
+def monitor_capped_collection(env_vars=None, extra_args=None):
+    """Monitor consumer lag and overruns on the capped cart events collection."""
+    run_script("capped_collection_monitor.py", extra_args)
+
+def summarize_customer_orders(env_vars=None, extra_args=None):
+    """Maintain per-customer order summaries from order_history changes."""
+    run_script("customer_order_summary_consumer.py", extra_args)
+
+def track_order_status(env_vars=None, extra_args=None):
+    """Keep each order's current status from the order flow collections' changes."""
+    run_script("order_status_consumer.py", extra_args)
 
 def setup_all(env_vars=None):
-    """Run all setup steps in sequence."""
-    print("Setting up database and collections...")
-    run_command([sys.executable, "create_db_collections.py"])
-    
-    print("\nCreating stream processor instance...")
-    run_command([sys.executable, "create_stream_processor_instance.py"])
-    
-    print("\nSetting up stream processor connections...")
-    run_command([sys.executable, "create_stream_processor_connections.py"])
-    
-    print("\nSetting up stream processors...")
-    run_command([sys.executable, "create_stream_processors.py"])
+    """Run all setup steps, running independent steps concurrently."""
+    # Imported here so the scripts read the environment after it has been prompted for
+    import create_db_collections as collections
+    import create_stream_processor_instance as instance
+    import create_stream_processor_connections as connections
+    import create_stream_processors as processors
+    from src.atlas_client import log_calls
+    from src.provisioner import Provisioner
+
+    log_calls()
+    client = collections.get_mongodb_client()
+    provisioner = Provisioner(max_workers=8)
+
+    # Collections and the stream processor instance don't depend on each other
+    collection_steps = [
+        provisioner.add(f"collection {c['db']}.{c['collection']}",
+                        lambda c=c: collections.configure_collection(client, c))
+        for c in collections.collections_config
+    ]
+    provisioner.add("indexes", lambda: collections.apply_index_plan(client), deps=collection_steps)
+    instance_step = provisioner.add("stream processor instance",
+                                    instance.create_stream_processor_instance)
+    connection_steps = [
+        provisioner.add(f"connection {c['name']}",
+                        lambda c=c: connections.create_connection(c), deps=[instance_step])
+        for c in connections.connections
+    ]
+    for p in processors.stream_processors + [processors.kafka_stream_processor]:
+        provisioner.add(f"processor {p['name']}",
+                        lambda p=p: processors.create_processor(p), deps=connection_steps)
+
+    try:
+        ok = provisioner.run()
+    finally:
+        client.close()
+    provisioner.print_timings()
+    if not ok:
+        print("\nSetup failed, fix the errors above and run setup-all again (existing resources are kept).")
+        sys.exit(1)
     
     print("\nSetup complete! You can now start the stream processors with:")
     print("./driver.py start-stream-processors")
@@ -51,16 +108,41 @@ def setup_all(env_vars=None):
 def get_order_history(env_vars=None, order_id=None):
     """Get history for a specific order."""
     if order_id:
-        run_command([sys.executable, "get_order_history.py", order_id])
+        run_script("get_order_history.py", [order_id])
     else:
-        run_command([sys.executable, "get_order_history.py"])
+        run_script("get_order_history.py")
+
+def get_order_metrics(env_vars=None, extra_args=None):
+    """Show the windowed order metrics written by the metrics stream processors."""
+    run_script("get_order_metrics.py", extra_args)
+
+def replay_dlq(env_vars=None, extra_args=None):
+    """Re-drive dead letters from dlqDb.dlqColl."""
+    run_script("replay_dlq.py", extra_args)
+
+def watch_processors(env_vars=None, extra_args=None):
+    """Show live per-processor throughput and DLQ growth."""
+    run_script("watch_stream_processors.py", extra_args)
+
+def trace_latency(env_vars=None, extra_args=None):
+    """Trace checkout-to-shipment latency through the stream processors."""
+    run_script("trace_order_latency.py", extra_args)
+
+def bench(env_vars=None, extra_args=None):
+    """Run the benchmark suite in its own interpreter, so its fakes stay out of the driver."""
+    run_command([sys.executable, "-m", "benchmarks.bench_suite", *(extra_args or [])])
+
+def fault_report(env_vars=None, extra_args=None):
+    """Measure throughput and DLQ growth under each fault injection profile."""
+    run_script("fault_injection_report.py", extra_args)
+
+def deploy_stream_processors(env_vars=None, extra_args=None):
+    """Redeploy only the stream processors whose config changed."""
+    run_script("deploy_stream_processors.py", extra_args)
 
 def start_stream_processors(use_kafka=False):
     """Start all stream processors."""
-    command = [sys.executable, "start_stream_processors.py"]
-    if use_kafka:
-        command.append("--kafka")
-    run_command(command)
+    run_script("start_stream_processors.py", ["--kafka"] if use_kafka else [])
 
 def initialize_registry():
     """Initialize the command registry with all available commands."""
@@ -74,16 +156,16 @@ def initialize_registry():
     registry.register("start-order-service", start_order_service, 
                      "Start Order Processing Service", category="setup", needs_kafka=False)
     registry.register("setup-database", 
-                     lambda env: run_command([sys.executable, "create_db_collections.py"]), 
-                     "Setup Database and Collections", category="setup")
+                     lambda env, extra_args=None: run_script("create_db_collections.py", extra_args), 
+                     "Setup Database and Collections", category="setup", takes_args=True)
     registry.register("create-stream-processor-instance", 
-                     lambda env: run_command([sys.executable, "create_stream_processor_instance.py"]), 
+                     lambda env: run_script("create_stream_processor_instance.py"), 
                      "Create Stream Processor Instance", category="setup")
     registry.register("setup-stream-processor-connections", 
-                     lambda env: run_command([sys.executable, "create_stream_processor_connections.py"]), 
+                     lambda env: run_script("create_stream_processor_connections.py"), 
                      "Setup Stream Processor Connections", category="setup")
     registry.register("setup-stream-processors", 
-                     lambda env: run_command([sys.executable, "create_stream_processors.py"]), 
+                     lambda env: run_script("create_stream_processors.py"), 
                      "Setup and Start Stream Processors", category="setup")
     registry.register("setup-all", setup_all, 
                      "Run All Setup Steps", category="setup")
@@ -93,6 +175,8 @@ def initialize_registry():
     registry.register("start-stream-processors-kafka", 
                      lambda env: start_stream_processors(use_kafka=True), 
                      "Start all stream processors including Kafka", category="setup")
+    registry.register("deploy", deploy_stream_processors,
+                     "Deploy Changed Stream Processors", category="setup", takes_args=True)
     
     # Simulation commands
     registry.register("simulate-shopping", 
@@ -103,12 +187,45 @@ def initialize_registry():
                      lambda env: simulate_shopping(env, use_kafka=True), 
                      "Simulate Customer Shopping (via Kafka)", 
                      needs_kafka=True, category="simulation")
+    registry.register("consume-kafka", consume_kafka,
+                     "Consume Kafka Cart Events Locally (bulk upserts)",
+                     needs_kafka=True, category="simulation", takes_args=True)
+    registry.register("tail-capped-collection", tail_capped_collection,
+                     "Consume Capped Collection Cart Events Locally (tailable cursor)",
+                     category="simulation", takes_args=True)
     
     # Utility commands
     registry.register("get-order-history", 
                      lambda env, extra_args=None: get_order_history(env, order_id=extra_args[0] if extra_args else None), 
                      "Retrieve Order History for an Order", 
                      category="utility")
+    registry.register("get-order-metrics", get_order_metrics,
+                     "Show Windowed Order Flow Metrics",
+                     category="utility", takes_args=True)
+    registry.register("summarize-customer-orders", summarize_customer_orders,
+                     "Maintain Per-Customer Order Summaries",
+                     category="utility", takes_args=True)
+    registry.register("track-order-status", track_order_status,
+                     "Track Current Order Status",
+                     category="utility", takes_args=True)
+    registry.register("monitor-capped-collection", monitor_capped_collection,
+                     "Monitor Capped Collection Consumer Lag",
+                     category="utility", takes_args=True)
+    registry.register("watch-processors", watch_processors,
+                     "Watch Stream Processor Throughput",
+                     category="utility", takes_args=True)
+    registry.register("replay-dlq", replay_dlq,
+                     "Replay Dead Letters from the DLQ",
+                     category="utility", takes_args=True)
+    registry.register("trace-latency", trace_latency,
+                     "Trace checkout-to-shipment latency",
+                     category="utility", takes_args=True)
+    registry.register("bench", bench,
+                     "Run the benchmark suite",
+                     category="utility", takes_args=True)
+    registry.register("fault-report", fault_report,
+                     "Report throughput and DLQ growth under injected faults",
+                     category="utility", takes_args=True)
     
     return registry
 
@@ -0,0 +1,167 @@
+"""Measure order throughput and DLQ growth under each fault injection profile.
+
+Puts the order service (started with FAULT_INJECTION="true") under each
+profile in turn through /admin/faults, and after a short settling period
+compares collection counts and the service's request counters at the start
+and end of the measurement window. Keep the shopping cart generator running
+while this runs, so the stream processors have orders to send.
+
+What comes out per profile, per second: orders validated (fulfilled or
+invalid), shipments made, new DLQ entries, and the service's answers to
+/processOrder and /shipOrder by status, which shows how much of the load the
+`$https` stages saw as errors, timeouts or 429s.
+"""
+import argparse
+import json
+import logging
+import re
+import time
+
+import requests
+
+from create_db_collections import get_mongodb_client
+from src.faults import PROFILES
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Collections counted for throughput, and the DLQ
+COUNTED_COLLECTIONS = {
+    "validated": [("orderdb", "fulfilled_orders"), ("orderdb", "invalid_orders")],
+    "shipped": [("shipmentdb", "shipped_orders"), ("shipmentdb", "delayed_orders")],
+    "dlq": [("dlqDb", "dlqColl")],
+}
+HTTPS_ROUTES = ["/processOrder", "/shipOrder"]
+REQUEST_LINE = re.compile(
+    r'^order_service_requests_total\{route="(?P<route>[^"]*)",method="[^"]*",status="(?P<status>\d+)"\} (?P<value>\S+)$'
+)
+
+DEFAULT_PROFILES = ["none", "slow", "very-slow", "flaky", "timeouts", "slow-drip", "brownout"]
+
+
+def status_class(status):
+    if status == "429":
+        return "429"
+    return f"{status[0]}xx"
+
+
+def request_counts(session, service_url):
+    """Requests to the $https routes so far, by status class, from /metrics"""
+    response = session.get(f"{service_url}/metrics", timeout=10)
+    response.raise_for_status()
+    counts = {}
+    for line in response.text.splitlines():
+        match = REQUEST_LINE.match(line)
+        if match and match["route"] in HTTPS_ROUTES:
+            key = status_class(match["status"])
+            counts[key] = counts.get(key, 0) + float(match["value"])
+    return counts
+
+
+def collection_counts(client):
+    return {
+        name: sum(client[db][coll].estimated_document_count() for db, coll in collections)
+        for name, collections in COUNTED_COLLECTIONS.items()
+    }
+
+
+def snapshot(client, session, service_url):
+    return {
+        "time": time.monotonic(),
+        "collections": collection_counts(client),
+        "requests": request_counts(session, service_url),
+    }
+
+
+def rates(start, end):
+    elapsed = end["time"] - start["time"]
+    result = {
+        f"{name}_per_s": (end["collections"][name] - start["collections"][name]) / elapsed
+        for name in COUNTED_COLLECTIONS
+    }
+    for key in sorted(set(start["requests"]) | set(end["requests"])):
+        delta = end["requests"].get(key, 0) - start["requests"].get(key, 0)
+        result[f"http_{key}_per_s"] = delta / elapsed
+    result["seconds"] = elapsed
+    return result
+
+
+def set_profile(session, service_url, profile):
+    response = session.put(f"{service_url}/admin/faults", json={"profile": profile}, timeout=10)
+    if response.status_code == 404:
+        raise SystemExit("The order service has no /admin/faults, start it with FAULT_INJECTION=\"true\"")
+    response.raise_for_status()
+
+
+def print_report(results):
+    columns = sorted({key for r in results.values() for key in r if key != "seconds"})
+    header = ["profile"] + columns
+    rows = [[profile] + [f"{r.get(c, 0):.2f}" for c in columns] for profile, r in results.items()]
+    widths = [max(len(str(row[i])) for row in rows + [header]) for i in range(len(header))]
+    print()
+    print("  ".join(h.ljust(widths[i]) for i, h in enumerate(header)))
+    for row in rows:
+        print("  ".join(v.ljust(widths[i]) for i, v in enumerate(row)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report throughput and DLQ growth under each fault profile")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=sorted(PROFILES),
+        default=DEFAULT_PROFILES,
+        help="Profiles to measure, in order (defaults to all)",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=120, help="Seconds to measure each profile for (defaults to 120)"
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=30,
+        help="Seconds to wait after switching profile before measuring (defaults to 30)",
+    )
+    parser.add_argument(
+        "--service-url",
+        default="http://localhost:5002",
+        help="Order service to inject faults into (defaults to http://localhost:5002)",
+    )
+    parser.add_argument("--output", default="fault_report.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    service_url = args.service_url.rstrip("/")
+    session = requests.Session()
+    client = get_mongodb_client()
+    results = {}
+    try:
+        for profile in args.profiles:
+            set_profile(session, service_url, profile)
+            logging.info(f"Profile {profile}: settling for {args.settle:g}s, then measuring for {args.duration:g}s")
+            time.sleep(args.settle)
+            start = snapshot(client, session, service_url)
+            time.sleep(args.duration)
+            results[profile] = rates(start, snapshot(client, session, service_url))
+            logging.info(
+                f"Profile {profile}: {results[profile]['shipped_per_s']:.2f} shipments/s, "
+                f"{results[profile]['dlq_per_s']:.2f} DLQ entries/s"
+            )
+    except KeyboardInterrupt:
+        logging.info("Interrupted, reporting the profiles measured so far")
+    finally:
+        try:
+            set_profile(session, service_url, "none")
+        except requests.RequestException as e:
+            logging.warning(f"Could not reset the fault profile: {e}")
+        client.close()
+
+    print_report(results)
+    with open(args.output, "w") as f:
+        json.dump({"profiles": {p: PROFILES[p] for p in results}, "results": results}, f, indent=2)
+    logging.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
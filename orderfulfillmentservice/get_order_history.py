@@ -1,12 +1,11 @@
 import requests
-from dotenv import load_dotenv
-import os
+from src.config import get_config
 import argparse
 import json
 
 
 def main():
-    load_dotenv()
+    config = get_config()
 
     parser = argparse.ArgumentParser(description="Get order history by order ID")
     parser.add_argument("order_id", nargs="?", help="The order ID to look up (optional)")
@@ -14,7 +13,7 @@ def main():
 
     order_id = args.order_id
 
-    ORDER_SERVICE_URL = os.environ["ORDER_SERVICE_URL"]
+    ORDER_SERVICE_URL = config["ORDER_SERVICE_URL"]
     if order_id:
         url = f"{ORDER_SERVICE_URL}/getOrderHistory?orderId={order_id}"
     else:
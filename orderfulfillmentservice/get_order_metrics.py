@@ -0,0 +1,86 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from create_db_collections import get_mongodb_client
+
+METRICS_DB = "metricsdb"
+METRICS_COLLECTION = "order_metrics"
+
+# Columns shown for each metric written by the windowed stream processors
+METRIC_COLUMNS = {
+    "order_validation": [
+        "orders_created",
+        "orders_fulfilled",
+        "orders_invalid",
+        "validation_ratio",
+    ],
+    "shipments": ["orders_shipped", "orders_delayed", "on_time_ratio"],
+    "cart_conversion": [
+        "carts_created",
+        "carts_updated",
+        "orders_created",
+        "conversion_rate",
+    ],
+}
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2%}"
+    return str(value)
+
+
+def print_metric_table(metric, windows):
+    columns = METRIC_COLUMNS[metric]
+    print(f"\n== {metric} ==")
+    if not windows:
+        print("No windows recorded yet.")
+        return
+
+    header = ["window_start"] + columns
+    rows = [
+        [w["window_start"].strftime("%Y-%m-%d %H:%M")]
+        + [format_value(w.get(c)) for c in columns]
+        for w in windows
+    ]
+    widths = [max(len(str(r[i])) for r in rows + [header]) for i in range(len(header))]
+    print("  ".join(h.ljust(widths[i]) for i, h in enumerate(header)))
+    for row in rows:
+        print("  ".join(v.ljust(widths[i]) for i, v in enumerate(row)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show windowed order flow metrics")
+    parser.add_argument(
+        "--minutes",
+        type=int,
+        default=15,
+        help="How many minutes of windows to show (defaults to 15)",
+    )
+    parser.add_argument(
+        "--metric",
+        choices=sorted(METRIC_COLUMNS),
+        help="Only show a single metric (defaults to all)",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client()
+    try:
+        collection = client[METRICS_DB][METRICS_COLLECTION]
+        since = datetime.now(timezone.utc) - timedelta(minutes=args.minutes)
+        metrics = [args.metric] if args.metric else list(METRIC_COLUMNS)
+        for metric in metrics:
+            windows = list(
+                collection.find(
+                    {"metric": metric, "window_start": {"$gte": since}}
+                ).sort("window_start", -1)
+            )
+            print_metric_table(metric, windows)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
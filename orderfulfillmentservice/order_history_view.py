@@ -0,0 +1,116 @@
+"""Process-local materialized view of orderhistorydb.order_history.
+
+The view is bootstrapped with one scan of the collection and kept current by a
+change stream opened before the scan, so no update made during the scan is
+missed. Once the memory budget is exceeded the orders that were added to the
+view first are evicted; lookups that miss the view go to MongoDB.
+
+/getOrderHistory returns whole documents, so each order is kept as its raw
+BSON, read from MongoDB without decoding and decoded only when looked up: a
+typical order_history document is about 700 bytes as BSON against about 4 KB
+as a decoded dict.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+# An OrderedDict entry's share of the table and its link node, measured with
+# tracemalloc at about 70 bytes amortized
+ENTRY_OVERHEAD_BYTES = 100
+
+
+class OrderRecord:
+    """One order in the view, as its BSON encoding."""
+
+    __slots__ = ("raw", "nbytes")
+
+    def __init__(self, order_id, raw):
+        self.raw = raw
+        self.nbytes = (
+            sys.getsizeof(self) + sys.getsizeof(raw) + sys.getsizeof(order_id) + ENTRY_OVERHEAD_BYTES
+        )
+
+
+class OrderHistoryView:
+    def __init__(self, collection, max_bytes, lookups=None):
+        """`lookups`, if given, is a metrics counter labelled by result, hit or miss"""
+        self.collection = collection.with_options(
+            codec_options=CodecOptions(document_class=RawBSONDocument)
+        )
+        self.max_bytes = max_bytes
+        self.records = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.ready = False
+        self.lookups = lookups
+
+    def start(self):
+        threading.Thread(target=self.run, name="order-history-view", daemon=True).start()
+
+    def get(self, order_id):
+        """Return a copy of the order's history document, or None if it is not in the view."""
+        record = self.records.get(order_id) if self.ready else None
+        if self.lookups is not None:
+            self.lookups.inc("miss" if record is None else "hit")
+        if record is None:
+            return None
+        return bson.decode(record.raw)
+
+    def upsert(self, doc):
+        order_id = doc["_id"]
+        record = OrderRecord(order_id, doc.raw)
+        with self.lock:
+            previous = self.records.get(order_id)
+            if previous is not None:
+                # Updates keep the order's age, only new orders go to the back
+                self.total_bytes -= previous.nbytes
+            self.records[order_id] = record
+            self.total_bytes += record.nbytes
+            while self.total_bytes > self.max_bytes and self.records:
+                _, evicted = self.records.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def remove(self, order_id):
+        with self.lock:
+            record = self.records.pop(order_id, None)
+            if record is not None:
+                self.total_bytes -= record.nbytes
+
+    def bootstrap(self):
+        with self.lock:
+            self.records.clear()
+            self.total_bytes = 0
+        for doc in self.collection.find({}, batch_size=10000):
+            self.upsert(doc)
+        self.ready = True
+        logging.info(
+            f"Order history view loaded {len(self.records)} orders "
+            f"({self.total_bytes / 1024 / 1024:.1f} MB)"
+        )
+
+    def apply(self, change):
+        operation = change["operationType"]
+        if operation in ("insert", "replace", "update"):
+            if change.get("fullDocument") is not None:
+                self.upsert(change["fullDocument"])
+        elif operation == "delete":
+            self.remove(change["documentKey"]["_id"])
+
+    def run(self):
+        while True:
+            try:
+                with self.collection.watch(full_document="updateLookup") as stream:
+                    self.bootstrap()
+                    for change in stream:
+                        self.apply(change)
+            except Exception as e:
+                # Serve from MongoDB until the view has been rebuilt
+                self.ready = False
+                logging.error(f"Order history view stopped, rebuilding: {e}")
+                time.sleep(5)
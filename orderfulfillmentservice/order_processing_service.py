@@ -1,43 +1,266 @@
-from flask import Flask, jsonify, request
-import pprint
+from flask import Flask, Response, g, jsonify, request
 import random
+import time
 import uuid
 from pymongo import MongoClient
-from dotenv import load_dotenv
+from src.config import get_config
 from urllib.parse import quote_plus
 from pymongo import MongoClient
 import logging
-import os
 from constants import *
+from order_history_view import OrderHistoryView
+from src import admission, faults, metrics, profiling
+from src.singleflight import SingleFlight
+from src.structured_logging import EventLogger, configure_logging
 
-load_dotenv()
+config = get_config()
+configure_logging()
+log = EventLogger("order_service")
 
 
 app = Flask(__name__)
 
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_PASS = os.getenv("MONGO_PASS")
+# Request, outcome and MongoDB timings, exposed at /metrics
+registry = metrics.Registry()
+request_duration = registry.histogram(
+    "order_service_request_duration_seconds", "Order service request duration", ["route", "method"]
+)
+requests_total = registry.counter(
+    "order_service_requests_total", "Order service requests", ["route", "method", "status"]
+)
+order_outcomes = registry.counter(
+    "order_service_order_outcomes_total", "Orders validated or shipped, by outcome", ["outcome"]
+)
+mongodb_duration = registry.histogram(
+    "order_service_mongodb_command_duration_seconds", "MongoDB command duration", ["command"]
+)
+mongodb_failures = registry.counter(
+    "order_service_mongodb_command_failures_total", "Failed MongoDB commands", ["command"]
+)
+history_lookups = registry.counter(
+    "order_service_history_lookups_total",
+    "order_history queries by getOrderHistory, run or coalesced into a concurrent identical one",
+    ["result"],
+)
+
+MONGO_URL = config.get("MONGO_URL")
+MONGO_USER = config.get("MONGO_USER")
+MONGO_PASS = config.get("MONGO_PASS")
 
 encoded_user = quote_plus(MONGO_USER)
 encoded_pass = quote_plus(MONGO_PASS)
 
 AUTH_MONGO_URL = f"mongodb+srv://{encoded_user}:{encoded_pass}{MONGO_URL}"
-client = MongoClient(AUTH_MONGO_URL, serverSelectionTimeoutMS=5000)
+client = MongoClient(
+    AUTH_MONGO_URL,
+    serverSelectionTimeoutMS=5000,
+    event_listeners=[metrics.CommandTimer(mongodb_duration, mongodb_failures)],
+)
 db = client["orderhistorydb"]
 order_history_collection = db["order_history"]
+customer_summary_collection = db["customer_order_summaries"]
+
+# Optional in-memory view of order_history, kept current by a change stream
+order_history_view = None
+if config.get("ORDER_HISTORY_VIEW", "").lower() == "true":
+    order_history_view = OrderHistoryView(
+        order_history_collection,
+        max_bytes=int(config.get("ORDER_HISTORY_VIEW_MAX_MB") or 64) * 1024 * 1024,
+        lookups=registry.counter(
+            "order_service_history_view_lookups_total", "getOrderHistory lookups in the in-memory view", ["result"]
+        ),
+    )
+    registry.gauge(
+        "order_service_history_view_bytes", "Estimated memory held by the in-memory order history view", [],
+        lambda: {(): order_history_view.total_bytes},
+    )
+    order_history_view.start()
+
+# Concurrent getOrderHistory lookups of the same order share one find_one
+history_flights = SingleFlight()
+
+
+def find_order_history(order_id):
+    """find_one on order_history, shared with any identical lookup already in flight"""
+    query = {"_id": order_id} if order_id else {}
+    order, shared = history_flights.do(order_id, lambda: order_history_collection.find_one(query))
+    history_lookups.inc("coalesced" if shared else "queried")
+    # Callers change the document, and coalesced callers all got the same one
+    return dict(order) if order else order
+
+
+# Orders are shed rather than queued once the service slows down (see src/admission.py),
+# and reads have a lane of their own so they can't take capacity from the $https stages
+ADMISSION_CONTROL = config.get("ADMISSION_CONTROL", "true").lower() == "true"
+order_lane = admission.AdaptiveLimit(
+    "orders",
+    initial_limit=int(config.get("ADMISSION_INITIAL_CONCURRENCY") or 20),
+    max_limit=int(config.get("ADMISSION_MAX_CONCURRENCY") or 200),
+)
+read_lane = admission.Lane("reads", int(config.get("ADMISSION_READ_CONCURRENCY") or 8))
+LANES = {
+    "/processOrder": order_lane,
+    "/shipOrder": order_lane,
+    "/getOrderHistory": read_lane,
+    "/customers/<customer_id>/summary": read_lane,
+}
+registry.gauge(
+    "order_service_admission_limit", "Concurrent requests admitted per lane", ["lane"],
+    lambda: {(lane.name,): lane.limit for lane in (order_lane, read_lane)},
+)
+registry.gauge(
+    "order_service_admission_in_flight", "Requests in flight per lane", ["lane"],
+    lambda: {(lane.name,): lane.in_flight for lane in (order_lane, read_lane)},
+)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter_ns()
+
+
+@app.before_request
+def admit():
+    if not ADMISSION_CONTROL or request.url_rule is None:
+        return None
+    lane = LANES.get(request.url_rule.rule)
+    if lane is None:
+        return None
+    # A lookup that will join one already in flight adds no load, so it doesn't
+    # need a read slot; otherwise a hot order's herd is mostly shed before it
+    # can coalesce. If the call finishes first, this request runs its own query
+    # without a slot, which only happens while that order is being looked up.
+    if request.url_rule.rule == "/getOrderHistory" and history_flights.in_flight(request.args.get("orderId")):
+        return None
+    if not lane.try_acquire():
+        response = jsonify({"error": f"Too many concurrent {lane.name} requests, retry later"})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(lane.retry_after())
+        return response
+    g.admitted = lane
+    return None
+
+
+@app.teardown_request
+def release(exc):
+    lane = g.pop("admitted", None)
+    if lane is not None:
+        # No status means the handler raised
+        succeeded = exc is None and g.get("response_status", 500) < 400
+        lane.release(time.perf_counter_ns() - g.request_start, succeeded)
+
+
+@app.after_request
+def record_request(response):
+    g.response_status = response.status_code
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request_duration.observe_micros((time.perf_counter_ns() - start) // 1000, route, request.method)
+        requests_total.inc(route, request.method, response.status_code)
+    return response
+
+
+# Latency, errors, timeouts and slow responses on demand, for capacity planning
+# the $https stages (see src/faults.py); no hooks are installed while it's off
+if faults.enabled():
+    fault_injector = faults.FaultInjector.from_config()
+    injected_faults = registry.counter(
+        "order_service_injected_faults_total", "Faults injected into responses", ["route", "fault"]
+    )
+    log.event("faults.enabled", "Fault injection enabled with profile %s", fault_injector.profile)
+
+    def fault_route():
+        """The route faults apply to, or None for unmatched, admin and metrics requests"""
+        if request.url_rule is None or request.path.startswith("/admin/") or request.path == "/metrics":
+            return None
+        return request.url_rule.rule
+
+    @app.before_request
+    def inject_fault():
+        route = fault_route()
+        if route is None:
+            return None
+        failure = fault_injector.before(route)
+        if failure is None:
+            return None
+        status, held = failure
+        injected_faults.inc(route, "timeout" if held else "error")
+        return jsonify({"error": "Injected fault"}), status
+
+    @app.after_request
+    def drip_response(response):
+        route = fault_route()
+        if route is None or response.direct_passthrough:
+            return response
+        chunks = fault_injector.drip(route, response.get_data())
+        if chunks is not None:
+            injected_faults.inc(route, "slow_drip")
+            response.response = chunks
+            response.direct_passthrough = True
+        return response
+
+    @app.route("/admin/faults", methods=["GET", "PUT", "DELETE"])
+    def fault_settings():
+        """PUT {"profile": name} or {"routes": {route: spec}} to change the faults, DELETE to clear them"""
+        if request.method == "DELETE":
+            fault_injector.use_profile("none")
+        elif request.method == "PUT":
+            body = request.get_json(silent=True) or {}
+            if not isinstance(body, dict):
+                return jsonify({"error": "Expected a JSON object"}), 400
+            try:
+                if "profile" in body:
+                    fault_injector.use_profile(body["profile"])
+                else:
+                    fault_injector.set(body.get("routes", {}), "custom")
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            log.event("faults.changed", "Fault profile changed to %s", fault_injector.profile)
+        return jsonify(dict(fault_injector.state(), profiles=sorted(faults.PROFILES)))
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+if profiling.enabled():
+    profiling.install_signal_handlers()
+
+    @app.route("/admin/profile")
+    def profile():
+        """Sample all threads for ?seconds= (default 10) and return the folded stacks"""
+        seconds = min(float(request.args.get("seconds", 10)), 300)
+        if not profiling.profiler.start(seconds):
+            return jsonify({"error": "A profile is already being taken"}), 409
+        profiling.profiler.wait()
+        with open(profiling.profiler.path) as f:
+            return Response(f.read(), content_type="text/plain")
+
+    @app.route("/admin/threads")
+    def threads():
+        return Response(profiling.thread_dump(), content_type="text/plain")
+
+    @app.route("/admin/tracemalloc", methods=["GET", "DELETE"])
+    def tracemalloc_snapshot():
+        """GET takes a snapshot (starting tracemalloc the first time), DELETE stops tracing"""
+        if request.method == "DELETE":
+            profiling.memory.stop()
+            return jsonify({"message": "tracemalloc stopped"})
+        return Response(profiling.memory.snapshot(), content_type="text/plain")
 
 
 @app.route("/")
 def hello():
-    pprint.pprint("hello called")
+    log.event("request.hello", "hello called", level=logging.DEBUG)
     return jsonify({"message": "Hello World!"})
 
 
 @app.route("/processOrder", methods=["POST"])
 def process_order():
     order = request.get_json()
-    pprint.pprint(order)
+    log.payload("order.received", order)
 
     validated_order = {
         "_id": order["fullDocument"]["order_id"],
@@ -46,14 +269,22 @@ def process_order():
         "status": "order_fulfilled" if random.randint(1, 10) < 8 else "order_invalid",
         "items": order["fullDocument"]["items"],
     }
-    pprint.pprint(validated_order)
+    # Carried through so the latency tracer can follow the order
+    if "trace" in order["fullDocument"]:
+        validated_order["trace"] = order["fullDocument"]["trace"]
+    order_outcomes.inc(validated_order["status"])
+    log.event(
+        "order.validated", "Validated order %s: %s", validated_order["order_id"], validated_order["status"],
+        order_id=validated_order["order_id"], status=validated_order["status"],
+    )
+    log.payload("order.validated", validated_order)
     return jsonify({"message": validated_order})
 
 
 @app.route("/shipOrder", methods=["POST"])
 def ship_order():
     order = request.get_json()
-    pprint.pprint(order)
+    log.payload("shipment.received", order)
     shipment_id = str(uuid.uuid4())
     shipped_order = {
         "_id": shipment_id,
@@ -62,24 +293,31 @@ def ship_order():
         "status": "order_shipped" if random.randint(1, 10) < 8 else "order_delayed",
         "items": order["fullDocument"]["items"],
     }
-    pprint.pprint(shipped_order)
+    if "trace" in order["fullDocument"]:
+        shipped_order["trace"] = order["fullDocument"]["trace"]
+    order_outcomes.inc(shipped_order["status"])
+    log.event(
+        "shipment.created", "Shipment %s for order %s: %s", shipment_id, shipped_order["order_id"],
+        shipped_order["status"], order_id=shipped_order["order_id"], status=shipped_order["status"],
+    )
+    log.payload("shipment.created", shipped_order)
     return jsonify({"message": shipped_order})
 
 
 @app.route("/getOrderHistory", methods=["GET"])
 def getOrderHistory():
-    pprint.pprint("getOrderHistory called")
-
     order_id = request.args.get("orderId")
-    pprint.pprint(f"orderId = {order_id}")
+    log.event("history.requested", "getOrderHistory called for %s", order_id, order_id=order_id)
     if not order_id:
-        order = order_history_collection.find_one()
+        order = find_order_history(None)
         if not order:
             return jsonify({"error": "No orders found"}), 404
         order["_id"] = str(order["_id"])
         return jsonify(order)
 
-    order = order_history_collection.find_one({"_id": order_id})
+    order = order_history_view.get(order_id) if order_history_view else None
+    if order is None:
+        order = find_order_history(order_id)
     if not order:
         return jsonify({"error": "Order not found"}), 404
 
@@ -88,5 +326,17 @@ def getOrderHistory():
     return jsonify(order)
 
 
+@app.route("/customers/<customer_id>/summary", methods=["GET"])
+def getCustomerSummary(customer_id):
+    # The generator uses integer customer ids
+    key = int(customer_id) if customer_id.isdigit() else customer_id
+    summary = customer_summary_collection.find_one({"_id": key})
+    if not summary:
+        return jsonify({"error": "Customer summary not found"}), 404
+
+    summary["customer_id"] = summary.pop("_id")
+    return jsonify(summary)
+
+
 if __name__ == "__main__":
     app.run(port=5002)
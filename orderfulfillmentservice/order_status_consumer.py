@@ -0,0 +1,111 @@
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from change_stream_consumer import ChangeStreamConsumer, CheckpointStore
+from create_db_collections import get_mongodb_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+CONSUMER_NAME = "order_status_consumer"
+STATUS_DB = "orderhistorydb"
+STATUS_COLLECTION = "order_status"
+
+# Order flow collections, and how far along the flow a document in each one is
+STAGES = {
+    ("orderdb", "orders"): 0,
+    ("orderdb", "fulfilled_orders"): 1,
+    ("orderdb", "invalid_orders"): 1,
+    ("shipmentdb", "shipped_orders"): 2,
+    ("shipmentdb", "delayed_orders"): 2,
+}
+
+
+def status_update(change, changed_at):
+    """An upsert moving the order's status forward to this change's stage, or None.
+
+    The status only ever moves to a later stage, so the update is idempotent
+    and events applied twice or out of order (the processors run in parallel)
+    leave the same result.
+    """
+    doc = change.get("fullDocument")
+    if doc is None or "order_id" not in doc:
+        return None
+    stage = STAGES[(change["ns"]["db"], change["ns"]["coll"])]
+    later = {"$gt": [stage, {"$ifNull": ["$stage", -1]}]}
+    return UpdateOne(
+        {"_id": doc["order_id"]},
+        [
+            {
+                "$set": {
+                    "status": {"$cond": [later, doc.get("status"), "$status"]},
+                    "updated_at": {"$cond": [later, changed_at, "$updated_at"]},
+                    "stage": {"$max": ["$stage", stage]},
+                }
+            }
+        ],
+        upsert=True,
+    )
+
+
+class OrderStatusTracker:
+    """Keeps one document per order with the status of the furthest step it has reached."""
+
+    def __init__(self, client):
+        self.statuses = client[STATUS_DB][STATUS_COLLECTION]
+
+    def handle(self, changes):
+        now = datetime.now(timezone.utc)
+        operations = [op for op in (status_update(c, c.get("wallTime") or now) for c in changes) if op]
+        if operations:
+            self.statuses.bulk_write(operations, ordered=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Track the current status of every order from the order flow collections"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Changes per bulk write")
+    parser.add_argument(
+        "--mongo-uri",
+        help="Use this MongoDB URI instead of the Atlas cluster in .env (e.g. a local replica set)",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client(args.mongo_uri)
+    tracker = OrderStatusTracker(client)
+    # One stream over the cluster, so the flow's collections share a single resume token
+    consumer = ChangeStreamConsumer(
+        client,
+        CONSUMER_NAME,
+        tracker.handle,
+        CheckpointStore.for_client(client),
+        pipeline=[
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "replace", "update"]},
+                    "$or": [{"ns.db": db, "ns.coll": coll} for db, coll in STAGES],
+                }
+            }
+        ],
+        full_document="updateLookup",
+        batch_size=args.batch_size,
+    )
+    consumer.load_checkpoint()
+
+    logging.info(f"Tracking order status from the order flow into {STATUS_DB}.{STATUS_COLLECTION}")
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        logging.info("Shutting down order status consumer...")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
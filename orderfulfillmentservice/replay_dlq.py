@@ -0,0 +1,322 @@
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from pymongo import DeleteOne, UpdateOne
+
+from create_db_collections import get_mongodb_client
+from src.config import get_config
+
+DLQ_DB = "dlqDb"
+DLQ_COLLECTION = "dlqColl"
+CHECKPOINT_COLLECTION = "dlqReplayCheckpoints"
+CHECKPOINT_ID = "replay-dlq"
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """A replay attempt failed in a way that may succeed if tried again."""
+
+
+class RateLimiter:
+    """Thread-safe token bucket shared by all replay workers."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Replayer:
+    """Re-drives dead letters of the processors that have a DLQ configured."""
+
+    def __init__(self, client, service_url, rate_limiter, workers, max_attempts):
+        self.client = client
+        self.service_url = service_url.rstrip("/")
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "ngrok-skip-browser-warning": "true",
+            }
+        )
+        self.handlers = {
+            "orderValidationStreamProcessor": self.replay_order_validation,
+            "orderToShipmentStreamProcessor": self.replay_order_shipment,
+            "delayedShipmentToOrderTrackingStreamProcessor": self.replay_delayed_shipment_tracking,
+        }
+
+    def call_service(self, path, change_event):
+        self.rate_limiter.acquire()
+        try:
+            response = self.session.post(
+                f"{self.service_url}{path}", json=change_event, timeout=30
+            )
+        except requests.RequestException as e:
+            raise RetryableError(str(e))
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise RetryableError(f"{path} returned {response.status_code}")
+        response.raise_for_status()
+        return response.json()["message"]
+
+    def replay_order_validation(self, doc):
+        orderdb = self.client["orderdb"]
+        if "destination_collection" in doc:
+            # The $https call succeeded and the $merge failed, write the result as is
+            validated = doc
+        else:
+            order_id = doc["fullDocument"]["order_id"]
+            for coll in ("fulfilled_orders", "invalid_orders"):
+                if orderdb[coll].find_one({"_id": order_id}, {"_id": 1}):
+                    return "skipped"
+            message = self.call_service("/processOrder", doc)
+            validated = {
+                "_id": message["order_id"],
+                "order_id": message["order_id"],
+                "cart_id": message["cart_id"],
+                "status": message["status"],
+                "items": message["items"],
+                "destination_collection": "fulfilled_orders"
+                if message["status"] == "order_fulfilled"
+                else "invalid_orders",
+            }
+        orderdb[validated["destination_collection"]].replace_one(
+            {"_id": validated["_id"]}, validated, upsert=True
+        )
+        return "succeeded"
+
+    def replay_order_shipment(self, doc):
+        shipmentdb = self.client["shipmentdb"]
+        if "destination_collection" in doc:
+            shipment = doc
+        else:
+            order_id = doc["fullDocument"]["order_id"]
+            # Shipment ids are generated by the service, so look up by order id
+            for coll in ("shipped_orders", "delayed_orders"):
+                if shipmentdb[coll].find_one({"order_id": order_id}, {"_id": 1}):
+                    return "skipped"
+            message = self.call_service("/shipOrder", doc)
+            shipment = {
+                "_id": message["shipment_id"],
+                "order_id": message["order_id"],
+                "status": message["status"],
+                "items": message["items"],
+                "destination_collection": "shipped_orders"
+                if message["status"] == "order_shipped"
+                else "delayed_orders",
+            }
+        shipmentdb[shipment["destination_collection"]].replace_one(
+            {"_id": shipment["_id"]}, shipment, upsert=True
+        )
+        return "succeeded"
+
+    def replay_delayed_shipment_tracking(self, doc):
+        if "fullDocument" in doc:
+            delayed = doc["fullDocument"]
+            update = {
+                "items": delayed.get("items"),
+                "source_collection": delayed.get("destination_collection"),
+                "create_delayed_shipped_order_status_event": {
+                    "status": "order_shipment_delayed",
+                    "delayed_shipment_id": delayed["_id"],
+                },
+            }
+            order_id = delayed["order_id"]
+        else:
+            update = {k: v for k, v in doc.items() if k != "_id"}
+            order_id = doc["_id"]
+        self.client["orderhistorydb"]["order_history"].update_one(
+            {"_id": order_id}, {"$set": update}, upsert=True
+        )
+        return "succeeded"
+
+    def replay(self, entry):
+        """Replay a single DLQ entry, retrying transient failures with backoff."""
+        handler = self.handlers.get(entry.get("processorName"))
+        if handler is None:
+            return entry["_id"], "unsupported", None
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return entry["_id"], handler(entry["doc"]), None
+            except RetryableError as e:
+                if attempt == self.max_attempts:
+                    return entry["_id"], "failed", str(e)
+                time.sleep(min(30, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            except Exception as e:
+                return entry["_id"], "failed", str(e)
+
+
+def order_key(entry):
+    """Key used to collapse duplicate dead letters for the same order."""
+    doc = entry.get("doc", {})
+    full_document = doc.get("fullDocument", doc)
+    return entry.get("processorName"), full_document.get("order_id", entry["_id"])
+
+
+def group_by_processor(batch):
+    """Group a batch by originating processor, keeping the newest entry per order."""
+    latest = {}
+    duplicates = []
+    for entry in batch:
+        key = order_key(entry)
+        if key in latest:
+            duplicates.append(latest[key])
+        latest[key] = entry
+    groups = defaultdict(list)
+    for (processor, _), entry in latest.items():
+        groups[processor].append(entry)
+    return groups, duplicates
+
+
+def replay_batch(batch, pool, replayer, dlq, checkpoints, delete, totals):
+    groups, duplicates = group_by_processor(batch)
+    entries = [entry for group in groups.values() for entry in group]
+    results = list(pool.map(replayer.replay, entries))
+    results.extend((entry["_id"], "skipped", None) for entry in duplicates)
+
+    now = datetime.now(timezone.utc)
+    writes = []
+    for entry_id, status, error in results:
+        totals[status] += 1
+        if delete and status in ("succeeded", "skipped"):
+            writes.append(DeleteOne({"_id": entry_id}))
+            continue
+        writes.append(
+            UpdateOne(
+                {"_id": entry_id},
+                {
+                    "$set": {
+                        "replay.status": status,
+                        "replay.error": error,
+                        "replay.updated_at": now,
+                    },
+                    "$inc": {"replay.attempts": 1},
+                },
+            )
+        )
+    if writes:
+        dlq.bulk_write(writes, ordered=False)
+
+    checkpoints.replace_one(
+        {"_id": CHECKPOINT_ID},
+        {"_id": CHECKPOINT_ID, "last_id": batch[-1]["_id"], "updated_at": now},
+        upsert=True,
+    )
+
+
+def print_progress(totals, start):
+    processed = sum(totals.values())
+    elapsed = max(time.time() - start, 1e-6)
+    summary = ", ".join(f"{k}={v}" for k, v in sorted(totals.items()))
+    print(f"Processed {processed} entries ({processed / elapsed:.0f}/s) {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay dead letters from dlqDb.dlqColl")
+    parser.add_argument("--batch-size", type=int, default=1000, help="DLQ entries per batch")
+    parser.add_argument("--workers", type=int, default=32, help="Concurrent replay workers")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=200,
+        help="Maximum order service calls per second (0 for no limit)",
+    )
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per entry")
+    parser.add_argument(
+        "--processor",
+        action="append",
+        help="Only replay entries from this processor (can be repeated)",
+    )
+    parser.add_argument(
+        "--service-url",
+        default=get_config().get("ORDER_SERVICE_URL"),
+        help="Order service URL (defaults to ORDER_SERVICE_URL, use http://localhost:5002 to skip ngrok)",
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete entries from the DLQ once replayed instead of marking them",
+    )
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="Ignore the saved checkpoint and rescan the whole DLQ",
+    )
+    args = parser.parse_args()
+    if not args.service_url:
+        parser.error("--service-url is required when ORDER_SERVICE_URL is not set")
+
+    client = get_mongodb_client()
+    dlq = client[DLQ_DB][DLQ_COLLECTION]
+    checkpoints = client[DLQ_DB][CHECKPOINT_COLLECTION]
+
+    replayer = Replayer(
+        client, args.service_url, RateLimiter(args.rate), args.workers, args.max_attempts
+    )
+
+    query = {"replay.status": {"$nin": ["succeeded", "skipped"]}}
+    checkpoint = None if args.from_start else checkpoints.find_one({"_id": CHECKPOINT_ID})
+    if checkpoint:
+        # Entries that failed before the checkpoint are retried as well
+        query["$or"] = [{"_id": {"$gt": checkpoint["last_id"]}}, {"replay.status": "failed"}]
+        print(f"Resuming after checkpoint {checkpoint['last_id']}")
+    if args.processor:
+        query["processorName"] = {"$in": args.processor}
+
+    totals = defaultdict(int)
+    start = time.time()
+    cursor = dlq.find(query).sort("_id", 1).batch_size(args.batch_size)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            batch = []
+            for entry in cursor:
+                batch.append(entry)
+                if len(batch) < args.batch_size:
+                    continue
+                replay_batch(batch, pool, replayer, dlq, checkpoints, args.delete, totals)
+                batch = []
+                print_progress(totals, start)
+            if batch:
+                replay_batch(batch, pool, replayer, dlq, checkpoints, args.delete, totals)
+    except KeyboardInterrupt:
+        print("\nInterrupted, progress up to the last completed batch is checkpointed.")
+    finally:
+        print_progress(totals, start)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
-import os
-from dotenv import load_dotenv
+from src.config import get_config
 from urllib.parse import quote_plus
 from pymongo import MongoClient
 import logging
@@ -9,14 +8,20 @@ import time
 import json
 import argparse
 from constants import *
+from src import profiling
+from src.structured_logging import EventLogger, configure_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Configuration from .env and the environment
+config = get_config()
 
-# Load environment variables
-load_dotenv()
+# Queued, sampled logging (see src/structured_logging.py)
+configure_logging()
+log = EventLogger("generator")
+
+
+def new_trace():
+    """A trace id and emit time that the stream processors carry through to order_history"""
+    return {"trace_id": uuid.uuid4().hex, "emitted_ns": time.time_ns()}
 
 
 class EventDestination:
@@ -32,13 +37,13 @@ class EventDestination:
 
     def setup_mongodb(self):
         """Setup MongoDB connection"""
-        MONGO_URL = os.getenv("MONGO_URL")
-        MONGO_DB = os.getenv("SHOPPING_CART_DB_NAME", "shoppingcartdb")
+        MONGO_URL = config.get("MONGO_URL")
+        MONGO_DB = config.get("SHOPPING_CART_DB_NAME", "shoppingcartdb")
         MONGO_COLLECTION = (
             "incoming_shopping_cart_events"  # Using the capped collection
         )
-        MONGO_USER = os.getenv("MONGO_USER")
-        MONGO_PASS = os.getenv("MONGO_PASS")
+        MONGO_USER = config.get("MONGO_USER")
+        MONGO_PASS = config.get("MONGO_PASS")
 
         encoded_user = quote_plus(MONGO_USER)
         encoded_pass = quote_plus(MONGO_PASS)
@@ -52,10 +57,10 @@ class EventDestination:
 
     def setup_kafka(self):
         """Setup Kafka producer"""
-        KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
-        KAFKA_TOPIC = os.getenv("KAFKA_SHOPPING_CART_TOPIC", "shopping-cart-events")
-        self.kafka_username = os.getenv("KAFKA_USERNAME", "admin")
-        self.kafka_password = os.getenv("KAFKA_PASSWORD", "admin-secret")
+        KAFKA_BOOTSTRAP_SERVERS = config.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+        KAFKA_TOPIC = config.get("KAFKA_SHOPPING_CART_TOPIC", "shopping-cart-events")
+        self.kafka_username = config.get("KAFKA_USERNAME", "admin")
+        self.kafka_password = config.get("KAFKA_PASSWORD", "admin-secret")
         self.kafka_topic = KAFKA_TOPIC
         self.producer = self.KafkaProducer(
             bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
@@ -70,6 +75,8 @@ class EventDestination:
 
     def send_event(self, event, destination):
         """Send event to specified destination"""
+        # Stamped as late as possible, so latency is measured from the send
+        event["trace"] = new_trace()
         if destination == "mongodb":
             event_doc = {
                 "_id": str(uuid.uuid4()),  # Unique ID for the event
@@ -78,8 +85,9 @@ class EventDestination:
                 "cart_data": event,
             }
             self.collection.insert_one(event_doc)
-            logging.info(
-                f"Inserted event into capped collection: {event_doc['event_type']}"
+            log.event(
+                "event.sent", "Inserted event into capped collection: %s", event_doc["event_type"],
+                event_type=event_doc["event_type"],
             )
 
         elif destination == "kafka":
@@ -113,7 +121,11 @@ def generate_cart_events(destination_handler, destination):
             }
             open_shopping_carts[customer_id] = cart
             destination_handler.send_event(cart, destination)
-            logging.info(f"Created new cart event for customer {customer_id}: {cart}")
+            log.event(
+                "cart.created", "Created new cart event for customer %s", customer_id,
+                cart_id=cart["_id"], items=len(cart["items"]),
+            )
+            log.payload("cart.created", cart)
             time.sleep(0.5)
 
         # For existing carts, either add items or convert to order
@@ -127,18 +139,22 @@ def generate_cart_events(destination_handler, destination):
                 cart["timestamp"] = int(time.time() * 1000)
                 cart[STATUS] = UPDATE_SHOPPING_CART  # New status for updates
                 destination_handler.send_event(cart, destination)
-                logging.info(
-                    f"Created update cart event for customer {customer_id}: {cart}"
+                log.event(
+                    "cart.updated", "Created update cart event for customer %s", customer_id,
+                    cart_id=cart["_id"], items=len(cart["items"]),
                 )
+                log.payload("cart.updated", cart)
             else:
                 # Convert cart to order
                 cart[STATUS] = CREATE_ORDER
                 cart["order_id"] = str(uuid.uuid4())
                 cart["timestamp"] = int(time.time() * 1000)
                 destination_handler.send_event(cart, destination)
-                logging.info(
-                    f"Created order event from cart for customer {customer_id}: {cart}"
+                log.event(
+                    "cart.ordered", "Created order event from cart for customer %s", customer_id,
+                    cart_id=cart["_id"], order_id=cart["order_id"], items=len(cart["items"]),
                 )
+                log.payload("cart.ordered", cart)
                 del open_shopping_carts[customer_id]
 
             time.sleep(0.5)
@@ -149,9 +165,11 @@ def generate_cart_events(destination_handler, destination):
         cart["order_id"] = str(uuid.uuid4())
         cart["timestamp"] = int(time.time() * 1000)
         destination_handler.send_event(cart, destination)
-        logging.info(
-            f"Created order event from remaining cart for customer {customer_id}: {cart}"
+        log.event(
+            "cart.ordered", "Created order event from remaining cart for customer %s", customer_id,
+            cart_id=cart["_id"], order_id=cart["order_id"], items=len(cart["items"]),
         )
+        log.payload("cart.ordered", cart)
         del open_shopping_carts[customer_id]
         time.sleep(0.5)
 
@@ -166,10 +184,11 @@ def main():
     )
     args = parser.parse_args()
 
+    profiling.install_signal_handlers()
     destination_handler = EventDestination(args.destination)
 
     logging.info(
-        f"Starting shopping cart event generator... (Destination: {args.destination})"
+        "Starting shopping cart event generator... (Destination: %s)", args.destination
     )
 
     try:
@@ -184,7 +203,7 @@ def main():
                 logging.info("Shutting down event generator...")
                 break
             except Exception as e:
-                logging.error(f"Error generating events: {e}")
+                logging.error("Error generating events: %s", e)
                 time.sleep(5)  # Wait longer if there's an error
     finally:
         destination_handler.close()
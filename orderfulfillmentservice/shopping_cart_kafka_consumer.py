@@ -0,0 +1,189 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import time
+
+from src.config import get_config
+from pymongo.errors import PyMongoError
+
+from create_db_collections import get_mongodb_client
+from stream_processors_config import kafka_stream_processor
+from stream_projection import compile_projection, find_stage, latest_replacements
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s"
+)
+
+# Configuration from .env and the environment
+config = get_config()
+
+# Same mapping and sink as shoppingCartEventsFromKafkaStreamProcessor
+project_cart = compile_projection(find_stage(kafka_stream_processor, "$project"))
+SINK = find_stage(kafka_stream_processor, "$merge")["into"]
+
+
+def get_kafka_config(args):
+    kafka_config = {
+        "bootstrap_servers": args.bootstrap_servers,
+        "group_id": args.group_id,
+        "enable_auto_commit": False,
+        "auto_offset_reset": "earliest",
+        "max_poll_records": args.batch_size,
+        "value_deserializer": lambda v: json.loads(v.decode("utf-8")),
+        "security_protocol": args.security_protocol,
+    }
+    if args.security_protocol.startswith("SASL"):
+        kafka_config.update(
+            sasl_mechanism="PLAIN",
+            sasl_plain_username=config.get("KAFKA_USERNAME", "admin"),
+            sasl_plain_password=config.get("KAFKA_PASSWORD", "admin-secret"),
+        )
+    return kafka_config
+
+
+def flush(collection, consumer, records, max_attempts):
+    """Write a batch to MongoDB, then commit the consumed offsets.
+
+    Offsets are only committed after the write succeeds, so a crash replays the
+    batch (at-least-once) and the upserts make the replay harmless. Returns
+    whether the offsets were committed: a commit fails when the group rebalanced
+    since the poll, which is routine while the workers start together, and then
+    the partitions' new owners read these records again.
+    """
+    from kafka.errors import CommitFailedError
+
+    operations = latest_replacements((record.value for record in records), project_cart)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            collection.bulk_write(operations, ordered=False)
+            break
+        except PyMongoError as e:
+            if attempt == max_attempts:
+                raise
+            logging.warning(f"Bulk write failed (attempt {attempt}): {e}")
+            time.sleep(min(10, 0.5 * 2 ** attempt))
+    try:
+        consumer.commit()
+    except CommitFailedError:
+        # The exception's message is a paragraph about max_poll_interval_ms
+        logging.warning(
+            f"Offsets for {len(records)} events not committed, the group rebalanced; "
+            "the partitions' new owners will replay them"
+        )
+        return False
+    return True
+
+
+def run_worker(args):
+    """Consume the partitions assigned to this group member until interrupted."""
+    from kafka import KafkaConsumer
+
+    consumer = KafkaConsumer(args.topic, **get_kafka_config(args))
+    client = get_mongodb_client(args.mongo_uri)
+    collection = client[SINK["db"]][SINK["coll"]]
+
+    pending = []
+    last_flush = time.monotonic()
+    consumed = 0
+    try:
+        while True:
+            polled = consumer.poll(timeout_ms=200, max_records=args.batch_size)
+            for records in polled.values():
+                pending.extend(records)
+            if pending and (
+                len(pending) >= args.batch_size
+                or time.monotonic() - last_flush >= args.flush_interval
+            ):
+                if flush(collection, consumer, pending, args.max_attempts):
+                    consumed += len(pending)
+                    logging.info(
+                        f"Flushed {len(pending)} events ({consumed} total) from partitions "
+                        f"{sorted(tp.partition for tp in consumer.assignment())}"
+                    )
+                # Dropped either way, uncommitted records are replayed by whoever owns them now
+                pending = []
+                last_flush = time.monotonic()
+    except KeyboardInterrupt:
+        if pending:
+            flush(collection, consumer, pending, args.max_attempts)
+    finally:
+        consumer.close(autocommit=False)
+        client.close()
+
+
+def count_partitions(args):
+    from kafka import KafkaConsumer
+
+    consumer = KafkaConsumer(**get_kafka_config(args))
+    try:
+        return len(consumer.partitions_for_topic(args.topic) or [])
+    finally:
+        consumer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Consume shopping cart events from Kafka into shoppingcartdb.shoppingcart"
+    )
+    parser.add_argument(
+        "--bootstrap-servers",
+        default=config.get("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+        help="Kafka bootstrap servers (defaults to KAFKA_BOOTSTRAP_SERVERS)",
+    )
+    parser.add_argument(
+        "--topic",
+        default=config.get("KAFKA_SHOPPING_CART_TOPIC", "shopping-cart-events"),
+        help="Topic to consume (defaults to KAFKA_SHOPPING_CART_TOPIC)",
+    )
+    parser.add_argument(
+        "--security-protocol",
+        default="SASL_PLAINTEXT",
+        choices=["SASL_PLAINTEXT", "PLAINTEXT"],
+        help="Broker security protocol (kafka_config/ uses SASL_PLAINTEXT)",
+    )
+    parser.add_argument("--group-id", default="shopping-cart-consumer", help="Consumer group id")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Consumer processes to run (defaults to one per topic partition)",
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Events per bulk write")
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=1.0,
+        help="Seconds to wait before flushing a partial batch",
+    )
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per bulk write")
+    parser.add_argument(
+        "--mongo-uri",
+        help="Write to this MongoDB URI instead of the Atlas cluster in .env (e.g. a local mongod)",
+    )
+    args = parser.parse_args()
+
+    workers = args.workers or max(1, count_partitions(args))
+    logging.info(
+        f"Starting {workers} consumer(s) for topic {args.topic} in group {args.group_id}"
+    )
+
+    # One process per partition so decoding and BSON encoding run in parallel too
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args,), name=f"consumer-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logging.info("Shutting down consumers...")
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Concurrency limits that shed load before requests queue up.
+
+The stream processors' `$https` stage waits a bounded time for each call, so a
+service that accepts everything and slows down makes every in-flight order time
+out together. A lane admits a request only while fewer than `limit` are in
+flight and otherwise rejects it straight away, which the service turns into a
+429 with Retry-After.
+
+AdaptiveLimit moves the limit with latency, in the style of the gradient
+limiters in Netflix's concurrency-limits: the lowest latency seen over the last
+minute or so stands in for the no-load latency, and the limit shrinks as the
+recent average rises above `tolerance` times it and grows by about
+sqrt(limit) while latency stays below that.
+"""
+import math
+import threading
+import time
+
+
+class Lane:
+    """A fixed concurrency limit"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency_ns, succeeded=True):
+        """Free the request's slot; only successful requests' latency is sampled.
+
+        Errors usually return almost at once, and counting them would drag the
+        baseline towards zero and the limit down with it.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if succeeded:
+                self.on_sample(latency_ns)
+
+    def on_sample(self, latency_ns):
+        pass
+
+    def retry_after(self):
+        """Seconds a rejected caller should wait before trying again"""
+        return 1
+
+
+class AdaptiveLimit(Lane):
+    def __init__(
+        self,
+        name,
+        initial_limit=20,
+        min_limit=4,
+        max_limit=200,
+        tolerance=2.0,
+        smoothing=0.2,
+        short_window=10,
+        baseline_seconds=30,
+    ):
+        super().__init__(name, initial_limit)
+        self.estimated_limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_decay = 2 / (short_window + 1)
+        self.short_latency = None
+        # Minimum latency of the current and the previous window, so the
+        # baseline can rise again if the service has become slower for good
+        self.baseline_seconds = baseline_seconds
+        self.window_start = time.monotonic()
+        self.window_min = math.inf
+        self.previous_min = math.inf
+
+    def baseline(self, latency_ns):
+        now = time.monotonic()
+        if now - self.window_start > self.baseline_seconds:
+            self.previous_min, self.window_min = self.window_min, math.inf
+            self.window_start = now
+        self.window_min = min(self.window_min, latency_ns)
+        return min(self.window_min, self.previous_min)
+
+    def on_sample(self, latency_ns):
+        baseline = self.baseline(latency_ns)
+        if self.short_latency is None:
+            self.short_latency = float(latency_ns)
+        self.short_latency += (latency_ns - self.short_latency) * self.short_decay
+
+        gradient = max(0.5, min(1.0, self.tolerance * baseline / self.short_latency))
+        # Don't grow the limit while the service isn't using it
+        if gradient == 1.0 and self.in_flight < self.estimated_limit / 2:
+            return
+        new_limit = self.estimated_limit * gradient + math.sqrt(self.estimated_limit)
+        new_limit = self.estimated_limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.estimated_limit = max(self.min_limit, min(self.max_limit, new_limit))
+        self.limit = int(self.estimated_limit)
+
+    def retry_after(self):
+        # Roughly the time for the requests ahead of the caller to drain
+        if not self.short_latency:
+            return 1
+        return max(1, math.ceil(self.short_latency / 1e9 * self.in_flight / max(self.limit, 1)))
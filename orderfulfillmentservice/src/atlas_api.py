@@ -1,16 +1,92 @@
-import requests
+import json
+import os
 import time
-from requests.auth import HTTPDigestAuth
+from concurrent.futures import ThreadPoolExecutor
+
+from .atlas_client import CLUSTERS_API_VERSION, get_client
+from .config import get_config
 
 DEFAULT_CLUSTER_NAME = "OrderFulfillmentDemoCluster"
+DISCOVERY_CACHE_FILE = ".atlas_discovery_cache.json"
+DEFAULT_DISCOVERY_CACHE_TTL = 600
 
-def create_cluster(project_id, pub_key, pri_key):
-    """Create a minimal M0 free tier cluster in Atlas."""
-    base_url = "https://cloud.mongodb.com/api/atlas/v2"
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/vnd.atlas.2024-11-23+json",
-    }
+
+class DiscoveryCache:
+    """On-disk cache of cluster discovery results, so repeated driver runs skip the API calls."""
+    def __init__(self, path=DISCOVERY_CACHE_FILE, ttl=None):
+        self.path = path
+        self.ttl = ttl if ttl is not None else float(
+            get_config().get("ATLAS_DISCOVERY_CACHE_TTL") or DEFAULT_DISCOVERY_CACHE_TTL
+        )
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        entry = self.load().get(key)
+        if entry and time.time() - entry["saved_at"] < self.ttl:
+            return entry["value"]
+        return None
+
+    def save(self, entries):
+        # Write to a temporary file first so a concurrent reader never sees a partial file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def put(self, key, value):
+        entries = self.load()
+        entries[key] = {"saved_at": time.time(), "value": value}
+        self.save(entries)
+
+    def invalidate(self, project_id):
+        entries = self.load()
+        kept = {k: v for k, v in entries.items() if not k.startswith(f"{project_id}/")}
+        if len(kept) != len(entries):
+            self.save(kept)
+
+
+def wait_for_cluster(client, project_id, cluster_name, timeout=5 * 60, first_interval=2,
+                     max_interval=20, backoff=1.5, on_ready=None):
+    """Poll until the cluster is IDLE, quickly at first and then less often.
+
+    Calls `on_ready` with the cluster description once it is ready and returns it.
+    """
+    spinner = ['|', '/', '-', '\\']
+    idx = 0
+    interval = first_interval
+    deadline = time.monotonic() + timeout
+    print("Waiting for cluster to be ready ", end='', flush=True)
+    while time.monotonic() < deadline:
+        status_response = client.get(
+            f"/groups/{project_id}/clusters/{cluster_name}",
+            version=CLUSTERS_API_VERSION,
+        )
+        cluster = status_response.json() if status_response.status_code == 200 else {}
+        print(f"\rWaiting for cluster to be ready {spinner[idx % len(spinner)]}", end='', flush=True)
+        idx += 1
+        if cluster.get("stateName") == "IDLE":
+            print("\rCluster is ready!           ")
+            if on_ready:
+                on_ready(cluster)
+            return cluster
+        time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        interval = min(interval * backoff, max_interval)
+
+    print()
+    raise Exception("Cluster creation timed out")
+
+def create_cluster(project_id, pub_key, pri_key, on_ready=None):
+    """Create a minimal M0 free tier cluster in Atlas and wait until it is ready.
+
+    `on_ready` is called with the cluster description as soon as the cluster is IDLE.
+    """
+    client = get_client(pub_key, pri_key)
 
     # Basic M0 cluster configuration
     cluster_config = {
@@ -34,10 +110,9 @@ def create_cluster(project_id, pub_key, pri_key):
     }
 
     # Create cluster
-    response = requests.post(
-        f"{base_url}/groups/{project_id}/clusters",
-        auth=HTTPDigestAuth(pub_key, pri_key),
-        headers=headers,
+    response = client.post(
+        f"/groups/{project_id}/clusters",
+        version=CLUSTERS_API_VERSION,
         json=cluster_config,
     )
 
@@ -45,28 +120,11 @@ def create_cluster(project_id, pub_key, pri_key):
         raise Exception(f"Failed to create cluster: {response.text}")
 
     cluster_info = response.json()
+    # The project's cluster list changed
+    DiscoveryCache().invalidate(project_id)
 
-    # Wait for cluster to be ready (timeout after 5 minutes)
-    spinner = ['|', '/', '-', '\\']
-    idx = 0
-    timeout = time.time() + 5 * 60
-    print("Waiting for cluster to be ready ", end='', flush=True)
-    while time.time() < timeout:
-        status_response = requests.get(
-            f"{base_url}/groups/{project_id}/clusters/{cluster_info['name']}",
-            auth=HTTPDigestAuth(pub_key, pri_key),
-            headers=headers,
-        )
-        status = status_response.json()["stateName"]
-        print(f"\rWaiting for cluster to be ready {spinner[idx % len(spinner)]}", end='', flush=True)
-        idx += 1
-        if status == "IDLE":
-            print("\rCluster is ready!           ")
-            return cluster_info["name"]
-        time.sleep(10)
-
-    print()
-    raise Exception("Cluster creation timed out")
+    wait_for_cluster(client, project_id, cluster_info["name"], on_ready=on_ready)
+    return cluster_info["name"]
 
 def get_cluster_connection_info(project_id, cluster_name, public_key, private_key):
     """
@@ -74,13 +132,15 @@ def get_cluster_connection_info(project_id, cluster_name, public_key, private_ke
     Tries flexClusters API first, falls back to /clusters API if not found or missing connection string.
     Returns (connection_string, provider, region)
     """
-    base_url = "https://cloud.mongodb.com/api/atlas/v2"
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/vnd.atlas.2024-11-23+json",
-    }
-    flex_url = f"{base_url}/groups/{project_id}/flexClusters/{cluster_name}"
-    resp = requests.get(flex_url, auth=HTTPDigestAuth(public_key, private_key), headers=headers)
+    cache = DiscoveryCache()
+    cache_key = f"{project_id}/connection/{cluster_name}"
+    cached = cache.get(cache_key)
+    if cached:
+        return tuple(cached)
+
+    client = get_client(public_key, private_key)
+    flex_path = f"/groups/{project_id}/flexClusters/{cluster_name}"
+    resp = client.get(flex_path, version=CLUSTERS_API_VERSION)
     fallback = False
 
     if resp.status_code == 400:
@@ -92,34 +152,48 @@ def get_cluster_connection_info(project_id, cluster_name, public_key, private_ke
         region = cluster_info.get("providerSettings", {}).get("regionName")
         connection_string = cluster_info.get("connectionStrings", {}).get("standardSrv")
         if connection_string:
+            cache.put(cache_key, [connection_string, provider, region])
             return connection_string, provider, region
         else:
             fallback = True
 
     if fallback:
-        clusters_url = f"{base_url}/groups/{project_id}/clusters/{cluster_name}"
-        resp = requests.get(clusters_url, auth=HTTPDigestAuth(public_key, private_key), headers=headers)
+        clusters_path = f"/groups/{project_id}/clusters/{cluster_name}"
+        resp = client.get(clusters_path, version=CLUSTERS_API_VERSION)
         resp.raise_for_status()
         cluster_info = resp.json()
         provider = cluster_info.get("providerSettings", {}).get("providerName")
         region = cluster_info.get("providerSettings", {}).get("regionName")
         connection_string = cluster_info.get("connectionStrings", {}).get("standardSrv")
+        if connection_string:
+            cache.put(cache_key, [connection_string, provider, region])
         return connection_string, provider, region
 
-def list_all_clusters(project_id, pub_key, pri_key):
+def list_all_clusters(project_id, pub_key, pri_key, use_cache=True):
     """
     List all flexClusters and clusters in the given Atlas project.
     Returns a list of dicts with keys: name, type (flex/standard), provider, region, connection_string.
+    Results are cached on disk for ATLAS_DISCOVERY_CACHE_TTL seconds.
     """
-    base_url = "https://cloud.mongodb.com/api/atlas/v2"
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/vnd.atlas.2024-11-23+json",
-    }
+    cache = DiscoveryCache()
+    cache_key = f"{project_id}/clusters"
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    client = get_client(pub_key, pri_key)
+    # The two listings are independent, fetch them at the same time
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        flex_future = pool.submit(
+            client.get, f"/groups/{project_id}/flexClusters", version=CLUSTERS_API_VERSION
+        )
+        std_future = pool.submit(
+            client.get, f"/groups/{project_id}/clusters", version=CLUSTERS_API_VERSION
+        )
     clusters = []
     # List flexClusters
-    flex_url = f"{base_url}/groups/{project_id}/flexClusters"
-    resp = requests.get(flex_url, auth=HTTPDigestAuth(pub_key, pri_key), headers=headers)
+    resp = flex_future.result()
     if resp.status_code == 200:
         for c in resp.json().get("results", []):
             clusters.append({
@@ -130,8 +204,7 @@ def list_all_clusters(project_id, pub_key, pri_key):
                 "connection_string": c.get("connectionStrings", {}).get("standardSrv"),
             })
     # List standard clusters
-    std_url = f"{base_url}/groups/{project_id}/clusters"
-    resp = requests.get(std_url, auth=HTTPDigestAuth(pub_key, pri_key), headers=headers)
+    resp = std_future.result()
     if resp.status_code == 200:
         for c in resp.json().get("results", []):
             # Extract provider and region from replicationSpecs if available
@@ -150,4 +223,6 @@ def list_all_clusters(project_id, pub_key, pri_key):
                 "region": region,
                 "connection_string": c.get("connectionStrings", {}).get("standardSrv"),
             })
+    if clusters:
+        cache.put(cache_key, clusters)
     return clusters
@@ -0,0 +1,171 @@
+"""Shared client for the Atlas Admin API.
+
+All Atlas API calls go through one pooled session per API key, so connections
+are reused, the digest challenge is answered once instead of on every call,
+transient failures (429 and 5xx) are retried with exponential backoff and
+jitter, and the number of calls in flight is bounded.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+
+from .config import get_config
+
+DEFAULT_BASE_URL = "https://cloud.mongodb.com/api/atlas/v2"
+STREAMS_API_VERSION = "application/vnd.atlas.2024-05-30+json"
+CLUSTERS_API_VERSION = "application/vnd.atlas.2024-11-23+json"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def log_calls(level=logging.INFO):
+    """Show the client's per-call timings (INFO) and retries (WARNING) on stderr.
+
+    Called by the scripts that use the client when they run; nothing is shown
+    otherwise, since the client only logs.
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+        # Not passed on as well, in case the caller configured the root logger too
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+class SharedDigestAuth(HTTPDigestAuth):
+    """HTTPDigestAuth that shares the server's digest challenge between threads.
+
+    requests keeps the challenge per thread, so every worker thread would make
+    an extra unauthenticated round trip before its first call. Here the first
+    challenge is cached and reused by all threads, with one shared nonce count.
+    """
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._lock = threading.Lock()
+        self._chal = None
+        self._nonce_count = 0
+
+    def __call__(self, r):
+        self.init_per_thread_state()
+        local = self._thread_local
+        with self._lock:
+            if self._chal is not None and not local.last_nonce:
+                local.chal = local.shared_chal = self._chal
+                local.last_nonce = self._chal.get("nonce")
+        return super().__call__(r)
+
+    def build_digest_header(self, method, url):
+        local = self._thread_local
+        with self._lock:
+            if local.chal is not self._chal and local.chal is not getattr(local, "shared_chal", None):
+                # This thread just answered a 401, its challenge replaces the cached one
+                self._chal = local.chal
+                self._nonce_count = 0
+            local.chal = local.shared_chal = self._chal
+            local.last_nonce = self._chal.get("nonce")
+            local.nonce_count = self._nonce_count
+            header = super().build_digest_header(method, url)
+            self._nonce_count = local.nonce_count
+        return header
+
+
+class AtlasClient:
+    def __init__(
+        self,
+        public_key,
+        private_key,
+        base_url=None,
+        max_concurrency=None,
+        max_attempts=5,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        timeout=30,
+    ):
+        config = get_config()
+        self.base_url = (base_url or config.get("ATLAS_API_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        max_concurrency = max_concurrency or int(config.get("ATLAS_API_MAX_CONCURRENCY") or 8)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        self.session.auth = SharedDigestAuth(public_key, private_key)
+        self.session.headers["Content-Type"] = "application/json"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry `attempt`, honouring Retry-After when the server sends it"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter, so concurrent callers that failed together don't retry together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def request(self, method, path, version=STREAMS_API_VERSION, **kwargs):
+        """Call `path` (relative to the API base URL) and return the final response.
+
+        Responses with a status in RETRY_STATUSES and connection errors are
+        retried up to max_attempts times; any other response is returned as is.
+        """
+        url = f"{self.base_url}{path}"
+        headers = {"Accept": version, **kwargs.pop("headers", {})}
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.perf_counter()
+            response = None
+            try:
+                with self.semaphore:
+                    response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning(f"{method} {path} failed ({e}), retrying (attempt {attempt})")
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if response is not None:
+                logger.info(f"{method} {path} -> {response.status_code} in {elapsed_ms:.0f} ms")
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_attempts:
+                    return response
+            time.sleep(self.backoff(attempt, response))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(public_key=None, private_key=None):
+    """Return the shared client for an API key, by default the one in ATLAS_API_PUBLIC_KEY/ATLAS_API_PRIVATE_KEY"""
+    public_key = public_key or get_config()["ATLAS_API_PUBLIC_KEY"]
+    private_key = private_key or get_config()["ATLAS_API_PRIVATE_KEY"]
+    with _clients_lock:
+        client = _clients.get((public_key, private_key))
+        if client is None:
+            client = _clients[(public_key, private_key)] = AtlasClient(public_key, private_key)
+        return client
@@ -1,20 +1,24 @@
 """Command registry and command classes for the driver script."""
+import runpy
 import subprocess
 import sys
 
 class Command:
     """Command class to encapsulate command functionality."""
-    def __init__(self, name, func, label, needs_kafka=False, category="general"):
+    def __init__(self, name, func, label, needs_kafka=False, category="general", takes_args=False):
         self.name = name
         self.func = func
         self.label = label
         self.needs_kafka = needs_kafka
         self.category = category
+        self.takes_args = takes_args
     
     def execute(self, env_vars, extra_args=None, debug=False):
         try:
             if self.name == "get-order-history" and extra_args:
                 self.func(env_vars, extra_args[0])
+            elif self.takes_args:
+                self.func(env_vars, extra_args or [])
             elif self.name == "start-ngrok":
                 self.func(env_vars, debug=debug)
             else:
@@ -30,8 +34,8 @@ class CommandRegistry:
         self.commands = {}
         self.aliases = {}
     
-    def register(self, name, func, label, needs_kafka=False, category="setup"):
-        self.commands[name] = Command(name, func, label, needs_kafka, category)
+    def register(self, name, func, label, needs_kafka=False, category="setup", takes_args=False):
+        self.commands[name] = Command(name, func, label, needs_kafka, category, takes_args)
         return self
     
     def add_alias(self, alias, target):
@@ -74,4 +78,32 @@ def run_command(cmd_array, check=True):
         sys.exit(e.returncode)
     except KeyboardInterrupt:
         print("\nCommand interrupted by user.")
-        sys.exit(130)  # Standard exit code for SIGINT
\ No newline at end of file
+        sys.exit(130)  # Standard exit code for SIGINT
+
+def run_script(script, args=(), in_process=True):
+    """Run one of the service's scripts as __main__ and exit if it fails.
+
+    Scripts run inside the driver process, so the modules and the parsed .env
+    the driver has already loaded are reused instead of being loaded again by a
+    new interpreter. Scripts that start worker processes of their own should be
+    run with in_process=False.
+    """
+    args = list(args or [])
+    if not in_process:
+        return run_command([sys.executable, script, *args])
+    saved_argv = sys.argv
+    sys.argv = [script, *args]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            if not isinstance(e.code, int):
+                print(e.code)
+            print(f"\nError: Command failed with exit code {e.code if isinstance(e.code, int) else 1}")
+            print(f"Command: {' '.join([script, *args])}")
+            sys.exit(e.code if isinstance(e.code, int) else 1)
+    except KeyboardInterrupt:
+        print("\nCommand interrupted by user.")
+        sys.exit(130)
+    finally:
+        sys.argv = saved_argv
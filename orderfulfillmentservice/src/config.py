@@ -0,0 +1,47 @@
+"""Configuration shared by the driver and the scripts it runs.
+
+`.env` is parsed once per process. Lookups check the process environment first
+and fall back to the parsed file, the same precedence as `load_dotenv()`, so
+values the driver prompts for and exports are seen by scripts run afterwards.
+"""
+import os
+import threading
+
+from dotenv import dotenv_values
+
+ENV_FILE = ".env"
+
+
+class Config:
+    def __init__(self, env_file=ENV_FILE):
+        self.file_values = {
+            k: v for k, v in dotenv_values(env_file).items() if v is not None
+        } if os.path.exists(env_file) else {}
+
+    def get(self, name, default=None):
+        value = os.environ.get(name)
+        if value is None:
+            value = self.file_values.get(name, default)
+        return value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    """The process-wide Config, parsing .env on first use"""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config()
+        return _config
@@ -2,7 +2,6 @@
 import os
 import sys
 from pathlib import Path
-from .atlas_api import create_cluster, list_all_clusters
 
 ENV_FILE = ".env"
 ENV_TEMPLATE = "env"
@@ -206,19 +205,23 @@ def prompt_and_set_env_var(var, desc, env_vars):
         print("Error: Empty or whitespace-only value not allowed. Please enter a valid value.")
 
 def select_or_create_cluster(env_vars):
+    # Imported here so commands that don't need the Atlas API don't import requests
+    from .atlas_api import create_cluster, list_all_clusters
+
     while True:
         print("\nNo Atlas cluster name found.")
         print("Would you like the driver to create the cluster? ... (y/n): ", end='')
         choice = input().strip().lower()
         if choice == 'y':
             try:
+                # Record the cluster as soon as it is ready, even if a later step fails
                 cluster_name = create_cluster(
                     env_vars['ATLAS_PROJECT_ID'],
                     env_vars['ATLAS_API_PUBLIC_KEY'],
-                    env_vars['ATLAS_API_PRIVATE_KEY']
+                    env_vars['ATLAS_API_PRIVATE_KEY'],
+                    on_ready=lambda cluster: set_env_var('ATLAS_CLUSTER_NAME', cluster['name'], env_vars),
                 )
                 print(f"Created cluster: {cluster_name}")
-                set_env_var('ATLAS_CLUSTER_NAME', cluster_name, env_vars)
                 # Get connection info and set env vars
                 from .atlas_api import get_cluster_connection_info
                 connection_string, provider, region = get_cluster_connection_info(
@@ -240,19 +243,25 @@ def select_or_create_cluster(env_vars):
                 else:
                     print(f"Error creating cluster: {e}")
         elif choice == 'n':
-            clusters = list_all_clusters(
-                env_vars['ATLAS_PROJECT_ID'],
-                env_vars['ATLAS_API_PUBLIC_KEY'],
-                env_vars['ATLAS_API_PRIVATE_KEY']
-            )
-            if not clusters:
-                print("No clusters found in your Atlas project. Please create one in the Atlas UI first.")
-                sys.exit(1)
-            print("\nAvailable clusters:")
-            for idx, c in enumerate(clusters, 1):
-                print(f"  {idx}. {c['name']} (type: {c['type']}, provider: {c['provider']}, region: {c['region']})")
+            refresh = False
             while True:
-                sel = input(f"Select a cluster by number (1-{len(clusters)}): ").strip()
+                clusters = list_all_clusters(
+                    env_vars['ATLAS_PROJECT_ID'],
+                    env_vars['ATLAS_API_PUBLIC_KEY'],
+                    env_vars['ATLAS_API_PRIVATE_KEY'],
+                    use_cache=not refresh,
+                )
+                if not clusters:
+                    print("No clusters found in your Atlas project. Please create one in the Atlas UI first.")
+                    sys.exit(1)
+                print("\nAvailable clusters:")
+                for idx, c in enumerate(clusters, 1):
+                    print(f"  {idx}. {c['name']} (type: {c['type']}, provider: {c['provider']}, region: {c['region']})")
+                sel = input(f"Select a cluster by number (1-{len(clusters)}, r to refresh the list): ").strip()
+                # Only a refresh goes back to Atlas, an invalid selection shows the same list
+                refresh = sel.lower() == "r"
+                if refresh:
+                    continue
                 if sel.isdigit() and 1 <= int(sel) <= len(clusters):
                     cluster = clusters[int(sel)-1]
                     cluster_name = cluster['name']
@@ -0,0 +1,209 @@
+"""Fault injection for the order service.
+
+With FAULT_INJECTION="true" the service can be made to answer the way a
+struggling downstream service would, per route, to see how the stream
+processors' `$https` stages and the DLQ cope. Each route's fault spec can have:
+
+    latency      extra delay before handling, {"distribution": ..., ...} with
+                 fixed (ms), uniform (min_ms, max_ms), normal (mean_ms, stddev_ms),
+                 lognormal (median_ms, sigma) or exponential (mean_ms)
+    error_rate   share of requests answered with `error_status` (default 503)
+    timeout_rate share of requests held for `timeout_seconds` (default 60),
+                 longer than the caller will wait, and then answered with 504
+    slow_drip    {"chunk_bytes": ..., "interval_ms": ...} sends the response
+                 body a few bytes at a time
+
+Specs are keyed by route ("/processOrder") or "*" for every route, and can be
+replaced at runtime through /admin/faults. PROFILES holds named sets of them;
+FAULT_PROFILE picks the one the service starts with. While FAULT_INJECTION is
+off the service installs no hooks and serves no admin endpoint.
+"""
+import math
+import random
+import threading
+import time
+
+from .config import get_config
+
+PROFILES = {
+    "none": {},
+    "slow": {
+        "/processOrder": {"latency": {"distribution": "lognormal", "median_ms": 250, "sigma": 0.5}},
+        "/shipOrder": {"latency": {"distribution": "lognormal", "median_ms": 250, "sigma": 0.5}},
+    },
+    "very-slow": {
+        "/processOrder": {"latency": {"distribution": "lognormal", "median_ms": 2000, "sigma": 0.7}},
+        "/shipOrder": {"latency": {"distribution": "lognormal", "median_ms": 2000, "sigma": 0.7}},
+    },
+    "flaky": {
+        "/processOrder": {"error_rate": 0.1},
+        "/shipOrder": {"error_rate": 0.1},
+    },
+    "timeouts": {
+        "/processOrder": {"timeout_rate": 0.05},
+        "/shipOrder": {"timeout_rate": 0.05},
+    },
+    "slow-drip": {
+        "/processOrder": {"slow_drip": {"chunk_bytes": 16, "interval_ms": 100}},
+        "/shipOrder": {"slow_drip": {"chunk_bytes": 16, "interval_ms": 100}},
+    },
+    "brownout": {
+        "*": {
+            "latency": {"distribution": "exponential", "mean_ms": 300},
+            "error_rate": 0.05,
+            "timeout_rate": 0.01,
+        },
+    },
+}
+
+DISTRIBUTIONS = {
+    "fixed": lambda spec: spec["ms"],
+    "uniform": lambda spec: random.uniform(spec["min_ms"], spec["max_ms"]),
+    "normal": lambda spec: max(0.0, random.gauss(spec["mean_ms"], spec["stddev_ms"])),
+    "lognormal": lambda spec: random.lognormvariate(math.log(spec["median_ms"]), spec.get("sigma", 0.5)),
+    "exponential": lambda spec: random.expovariate(1 / spec["mean_ms"]),
+}
+
+SPEC_KEYS = {
+    "latency", "error_rate", "error_status", "timeout_rate", "timeout_seconds", "slow_drip",
+}
+
+
+def enabled():
+    return get_config().get("FAULT_INJECTION", "").lower() == "true"
+
+
+# Numeric settings of each latency distribution, and whether they must be above zero
+# (lognormal's sigma is optional)
+DISTRIBUTION_PARAMS = {
+    "fixed": {"ms": False},
+    "uniform": {"min_ms": False, "max_ms": False},
+    "normal": {"mean_ms": False, "stddev_ms": False},
+    "lognormal": {"median_ms": True, "sigma": False},
+    "exponential": {"mean_ms": True},
+}
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def check_number(value, name, route, positive=False, maximum=None):
+    if not is_number(value) or value < 0 or (positive and value == 0) or (maximum is not None and value > maximum):
+        bound = "above 0" if positive else "0 or more"
+        if maximum is not None:
+            bound = f"between 0 and {maximum}"
+        raise ValueError(f"{name} for {route} must be a number {bound}")
+
+
+def validate_latency(latency, route):
+    if not isinstance(latency, dict):
+        raise ValueError(f"latency for {route} must be an object")
+    distribution = latency.get("distribution")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution for {route}: {distribution}")
+    for name, positive in DISTRIBUTION_PARAMS[distribution].items():
+        if name in latency:
+            check_number(latency[name], f"latency {name}", route, positive=positive)
+        elif name != "sigma":
+            raise ValueError(f"{distribution} latency for {route} needs {name}")
+    if distribution == "uniform" and latency["min_ms"] > latency["max_ms"]:
+        raise ValueError(f"uniform latency for {route} needs min_ms <= max_ms")
+
+
+def validate(routes):
+    """Raise ValueError if a {route: spec} mapping isn't valid"""
+    if not isinstance(routes, dict):
+        raise ValueError("Fault specs must be an object keyed by route")
+    for route, spec in routes.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f"Fault spec for {route} must be an object")
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Unknown fault settings for {route}: {', '.join(sorted(unknown))}")
+        if "latency" in spec:
+            validate_latency(spec["latency"], route)
+        for rate in ("error_rate", "timeout_rate"):
+            if rate in spec:
+                check_number(spec[rate], rate, route, maximum=1)
+        if "timeout_seconds" in spec:
+            check_number(spec["timeout_seconds"], "timeout_seconds", route)
+        if "error_status" in spec:
+            status = spec["error_status"]
+            if not isinstance(status, int) or isinstance(status, bool) or not 400 <= status <= 599:
+                raise ValueError(f"error_status for {route} must be an HTTP error status (400-599)")
+        if "slow_drip" in spec:
+            drip = spec["slow_drip"]
+            if not isinstance(drip, dict) or set(drip) - {"chunk_bytes", "interval_ms"}:
+                raise ValueError(f"slow_drip for {route} must be an object with chunk_bytes and interval_ms")
+            chunk_bytes = drip.get("chunk_bytes", 16)
+            if not isinstance(chunk_bytes, int) or isinstance(chunk_bytes, bool) or chunk_bytes < 1:
+                raise ValueError(f"slow_drip chunk_bytes for {route} must be a whole number above 0")
+            if "interval_ms" in drip:
+                check_number(drip["interval_ms"], "slow_drip interval_ms", route)
+
+
+class FaultInjector:
+    def __init__(self, routes=None, profile=None):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.profile = None
+        self.set(routes or {}, profile)
+
+    def set(self, routes, profile=None):
+        validate(routes)
+        with self.lock:
+            self.routes = routes
+            self.profile = profile
+
+    def use_profile(self, name):
+        if not isinstance(name, str) or name not in PROFILES:
+            raise ValueError(f"Unknown fault profile {name}, choose from {', '.join(PROFILES)}")
+        self.set(PROFILES[name], name)
+
+    def state(self):
+        with self.lock:
+            return {"profile": self.profile, "routes": self.routes}
+
+    @classmethod
+    def from_config(cls):
+        injector = cls()
+        injector.use_profile(get_config().get("FAULT_PROFILE") or "none")
+        return injector
+
+    def spec_for(self, route):
+        routes = self.routes
+        return routes.get(route) or routes.get("*")
+
+    def before(self, route):
+        """Delay the request as configured and return (status, seconds held) to fail it, or None"""
+        spec = self.spec_for(route)
+        if not spec:
+            return None
+        latency = spec.get("latency")
+        if latency:
+            time.sleep(max(0, DISTRIBUTIONS[latency["distribution"]](latency) / 1000))
+        if random.random() < spec.get("timeout_rate", 0):
+            held = spec.get("timeout_seconds", 60)
+            time.sleep(held)
+            return 504, held
+        if random.random() < spec.get("error_rate", 0):
+            return spec.get("error_status", 503), 0
+        return None
+
+    def drip(self, route, body):
+        """The body split into slowly sent chunks, or None to send it as is"""
+        spec = self.spec_for(route)
+        drip = spec.get("slow_drip") if spec else None
+        if not drip:
+            return None
+        chunk_bytes = max(1, drip.get("chunk_bytes", 16))
+        interval = drip.get("interval_ms", 100) / 1000
+
+        def chunks():
+            for start in range(0, len(body), chunk_bytes):
+                if start:
+                    time.sleep(interval)
+                yield body[start:start + chunk_bytes]
+
+        return chunks()
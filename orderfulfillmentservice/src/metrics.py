@@ -0,0 +1,218 @@
+"""In-process metrics with Prometheus text exposition.
+
+Recording has to stay in the microseconds because the order service sits on the
+stream processors' `$https` path, so durations go into fixed-size log-linear
+histograms (the HdrHistogram layout): a value is bucketed by its power of two
+and then linearly within it, which is a bit_length() and two shifts per sample
+with a bounded relative error, and no sample is ever kept.
+"""
+import math
+import threading
+
+from pymongo import monitoring
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket bounds exposed to Prometheus, in seconds
+EXPORT_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+
+class LogLinearHistogram:
+    """Counts of integer microsecond values, within 1/2**sub_bucket_bits of their true value."""
+
+    def __init__(self, sub_bucket_bits=5, max_value=60_000_000):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.max_value = max_value
+        self.counts = [0] * (self.index(max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def index(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return self.sub_buckets + (shift << self.sub_bucket_bits) + (value >> shift) - self.sub_buckets
+
+    def bucket_upper_bound(self, index):
+        """Largest value that falls into bucket `index`"""
+        if index < self.sub_buckets:
+            return index
+        shift, offset = divmod(index - self.sub_buckets, self.sub_buckets)
+        return ((self.sub_buckets + offset + 1) << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        i = self.index(value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.total, self.max
+
+    def value_at_quantile(self, q, snapshot=None):
+        counts, count, _, maximum = snapshot or self.snapshot()
+        if not count:
+            return 0
+        target = max(1, math.ceil(q * count))
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target:
+                return min(self.bucket_upper_bound(i), maximum)
+        return maximum
+
+
+class Metric:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def label_text(self, labels, extra=()):
+        pairs = list(zip(self.label_names, labels)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{self.label_text(labels)} {value}" for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Microsecond durations per label set, exposed in seconds as a Prometheus histogram.
+
+    The quantiles read from the log-linear histogram are exposed alongside as
+    `<name>_quantile` gauges, since Prometheus can only estimate them from the
+    coarse export buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self.histograms = {}
+
+    def labels(self, *labels):
+        histogram = self.histograms.get(labels)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(labels, LogLinearHistogram())
+        return histogram
+
+    def observe_micros(self, micros, *labels):
+        self.labels(*labels).record(micros)
+
+    def render(self):
+        lines = []
+        quantile_lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        for labels, histogram in histograms:
+            snapshot = histogram.snapshot()
+            counts, count, total, _ = snapshot
+            cumulative = 0
+            i = 0
+            for bound in EXPORT_BUCKETS:
+                # `le` is inclusive, so the bucket holding the bound itself counts towards it.
+                # Its other values are within the histogram's resolution of the bound.
+                last = min(histogram.index(round(bound * 1_000_000)), len(counts) - 1)
+                while i <= last:
+                    cumulative += counts[i]
+                    i += 1
+                lines.append(f"{self.name}_bucket{self.label_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self.label_text(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{self.label_text(labels)} {total / 1e6}")
+            lines.append(f"{self.name}_count{self.label_text(labels)} {count}")
+            for q in QUANTILES:
+                value = histogram.value_at_quantile(q, snapshot) / 1e6
+                quantile_lines.append(f"{self.name}_quantile{self.label_text(labels, [('quantile', q)])} {value}")
+        if quantile_lines:
+            lines += [
+                f"# HELP {self.name}_quantile {self.help_text}, quantiles",
+                f"# TYPE {self.name}_quantile gauge",
+            ] + quantile_lines
+        return lines
+
+
+class CallbackGauge(Metric):
+    """Values read when the metrics are rendered, from a function returning {labels: value}"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, label_names, read):
+        super().__init__(name, help_text, label_names)
+        self.read = read
+
+    def render(self):
+        return [f"{self.name}{self.label_text(labels)} {value}" for labels, value in sorted(self.read().items())]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=()):
+        metric = Histogram(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, label_names, read):
+        metric = CallbackGauge(name, help_text, label_names, read)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Records the duration of every MongoDB command a client runs."""
+
+    def __init__(self, durations, failures):
+        self.durations = durations
+        self.failures = failures
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.durations.observe_micros(event.duration_micros, event.command_name)
+
+    def failed(self, event):
+        self.durations.observe_micros(event.duration_micros, event.command_name)
+        self.failures.inc(event.command_name)
@@ -1,13 +1,26 @@
 """ngrok configuration and management functions."""
 import os
 import re
+import sys
 import time
 import tempfile
 import subprocess
 from pathlib import Path
 
+import requests
+
+from src.config import get_config
+
 NGROK_CONFIG = ".ngrok.yml"
 
+ORDER_TUNNEL = "order"
+KAFKA_TUNNEL = "shopping-cart-kafka"
+LOCAL_ORDER_SERVICE_URL = "http://localhost:5002/"
+DEFAULT_AGENT_API = "http://127.0.0.1:4040"
+
+TUNNEL_LINE = re.compile(r'name=(\S+) addr=\S+ url=(\S+)')
+WEB_ADDR_LINE = re.compile(r'msg="starting web service".* addr=(\S+)')
+
 def check_ngrok_installed():
     """Check if ngrok is installed and accessible."""
     try:
@@ -47,20 +60,46 @@ def setup_ngrok(env_vars, debug=False):
 
 def extract_urls_from_log(log_content):
     """Extract URLs from ngrok log content."""
-    order_service_url = None
-    kafka_bootstrap_server = None
-    
-    https_matches = re.findall(r'name=order addr=http://localhost:5002 url=(https://[^\s]+)', log_content)
-    if https_matches:
-        order_service_url = https_matches[0]
-    
-    kafka_matches = re.findall(r'name=shopping-cart-kafka addr=//localhost:9092 url=(tcp://[^\s]+)', log_content)
-    if kafka_matches:
-        kafka_url = kafka_matches[0]
-        kafka_bootstrap_server = kafka_url.replace('tcp://', '')
-    
+    tunnels = parse_log_lines(log_content.splitlines())[0]
+    order_service_url = tunnels.get(ORDER_TUNNEL)
+    kafka_bootstrap_server = tunnels.get(KAFKA_TUNNEL, "").replace('tcp://', '') or None
     return order_service_url, kafka_bootstrap_server
 
+def parse_log_lines(lines):
+    """Tunnel URLs by name and the agent API address found in ngrok log lines."""
+    tunnels = {}
+    web_addr = None
+    for line in lines:
+        match = TUNNEL_LINE.search(line)
+        if match:
+            tunnels.setdefault(match.group(1), match.group(2))
+        match = WEB_ADDR_LINE.search(line)
+        if match:
+            web_addr = f"http://{match.group(1)}"
+    return tunnels, web_addr
+
+class LogTail:
+    """Reads the lines appended to a file since the last read."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = ""
+
+    def read_lines(self):
+        try:
+            with open(self.path, "r") as f:
+                f.seek(self.offset)
+                data = f.read()
+                self.offset = f.tell()
+        except FileNotFoundError:
+            return []
+        data = self.partial + data
+        lines = data.split("\n")
+        # Keep an unterminated last line until the rest of it is written
+        self.partial = lines.pop()
+        return lines
+
 def update_env_file(env_vars, order_service_url=None, kafka_bootstrap_server=None):
     """Update .env file with new URLs."""
     if not (order_service_url or kafka_bootstrap_server):
@@ -90,6 +129,185 @@ def update_env_file(env_vars, order_service_url=None, kafka_bootstrap_server=Non
     with open(".env", "w") as f:
         f.writelines(updated_lines)
 
+class TunnelManager:
+    """Runs ngrok, publishes the tunnel URLs and keeps the tunnels healthy.
+
+    The ngrok log is tailed incrementally, and each URL is written to .env as
+    soon as its tunnel starts. Once both tunnels are up, the agent API and the
+    public order service URL are checked every `health_interval` seconds, and
+    ngrok is restarted when it exits or the tunnels stop answering while the
+    local order service is up.
+    """
+
+    def __init__(self, env_vars=None, debug=False, config_file=NGROK_CONFIG,
+                 health_interval=None, failure_threshold=2, startup_timeout=20):
+        config = get_config()
+        self.env_vars = env_vars
+        self.debug = debug
+        self.config_file = config_file
+        self.health_interval = health_interval or float(config.get("NGROK_HEALTH_CHECK_INTERVAL") or 5)
+        self.failure_threshold = failure_threshold
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.log_file = None
+        self.tail = None
+        self.agent_api = DEFAULT_AGENT_API
+        self.tunnels = {}
+        self.published = {}
+        self.local_service_up = False
+        self.restarts = 0
+        self.session = requests.Session()
+
+    def log(self, message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}")
+
+    def start(self):
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            self.log_file = temp_file.name
+        self.tail = LogTail(self.log_file)
+        self.tunnels = {}
+        self.process = subprocess.Popen(
+            ["ngrok", "start", "--config", self.config_file, "--all",
+             "--log", self.log_file, "--log-format", "logfmt"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT
+        )
+        if self.debug:
+            print(f"\nMonitoring ngrok log file: {self.log_file}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log_file:
+            try:
+                os.unlink(self.log_file)
+            except OSError:
+                pass
+            self.log_file = None
+
+    def publish(self, name, url):
+        """Record a tunnel URL and write it to .env right away."""
+        self.tunnels[name] = url
+        previous = self.published.get(name)
+        if previous == url:
+            return
+        self.published[name] = url
+        if name == ORDER_TUNNEL:
+            print(f"Found Order Service URL: {url}")
+            update_env_file(self.env_vars, order_service_url=url)
+        elif name == KAFKA_TUNNEL:
+            print(f"Found Kafka Bootstrap Server: {url.replace('tcp://', '')}")
+            update_env_file(self.env_vars, kafka_bootstrap_server=url.replace('tcp://', ''))
+        if previous:
+            self.log(f"Tunnel {name} moved from {previous} to {url}. Run "
+                     "'./driver.py setup-stream-processor-connections' so the stream processors use it.")
+
+    def read_log(self):
+        lines = self.tail.read_lines()
+        if self.debug and lines:
+            print("\n".join(lines))
+        tunnels, web_addr = parse_log_lines(lines)
+        if web_addr:
+            self.agent_api = web_addr
+        for name, url in tunnels.items():
+            self.publish(name, url)
+
+    def agent_tunnels(self):
+        """Tunnel URLs by name from the ngrok agent API, or None if it isn't answering."""
+        try:
+            response = self.session.get(f"{self.agent_api}/api/tunnels", timeout=1)
+            response.raise_for_status()
+            return {t["name"]: t["public_url"] for t in response.json().get("tunnels", [])}
+        except (requests.RequestException, ValueError, KeyError):
+            return None
+
+    def wait_for_tunnels(self):
+        """Publish tunnel URLs as ngrok reports them, until both are up."""
+        deadline = time.time() + self.startup_timeout
+        interval = 0.05
+        while time.time() < deadline:
+            self.read_log()
+            if {ORDER_TUNNEL, KAFKA_TUNNEL} <= set(self.tunnels):
+                return True
+            if self.process.poll() is not None:
+                self.read_log()
+                print(f"ngrok exited with code {self.process.returncode}.")
+                return False
+            time.sleep(interval)
+            # Fall back to the agent API in case the log format isn't recognised
+            interval = min(interval * 2, 0.5)
+            if interval == 0.5:
+                for name, url in (self.agent_tunnels() or {}).items():
+                    self.publish(name, url)
+        return bool(self.tunnels)
+
+    def check_health(self):
+        """None if the tunnels are healthy, otherwise why they aren't."""
+        if self.process.poll() is not None:
+            return f"ngrok exited with code {self.process.returncode}"
+        tunnels = self.agent_tunnels()
+        if tunnels is None:
+            return "the ngrok agent API is not answering"
+        missing = {ORDER_TUNNEL, KAFKA_TUNNEL} - set(tunnels)
+        if missing:
+            return f"tunnel(s) {', '.join(sorted(missing))} are gone"
+        for name, url in tunnels.items():
+            self.publish(name, url)
+
+        order_url = tunnels[ORDER_TUNNEL]
+        try:
+            self.session.get(LOCAL_ORDER_SERVICE_URL, timeout=2)
+            self.local_service_up = True
+        except requests.RequestException:
+            # Nothing for the tunnel to reach, so its health can't be judged
+            self.local_service_up = False
+            return None
+        try:
+            response = self.session.get(order_url, headers={"ngrok-skip-browser-warning": "1"}, timeout=5)
+        except requests.RequestException as e:
+            return f"{order_url} is unreachable ({e.__class__.__name__})"
+        if response.status_code >= 500 or "ngrok-error-code" in response.headers:
+            return f"{order_url} returned {response.status_code} {response.headers.get('ngrok-error-code', '')}".strip()
+        return None
+
+    def restart(self, reason):
+        self.restarts += 1
+        self.log(f"Restarting ngrok: {reason}")
+        self.stop()
+        time.sleep(min(30, 2 ** (self.restarts - 1)))
+        self.start()
+        if self.wait_for_tunnels():
+            self.log("ngrok restarted.")
+
+    def monitor(self):
+        """Health-check the tunnels until interrupted, restarting ngrok when they fail."""
+        failures = 0
+        local_down_reported = False
+        while True:
+            # Notice ngrok exiting straight away, between the slower health checks
+            next_check = time.time() + self.health_interval
+            while time.time() < next_check and self.process.poll() is None:
+                time.sleep(0.25)
+            self.read_log()
+            reason = self.check_health()
+            if reason is None:
+                failures = 0
+                self.restarts = 0
+                if not self.local_service_up and not local_down_reported:
+                    self.log(f"Order service is not answering on {LOCAL_ORDER_SERVICE_URL}, "
+                             "start it with './driver.py start-order-service'.")
+                local_down_reported = not self.local_service_up
+                continue
+            failures += 1
+            self.log(f"Tunnel health check failed ({failures}/{self.failure_threshold}): {reason}")
+            if failures >= self.failure_threshold or self.process.poll() is not None:
+                self.restart(reason)
+                failures = 0
+
 def start_ngrok(env_vars=None, debug=False):
     """Start ngrok using configuration file."""
     if not Path(NGROK_CONFIG).exists():
@@ -97,62 +315,17 @@ def start_ngrok(env_vars=None, debug=False):
         print("Please run './driver.py setup-ngrok' first.")
         sys.exit(1)
 
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        log_file = temp_file.name
-
+    manager = TunnelManager(env_vars, debug=debug)
     try:
-        process = subprocess.Popen(
-            ["ngrok", "start", "--config", NGROK_CONFIG, "--all", "--log", log_file],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT
-        )
-        
-        if debug:
-            print(f"\nMonitoring ngrok log file: {log_file}")
-
-        start_time = time.time()
-        order_service_url = kafka_bootstrap_server = None
-        
-        while time.time() - start_time < 20 and (order_service_url is None or kafka_bootstrap_server is None):
-            try:
-                with open(log_file, 'r') as f:
-                    log_content = f.read()
-                    if debug:
-                        print("\n[ngrok log file contents]:\n")
-                        print(log_content)
-                
-                order_service_url, kafka_bootstrap_server = extract_urls_from_log(log_content)
-                if order_service_url:
-                    print(f"Found Order Service URL: {order_service_url}")
-                if kafka_bootstrap_server:
-                    print(f"Found Kafka Bootstrap Server: {kafka_bootstrap_server}")
-                
-                if not (order_service_url or kafka_bootstrap_server):
-                    time.sleep(0.5)
-            except Exception:
-                time.sleep(0.5)
-        
-        if order_service_url or kafka_bootstrap_server:
-            update_env_file(env_vars, order_service_url, kafka_bootstrap_server)
+        manager.start()
+        if manager.wait_for_tunnels():
             print(f"\nUpdated env file with ngrok URLs.")
-        
-        print("\nngrok is now running. Press Ctrl+C in this terminal to stop it.")
-        process.wait()
-    
+        print("\nngrok is now running, checking the tunnels every "
+              f"{manager.health_interval:g}s. Press Ctrl+C in this terminal to stop it.")
+        manager.monitor()
     except KeyboardInterrupt:
         print("\nngrok interrupted by user.")
-        if process and process.poll() is None:
-            process.terminate()
-            try:
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.kill()
     except Exception as e:
         print(f"\nError running ngrok: {str(e)}")
-        if process and process.poll() is None:
-            process.terminate()
     finally:
-        try:
-            os.unlink(log_file)
-        except Exception:
-            pass
\ No newline at end of file
+        manager.stop()
@@ -0,0 +1,195 @@
+"""Opt-in profiling for the long-running scripts.
+
+Nothing here runs unless PROFILING="true": then `install_signal_handlers()`
+makes SIGUSR1 sample the process's stacks for PROFILE_SECONDS and SIGUSR2 dump
+every thread's stack together with a tracemalloc snapshot (diffed against the
+previous one), and the order service also serves the same under /admin/profile.
+While disabled no handler is installed, no thread is started and tracemalloc
+stays off, so there is no cost.
+
+Profiles are written in the folded stack format ("frame;frame;frame count"),
+which flamegraph.pl, speedscope and most flame graph viewers read.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return get_config().get("PROFILING", "").lower() == "true"
+
+
+def output_path(kind, extension):
+    directory = get_config().get("PROFILE_DIR") or "profiles"
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at `interval` seconds and counts identical stacks."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.path = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, on_done=None):
+        """Profile for `seconds` in the background; False if a profile is already running"""
+        with self.lock:
+            if self.running():
+                return False
+            self.thread = threading.Thread(
+                target=self._run, args=(seconds, on_done), name="sampling-profiler", daemon=True
+            )
+            self.thread.start()
+            return True
+
+    def sample(self, seconds):
+        """Folded stack counts for `seconds` of samples"""
+        me = threading.get_ident()
+        names = {}
+        stacks = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stack = ";".join(reversed(frames))
+                stacks[stack] = stacks.get(stack, 0) + 1
+            time.sleep(self.interval)
+        return stacks
+
+    def wait(self):
+        """Wait for the running profile, if any, to be written"""
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self, seconds, on_done):
+        stacks = self.sample(seconds)
+        self.path = output_path("profile", "folded")
+        with open(self.path, "w") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote {sum(stacks.values())} stack samples over {seconds:g}s to {self.path}")
+        if on_done:
+            on_done(self.path)
+
+
+def thread_dump():
+    """Every thread's current stack, as text"""
+    names = {t.ident: t for t in threading.enumerate()}
+    sections = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        title = f"Thread {thread.name if thread else ident} ({ident})"
+        if thread is not None and thread.daemon:
+            title += " daemon"
+        sections.append(title + "\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(sections)
+
+
+class MemoryTracker:
+    """tracemalloc snapshots, each compared with the one before it."""
+
+    def __init__(self, frames=1, top=25):
+        self.frames = frames
+        self.top = top
+        self.previous = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.previous = None
+            return True
+        return False
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self):
+        """Top allocations and their growth since the last snapshot, as text.
+
+        Starts tracing on first use, so only allocations from then on are seen.
+        """
+        with self.lock:
+            if self.start():
+                return "tracemalloc started, take another snapshot to see allocations and growth\n"
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"traced memory: {current / 1024:.0f} KiB (peak {peak / 1024:.0f} KiB)", "", "top allocations:"]
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[: self.top]]
+            if self.previous is not None:
+                lines += ["", "growth since the previous snapshot:"]
+                lines += [str(stat) for stat in snapshot.compare_to(self.previous, "lineno")[: self.top]]
+            self.previous = snapshot
+            return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracker()
+
+
+def write_report(kind, text):
+    path = output_path(kind, "txt")
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def dump_threads_and_memory():
+    threads_path = write_report("threads", thread_dump())
+    memory_path = write_report("tracemalloc", memory.snapshot())
+    logger.info(f"Wrote thread stacks to {threads_path} and a tracemalloc snapshot to {memory_path}")
+
+
+def install_signal_handlers():
+    """SIGUSR1 profiles for PROFILE_SECONDS, SIGUSR2 dumps threads and memory; only when PROFILING is on"""
+    if not enabled() or not hasattr(signal, "SIGUSR1"):
+        return False
+    seconds = float(get_config().get("PROFILE_SECONDS") or 30)
+
+    def on_profile(signum, frame):
+        if not profiler.start(seconds):
+            logger.info("A profile is already being taken")
+
+    def on_dump(signum, frame):
+        # Not in the handler itself, which interrupts whatever the main thread was doing
+        threading.Thread(target=dump_threads_and_memory, name="profiling-dump", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, on_profile)
+    signal.signal(signal.SIGUSR2, on_dump)
+    logger.info(
+        f"Profiling enabled: kill -USR1 {os.getpid()} profiles for {seconds:g}s, "
+        f"kill -USR2 {os.getpid()} dumps threads and memory"
+    )
+    return True
@@ -0,0 +1,90 @@
+"""Dependency-aware, concurrent execution of environment setup steps."""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Step:
+    """A named setup step that runs once all of its dependencies have succeeded."""
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.status = "pending"
+        self.started = None
+        self.duration = None
+        self.error = None
+
+
+class Provisioner:
+    """Runs steps concurrently, starting each one as soon as its dependencies are done.
+
+    A step fails if its function returns False or raises; steps depending on a
+    failed step are skipped. Independent steps keep running either way.
+    """
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.steps = {}
+        self.total = None
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"Step {name} depends on unknown step {dep}")
+        self.steps[name] = Step(name, func, deps)
+        return name
+
+    def _run_step(self, step, start):
+        step.started = time.perf_counter() - start
+        try:
+            ok = step.func()
+            step.status = "failed" if ok is False else "succeeded"
+        except Exception as e:
+            step.status = "failed"
+            step.error = str(e)
+        step.duration = time.perf_counter() - start - step.started
+        return step
+
+    def run(self):
+        """Run all steps, returning True if every step succeeded."""
+        start = time.perf_counter()
+        pending = dict(self.steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    dep_status = [self.steps[d].status for d in step.deps]
+                    if any(s in ("failed", "skipped") for s in dep_status):
+                        step.status = "skipped"
+                        del pending[name]
+                    elif all(s == "succeeded" for s in dep_status):
+                        step.status = "running"
+                        running[pool.submit(self._run_step, step, start)] = step
+                        del pending[name]
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    if step.error:
+                        print(f"\nStep {step.name} failed: {step.error}")
+        self.total = time.perf_counter() - start
+        return all(step.status == "succeeded" for step in self.steps.values())
+
+    def print_timings(self):
+        """Print when each step started and how long it took, in start order."""
+        print("\nSetup timing breakdown:")
+        width = max(len(name) for name in self.steps)
+        ordered = sorted(
+            self.steps.values(),
+            key=lambda s: (s.started is None, s.started or 0),
+        )
+        for step in ordered:
+            if step.started is None:
+                print(f"  {step.name:<{width}}  {step.status}")
+                continue
+            print(
+                f"  {step.name:<{width}}  start {step.started:6.2f}s"
+                f"  took {step.duration:6.2f}s  {step.status}"
+            )
+        step_total = sum(s.duration for s in self.steps.values() if s.duration)
+        print(f"\n  Wall clock {self.total:.2f}s for {step_total:.2f}s of step time")
@@ -0,0 +1,51 @@
+"""Coalescing of concurrent identical calls.
+
+When several threads ask for the same key at once, only the first (the leader)
+runs the call; the others wait for it and get its result, or its exception.
+Nothing is kept once the call returns, so this sits underneath any cache: the
+cache answers repeated lookups, and single-flight collapses the misses that
+arrive together.
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def in_flight(self, key):
+        """Whether a call for key is running, so a new caller would share it"""
+        return key in self.calls
+
+    def do(self, key, func):
+        """Return (result of func(), whether it was shared with another caller's call)"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
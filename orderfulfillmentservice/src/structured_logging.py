@@ -0,0 +1,178 @@
+"""Structured, sampled logging written from a background thread.
+
+`configure_logging()` routes every log record through a queue to a listener
+thread, so the thread that logs only builds a record and enqueues it: message
+formatting and writing to stdout happen on the listener. Records are dropped
+before they are built when their category is sampled out:
+
+    LOG_SAMPLE_RATES="order.received=0.01,cart=0.1,werkzeug=0.05"
+
+keeps 1% of `order.received`, 10% of `cart` and everything under it (e.g.
+`cart.updated`), and 5% of Flask's access log; categories without a rate are
+always kept. Other settings:
+
+    LOG_LEVEL      INFO by default
+    LOG_FORMAT     "text" (default) or "json" for one JSON object per line
+    LOG_PAYLOADS   "true" also logs full request and event payloads at DEBUG
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+
+from .config import get_config
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_listener = None
+_lock = threading.Lock()
+
+
+def parse_rates(value):
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            category, rate = item.split("=", 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+
+class Sampler:
+    """Per-category keep rates, looked up by the longest dotted prefix of the category."""
+
+    def __init__(self, rates):
+        self.rates = rates
+        self.cache = {}
+
+    def rate(self, category):
+        rate = self.cache.get(category)
+        if rate is None:
+            name = category
+            rate = 1.0
+            while name:
+                if name in self.rates:
+                    rate = self.rates[name]
+                    break
+                name = name.rpartition(".")[0]
+            self.cache[category] = rate
+        return rate
+
+    def keep(self, category):
+        rate = self.rate(category)
+        return rate >= 1 or random.random() < rate
+
+
+class SamplingFilter(logging.Filter):
+    """Samples records from plain loggers (e.g. werkzeug) by logger name."""
+
+    def __init__(self, sampler):
+        super().__init__()
+        self.sampler = sampler
+
+    def filter(self, record):
+        if getattr(record, "sampled", False):
+            return True
+        return self.sampler.keep(getattr(record, "category", record.name))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted, leaving formatting to the listener thread.
+
+    The stock QueueHandler formats in the logging thread so records can be
+    pickled; these queues never leave the process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """The scripts' usual format, followed by the record's fields as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "category": getattr(record, "category", record.name),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def payloads_enabled():
+    return get_config().get("LOG_PAYLOADS", "").lower() == "true"
+
+
+def configure_logging():
+    """Install the queue handler on the root logger, once per process"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        config = get_config()
+        formatter = JsonFormatter() if config.get("LOG_FORMAT", "").lower() == "json" else TextFormatter(TEXT_FORMAT)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(formatter)
+
+        records = queue.SimpleQueue()
+        handler = DeferredQueueHandler(records)
+        handler.addFilter(SamplingFilter(EventLogger.sampler))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(config.get("LOG_LEVEL", "INFO").upper())
+        if payloads_enabled():
+            logging.getLogger("payloads").setLevel(logging.DEBUG)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+class EventLogger:
+    """Logs categorised events with fields, sampled before the record is built.
+
+    Use %-style arguments rather than f-strings, so messages that are sampled
+    out or below the log level are never formatted.
+    """
+
+    sampler = Sampler(parse_rates(get_config().get("LOG_SAMPLE_RATES")))
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+        self.payload_logger = logging.getLogger(f"payloads.{name}")
+        self.log_payloads = payloads_enabled()
+
+    def event(self, category, message, *args, level=logging.INFO, **fields):
+        if not self.logger.isEnabledFor(level) or not self.sampler.keep(category):
+            return
+        self.logger.log(level, message, *args, extra={"category": category, "fields": fields, "sampled": True})
+
+    def payload(self, category, payload):
+        """Log a full payload at DEBUG, only when LOG_PAYLOADS is on"""
+        if not self.log_payloads or not self.sampler.keep(category):
+            return
+        # Serialised here, as the caller may change the payload before the listener formats it
+        self.payload_logger.debug(
+            "%s %s", category, json.dumps(payload, default=str),
+            extra={"category": category, "sampled": True},
+        )
@@ -1,30 +1,20 @@
 import pprint
-from requests.auth import HTTPDigestAuth
-import requests
-import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from constants import *
-from dotenv import load_dotenv
+from src.config import get_config
+from src.atlas_client import get_client, log_calls
 from stream_processors_config import stream_processors, kafka_stream_processor
 
-load_dotenv()  # Load environment variables from .env file
+config = get_config()
 
-PUBLIC_KEY = os.environ["ATLAS_API_PUBLIC_KEY"]
-PRIVATE_KEY = os.environ["ATLAS_API_PRIVATE_KEY"]
-PROJECT_ID = os.environ["ATLAS_PROJECT_ID"]
-STREAM_INSTANCE_NAME = os.environ["STREAM_PROCESSOR_INSTANCE_NAME"]
-
-headers = {
-    "Accept": "application/vnd.atlas.2024-05-30+json",
-    "Content-Type": "application/json",
-}
+PROJECT_ID = config["ATLAS_PROJECT_ID"]
+STREAM_INSTANCE_NAME = config["STREAM_PROCESSOR_INSTANCE_NAME"]
 
 def start_processor(processor):
     print(f"\nStarting stream processor: {processor['name']}")
-    response = requests.post(
-        f"https://cloud.mongodb.com/api/atlas/v2/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/processor/{processor['name']}:start",
-        auth=HTTPDigestAuth(PUBLIC_KEY, PRIVATE_KEY),
-        headers=headers
+    response = get_client().post(
+        f"/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}/processor/{processor['name']}:start"
     )
     if not (200 <= response.status_code < 300):
         resp_json = response.json()
@@ -37,12 +27,17 @@ def start_processor(processor):
     pprint.pprint(response.json())
     return True
 
-use_kafka = "--kafka" in sys.argv
 
-if use_kafka:
-    if not start_processor(kafka_stream_processor):
-        sys.exit(1)
-else:
-    for processor in stream_processors:
-        if not start_processor(processor):
-            sys.exit(1)
\ No newline at end of file
+if __name__ == "__main__":
+    log_calls()
+    use_kafka = "--kafka" in sys.argv
+
+    if use_kafka:
+        if not start_processor(kafka_stream_processor):
+            sys.exit(1)
+    else:
+        # Processors are independent, so start them all at once
+        with ThreadPoolExecutor(max_workers=len(stream_processors)) as pool:
+            results = list(pool.map(start_processor, stream_processors))
+        if not all(results):
+            sys.exit(1)
@@ -23,6 +23,7 @@ stream_processors = [
                     "order_id": "$fullDocument.order_id",
                     "status": "order_created",
                     "items": "$fullDocument.items",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -77,6 +78,7 @@ stream_processors = [
                     "cart_id": "$message.message.cart_id",
                     "status": "$message.message.status",
                     "items": "$message.message.items",
+                    "trace": "$message.message.trace",
                 }
             },
             {
@@ -138,6 +140,7 @@ stream_processors = [
                     "order_id": "$message.message.order_id",
                     "status": "$message.message.status",
                     "items": "$message.message.items",
+                    "trace": "$message.message.trace",
                 }
             },
             {
@@ -186,6 +189,7 @@ stream_processors = [
                     "status": "order_created",
                     "items": "$fullDocument.items",
                     "customer_id": "$fullDocument.customer_id",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -234,6 +238,7 @@ stream_processors = [
                     "cart_id": "$fullDocument.cart_id",
                     "items": "$fullDocument.items",
                     "source_collection": "$fullDocument.destination_collection",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -278,6 +283,7 @@ stream_processors = [
                     "cart_id": "$fullDocument.cart_id",
                     "items": "$fullDocument.items",
                     "source_collection": "$fullDocument.destination_collection",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -321,6 +327,7 @@ stream_processors = [
                     "_id": "$fullDocument.order_id",
                     "items": "$fullDocument.items",
                     "source_collection": "$fullDocument.destination_collection",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -371,6 +378,7 @@ stream_processors = [
                     "_id": "$fullDocument.order_id",
                     "items": "$fullDocument.items",
                     "source_collection": "$fullDocument.destination_collection",
+                    "trace": "$fullDocument.trace",
                 }
             },
             {
@@ -418,6 +426,7 @@ stream_processors = [
                     "customer_id": "$fullDocument.cart_data.customer_id",
                     "timestamp": "$fullDocument.timestamp",
                     "order_id": "$fullDocument.cart_data.order_id",
+                    "trace": "$fullDocument.cart_data.trace",
                 }
             },
             {
@@ -433,6 +442,252 @@ stream_processors = [
             },
         ],
     },
+    {
+        "name": "orderValidationMetricsStreamProcessor",
+        "pipeline": [
+            {
+                "$source": {
+                    "connectionName": "mongoDBSink",
+                    "db": "orderdb",
+                    "config": {"fullDocument": "whenAvailable"},
+                }
+            },
+            {
+                "$match": {
+                    "operationType": "insert",
+                    "ns.coll": {"$in": ["orders", "fulfilled_orders", "invalid_orders"]},
+                }
+            },
+            {
+                "$tumblingWindow": {
+                    "interval": {"size": 1, "unit": "minute"},
+                    "pipeline": [
+                        {
+                            "$group": {
+                                "_id": None,
+                                "orders_created": {
+                                    "$sum": {"$cond": [{"$eq": ["$ns.coll", "orders"]}, 1, 0]}
+                                },
+                                "orders_fulfilled": {
+                                    "$sum": {"$cond": [{"$eq": ["$ns.coll", "fulfilled_orders"]}, 1, 0]}
+                                },
+                                "orders_invalid": {
+                                    "$sum": {"$cond": [{"$eq": ["$ns.coll", "invalid_orders"]}, 1, 0]}
+                                },
+                            }
+                        }
+                    ],
+                }
+            },
+            {
+                "$project": {
+                    "_id": {
+                        "$concat": [
+                            "order_validation:",
+                            {"$dateToString": {"date": {"$meta": "stream.window.start"}}},
+                        ]
+                    },
+                    "metric": "order_validation",
+                    "window_start": {"$meta": "stream.window.start"},
+                    "window_end": {"$meta": "stream.window.end"},
+                    "orders_created": 1,
+                    "orders_fulfilled": 1,
+                    "orders_invalid": 1,
+                    "validation_ratio": {
+                        "$cond": {
+                            "if": {"$gt": [{"$add": ["$orders_fulfilled", "$orders_invalid"]}, 0]},
+                            "then": {
+                                "$divide": [
+                                    "$orders_fulfilled",
+                                    {"$add": ["$orders_fulfilled", "$orders_invalid"]},
+                                ]
+                            },
+                            "else": None,
+                        }
+                    },
+                }
+            },
+            {
+                "$merge": {
+                    "into": {
+                        "connectionName": "mongoDBSink",
+                        "db": "metricsdb",
+                        "coll": "order_metrics",
+                    },
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ],
+    },
+    {
+        "name": "shipmentMetricsStreamProcessor",
+        "pipeline": [
+            {
+                "$source": {
+                    "connectionName": "mongoDBSink",
+                    "db": "shipmentdb",
+                    "config": {"fullDocument": "whenAvailable"},
+                }
+            },
+            {
+                "$match": {
+                    "operationType": "insert",
+                    "ns.coll": {"$in": ["shipped_orders", "delayed_orders"]},
+                }
+            },
+            {
+                "$tumblingWindow": {
+                    "interval": {"size": 1, "unit": "minute"},
+                    "pipeline": [
+                        {
+                            "$group": {
+                                "_id": None,
+                                "orders_shipped": {
+                                    "$sum": {"$cond": [{"$eq": ["$ns.coll", "shipped_orders"]}, 1, 0]}
+                                },
+                                "orders_delayed": {
+                                    "$sum": {"$cond": [{"$eq": ["$ns.coll", "delayed_orders"]}, 1, 0]}
+                                },
+                            }
+                        }
+                    ],
+                }
+            },
+            {
+                "$project": {
+                    "_id": {
+                        "$concat": [
+                            "shipments:",
+                            {"$dateToString": {"date": {"$meta": "stream.window.start"}}},
+                        ]
+                    },
+                    "metric": "shipments",
+                    "window_start": {"$meta": "stream.window.start"},
+                    "window_end": {"$meta": "stream.window.end"},
+                    "orders_shipped": 1,
+                    "orders_delayed": 1,
+                    "on_time_ratio": {
+                        "$cond": {
+                            "if": {"$gt": [{"$add": ["$orders_shipped", "$orders_delayed"]}, 0]},
+                            "then": {
+                                "$divide": [
+                                    "$orders_shipped",
+                                    {"$add": ["$orders_shipped", "$orders_delayed"]},
+                                ]
+                            },
+                            "else": None,
+                        }
+                    },
+                }
+            },
+            {
+                "$merge": {
+                    "into": {
+                        "connectionName": "mongoDBSink",
+                        "db": "metricsdb",
+                        "coll": "order_metrics",
+                    },
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ],
+    },
+    {
+        "name": "cartConversionMetricsStreamProcessor",
+        "pipeline": [
+            {
+                "$source": {
+                    "connectionName": "mongoDBSink",
+                    "db": "shoppingcartdb",
+                    "coll": "shoppingcart",
+                    "config": {"fullDocument": "whenAvailable"},
+                }
+            },
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "replace"]},
+                }
+            },
+            {
+                # 5 minute windows every minute smooth out the conversion rate,
+                # since a cart is usually created several minutes before checkout
+                "$hoppingWindow": {
+                    "interval": {"size": 5, "unit": "minute"},
+                    "hopSize": {"size": 1, "unit": "minute"},
+                    "pipeline": [
+                        {
+                            "$group": {
+                                "_id": None,
+                                "carts_created": {
+                                    "$sum": {
+                                        "$cond": [
+                                            {"$eq": ["$fullDocument.status", "create_shopping_cart"]},
+                                            1,
+                                            0,
+                                        ]
+                                    }
+                                },
+                                "carts_updated": {
+                                    "$sum": {
+                                        "$cond": [
+                                            {"$eq": ["$fullDocument.status", "update_shopping_cart"]},
+                                            1,
+                                            0,
+                                        ]
+                                    }
+                                },
+                                "orders_created": {
+                                    "$sum": {
+                                        "$cond": [
+                                            {"$eq": ["$fullDocument.status", "create_order"]},
+                                            1,
+                                            0,
+                                        ]
+                                    }
+                                },
+                            }
+                        }
+                    ],
+                }
+            },
+            {
+                "$project": {
+                    "_id": {
+                        "$concat": [
+                            "cart_conversion:",
+                            {"$dateToString": {"date": {"$meta": "stream.window.start"}}},
+                        ]
+                    },
+                    "metric": "cart_conversion",
+                    "window_start": {"$meta": "stream.window.start"},
+                    "window_end": {"$meta": "stream.window.end"},
+                    "carts_created": 1,
+                    "carts_updated": 1,
+                    "orders_created": 1,
+                    "conversion_rate": {
+                        "$cond": {
+                            "if": {"$gt": ["$carts_created", 0]},
+                            "then": {"$divide": ["$orders_created", "$carts_created"]},
+                            "else": None,
+                        }
+                    },
+                }
+            },
+            {
+                "$merge": {
+                    "into": {
+                        "connectionName": "mongoDBSink",
+                        "db": "metricsdb",
+                        "coll": "order_metrics",
+                    },
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ],
+    },
 ]
 
 kafka_stream_processor = {
@@ -453,6 +708,7 @@ kafka_stream_processor = {
                 "customer_id": "$customer_id",
                 "timestamp": "$timestamp",
                 "order_id": "$order_id",
+                "trace": "$trace",
             }
         },
         {
@@ -0,0 +1,63 @@
+"""Apply the `$project` stages from stream_processors_config to documents locally.
+
+Local consumers reuse the projections of the stream processors they stand in for,
+so a change to a pipeline in stream_processors_config.py is picked up by both.
+Only field paths ("$a.b") and literal values are supported, which is all the
+cart projections use.
+"""
+from pymongo import ReplaceOne
+
+
+def find_stage(processor, stage_name):
+    """Return the first stage named `stage_name` in a processor's pipeline."""
+    for stage in processor["pipeline"]:
+        if stage_name in stage:
+            return stage[stage_name]
+    raise KeyError(f"{processor['name']} has no {stage_name} stage")
+
+
+def compile_projection(project_spec):
+    """Compile a `$project` spec into a function mapping a document to its projection.
+
+    As in the aggregation framework, fields whose path is missing from the input
+    document are left out of the output.
+    """
+    getters = []
+    for field, expression in project_spec.items():
+        if isinstance(expression, str) and expression.startswith("$"):
+            getters.append((field, tuple(expression[1:].split(".")), None))
+        else:
+            getters.append((field, None, expression))
+
+    missing = object()
+
+    def project(doc):
+        result = {}
+        for field, path, literal in getters:
+            if path is None:
+                result[field] = literal
+                continue
+            value = doc
+            for key in path:
+                if not isinstance(value, dict):
+                    value = missing
+                    break
+                value = value.get(key, missing)
+            if value is not missing:
+                result[field] = value
+        return result
+
+    return project
+
+
+def latest_replacements(docs, project):
+    """Project `docs` into upserts for an unordered bulk write, keeping the latest per _id.
+
+    An unordered bulk write may apply operations on the same _id in any order,
+    so older projections of a document must be dropped before the write.
+    """
+    latest = {}
+    for doc in docs:
+        projected = project(doc)
+        latest[projected["_id"]] = projected
+    return [ReplaceOne({"_id": _id}, projected, upsert=True) for _id, projected in latest.items()]
@@ -0,0 +1,36 @@
+"""SharedDigestAuth against the local Atlas API stub.
+
+SharedDigestAuth relies on the per-thread state of requests' HTTPDigestAuth, so
+this checks that a requests upgrade hasn't broken the sharing.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.atlas_api_stub import AtlasApiStub, StubConfig
+from src.atlas_client import AtlasClient
+
+CALLS = 32
+
+
+@pytest.fixture
+def stub():
+    stub = AtlasApiStub(StubConfig(digest=True, public_key="pub", private_key="secret")).start()
+    yield stub
+    stub.stop()
+
+
+def test_digest_challenge_is_answered_once_across_threads(stub):
+    client = AtlasClient("pub", "secret", base_url=stub.base_url, max_concurrency=8)
+    assert client.get("/groups/project/clusters").status_code == 200
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(lambda _: client.get("/groups/project/clusters").status_code, range(CALLS)))
+
+    assert statuses == [200] * CALLS
+    assert stub.state.counters["challenges"] == 1
+
+
+def test_wrong_key_is_still_rejected(stub):
+    client = AtlasClient("pub", "wrong", base_url=stub.base_url, max_attempts=1)
+    assert client.get("/groups/project/clusters").status_code == 401
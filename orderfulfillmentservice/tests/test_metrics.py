@@ -0,0 +1,43 @@
+"""The log-linear histogram's buckets and their Prometheus export."""
+import pytest
+
+from src.metrics import EXPORT_BUCKETS, Histogram, LogLinearHistogram
+
+
+def test_every_value_falls_in_its_bucket():
+    histogram = LogLinearHistogram(max_value=1 << 16)
+    previous_upper = -1
+    for i in range(histogram.index(histogram.max_value) + 1):
+        upper = histogram.bucket_upper_bound(i)
+        # Buckets are contiguous: each one starts right after the previous one ends
+        assert histogram.index(previous_upper + 1) == i
+        assert histogram.index(upper) == i
+        assert upper - previous_upper <= max(1, upper / histogram.sub_buckets)
+        previous_upper = upper
+
+
+def bucket_counts(metric):
+    lines = [line for line in metric.render() if line.startswith(f"{metric.name}_bucket")]
+    return {line.split('le="')[1].split('"')[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+
+
+@pytest.mark.parametrize("bound", EXPORT_BUCKETS)
+def test_export_bound_is_inclusive(bound):
+    metric = Histogram("duration_seconds", "Durations")
+    metric.observe_micros(round(bound * 1_000_000))
+    counts = bucket_counts(metric)
+    assert counts[str(bound)] == 1
+    assert all(n == 0 for le, n in counts.items() if le != "+Inf" and float(le) < bound)
+
+
+def test_export_counts():
+    metric = Histogram("duration_seconds", "Durations")
+    for micros in (400, 1000, 1001, 1100, 3000):
+        metric.observe_micros(micros)
+    counts = bucket_counts(metric)
+    assert counts["0.0005"] == 1
+    # 1001 shares 1000's bucket, 1100 is past it
+    assert counts["0.001"] == 3
+    assert counts["0.0025"] == 4
+    assert counts["0.005"] == 5
+    assert counts["+Inf"] == 5
@@ -0,0 +1,283 @@
+"""Measure how long a create_order cart event takes to become a shipment in order_history.
+
+The generator stamps every event with a trace id and the time it was sent, and
+the stream processors carry that `trace` field through to order_history. This
+watches order_history and records, for every traced order that reaches it as
+shipped or delayed, the time from the event being sent to the tracer seeing the
+shipment event. With --stages the intermediate collections are watched too, so
+the latency is also broken down per stream processor hop.
+
+Times are taken on this machine when a change arrives, so run the tracer next
+to the generator (both use the local wall clock) and expect the change stream's
+own delay to be included in every stage.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+from constants import CREATE_ORDER
+from create_db_collections import get_mongodb_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# (stage, db, collection) in the order a create_order event passes through them
+STAGE_COLLECTIONS = [
+    ("cart", "shoppingcartdb", "shoppingcart"),
+    ("order", "orderdb", "orders"),
+    ("validated", "orderdb", "fulfilled_orders"),
+    ("validated", "orderdb", "invalid_orders"),
+    ("shipment", "shipmentdb", "shipped_orders"),
+    ("shipment", "shipmentdb", "delayed_orders"),
+]
+STAGES = ["emit", "cart", "order", "validated", "shipment", "history"]
+
+HISTORY_DB = "orderhistorydb"
+HISTORY_COLLECTION = "order_history"
+# order_history fields that mark the end of the flow, and the outcome they record
+FINAL_EVENTS = {
+    "create_shipped_order_status_event": "order_shipped",
+    "create_delayed_shipped_order_status_event": "order_delayed",
+}
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples_ms):
+    values = sorted(samples_ms)
+    summary = {"count": len(values)}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = percentile(values, p)
+    summary["max_ms"] = values[-1] if values else None
+    return summary
+
+
+class LatencyTracer:
+    """Collects when each traced order reached each stage and the latencies between them."""
+
+    def __init__(self, trace_ttl=600):
+        self.trace_ttl = trace_ttl
+        self.started_ns = time.time_ns()
+        self.lock = threading.Lock()
+        self.traces = {}
+        # Completed trace ids and when they completed, so changes that arrive
+        # afterwards (e.g. a late $merge into order_history) don't count them again
+        self.completed = {}
+        self.samples = {}
+        self.outcomes = {}
+
+    def observe(self, stage, trace, seen_ns, outcome=None):
+        """Record that the order traced by `trace` reached `stage` at `seen_ns`"""
+        if not isinstance(trace, dict) or "trace_id" not in trace:
+            return
+        # Orders emitted before the tracer started would only be partly seen
+        if trace.get("emitted_ns", 0) < self.started_ns:
+            return
+        with self.lock:
+            if trace["trace_id"] in self.completed:
+                return
+            stages = self.traces.setdefault(trace["trace_id"], {"emit": trace["emitted_ns"]})
+            if stage in stages:
+                return
+            stages[stage] = seen_ns
+            if outcome:
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if stage == "history":
+                self.complete(trace["trace_id"], stages)
+
+    def complete(self, trace_id, stages):
+        seen = [s for s in STAGES if s in stages]
+        for previous, current in zip(seen, seen[1:]):
+            self.add_sample(f"{previous}->{current}", stages[current] - stages[previous])
+        self.add_sample("end_to_end", stages["history"] - stages["emit"])
+        del self.traces[trace_id]
+        self.completed[trace_id] = time.time_ns()
+
+    def add_sample(self, name, elapsed_ns):
+        self.samples.setdefault(name, []).append(elapsed_ns / 1e6)
+
+    def prune(self):
+        """Forget orders that never reached order_history, e.g. invalid ones, and old completed ones"""
+        cutoff = time.time_ns() - self.trace_ttl * 1_000_000_000
+        with self.lock:
+            for trace_id in [t for t, stages in self.traces.items() if stages["emit"] < cutoff]:
+                del self.traces[trace_id]
+            for trace_id in [t for t, completed_ns in self.completed.items() if completed_ns < cutoff]:
+                del self.completed[trace_id]
+
+    def report(self):
+        with self.lock:
+            names = ["end_to_end"] + [
+                f"{a}->{b}" for a, b in zip(STAGES, STAGES[1:])
+            ] + sorted(n for n in self.samples if n != "end_to_end")
+            stages = {
+                name: summarize(self.samples[name])
+                for name in dict.fromkeys(names)
+                if name in self.samples
+            }
+            return {
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "traced_seconds": (time.time_ns() - self.started_ns) / 1e9,
+                "in_flight": len(self.traces),
+                "outcomes": dict(self.outcomes),
+                "latency": stages,
+            }
+
+
+def watch(collection, pipeline, on_change, stop_event, full_document=None):
+    """Call `on_change` with every matching change and its arrival time until `stop_event` is set"""
+    while not stop_event.is_set():
+        try:
+            with collection.watch(pipeline, full_document=full_document, max_await_time_ms=500) as stream:
+                while not stop_event.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        on_change(change, time.time_ns())
+        except PyMongoError as e:
+            logging.warning(f"Change stream on {collection.full_name} failed ({e}), reopening")
+            stop_event.wait(1)
+
+
+def stage_watcher(tracer, stage, outcome=None):
+    def on_change(change, seen_ns):
+        tracer.observe(stage, change["fullDocument"].get("trace"), seen_ns, outcome=outcome)
+
+    return on_change
+
+
+def history_watcher(tracer):
+    def on_change(change, seen_ns):
+        doc = change.get("fullDocument") or {}
+        for field, outcome in FINAL_EVENTS.items():
+            if field in doc:
+                tracer.observe("history", doc.get("trace"), seen_ns, outcome=outcome)
+                return
+
+    return on_change
+
+
+def print_report(report):
+    print(
+        f"\n{report['traced_seconds']:.0f}s traced, {report['in_flight']} order(s) in flight, "
+        f"outcomes: {report['outcomes'] or '-'}"
+    )
+    rows = report["latency"]
+    if not rows:
+        print("No traced orders have reached order_history yet.")
+        return
+    width = max(len("stage"), *(len(name) for name in rows))
+    header = "".join(f"{h:>10}" for h in ["count", "p50 ms", "p95 ms", "p99 ms", "max ms"])
+    print(f"{'stage':<{width}}{header}")
+    for name, s in rows.items():
+        values = [s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]]
+        print(f"{name:<{width}}{s['count']:>10}" + "".join(f"{v:>10.0f}" for v in values))
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trace checkout-to-shipment latency through the stream processors"
+    )
+    parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="Also watch the intermediate collections to break latency down per stage",
+    )
+    parser.add_argument(
+        "--report", default="latency_report.json", help="Report file, rewritten every --interval"
+    )
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between reports")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument(
+        "--trace-ttl",
+        type=float,
+        default=600,
+        help="Seconds to wait for an order to reach order_history, and to remember completed ones, before forgetting it",
+    )
+    args = parser.parse_args()
+
+    client = get_mongodb_client()
+    tracer = LatencyTracer(trace_ttl=args.trace_ttl)
+    stop_event = threading.Event()
+    threads = []
+
+    inserts = [
+        {"$match": {"operationType": {"$in": ["insert", "replace"]}, "fullDocument.trace": {"$exists": True}}}
+    ]
+    watchers = [
+        (
+            client[HISTORY_DB][HISTORY_COLLECTION],
+            [
+                {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+                {"$match": {"$or": [{f"fullDocument.{field}": {"$exists": True}} for field in FINAL_EVENTS]}},
+            ],
+            history_watcher(tracer),
+            "updateLookup",
+        )
+    ]
+    if args.stages:
+        for stage, db, coll in STAGE_COLLECTIONS:
+            pipeline = inserts
+            if stage == "cart":
+                pipeline = inserts + [{"$match": {"fullDocument.status": CREATE_ORDER}}]
+            # Invalid orders end here, so count their outcome where they are seen
+            outcome = "order_invalid" if coll == "invalid_orders" else None
+            watchers.append((client[db][coll], pipeline, stage_watcher(tracer, stage, outcome), None))
+
+    for collection, pipeline, on_change, full_document in watchers:
+        thread = threading.Thread(
+            target=watch,
+            args=(collection, pipeline, on_change, stop_event, full_document),
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+
+    logging.info(
+        f"Tracing order latency on {len(watchers)} collection(s), "
+        f"reporting to {args.report} every {args.interval:g}s. Press Ctrl+C to stop."
+    )
+    deadline = time.time() + args.duration if args.duration else None
+    try:
+        while True:
+            remaining = args.interval if deadline is None else deadline - time.time()
+            time.sleep(max(0, min(args.interval, remaining)))
+            if deadline is not None and time.time() >= deadline:
+                break
+            tracer.prune()
+            report = tracer.report()
+            write_report(report, args.report)
+            print_report(report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=2)
+        report = tracer.report()
+        write_report(report, args.report)
+        print_report(report)
+        logging.info(f"Latency report written to {args.report}")
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
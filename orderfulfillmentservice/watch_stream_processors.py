@@ -0,0 +1,164 @@
+"""Poll stream processor stats and show per-processor throughput as a live table.
+
+Every poll fetches the stats of all processors in stream_processors_config.py
+concurrently, appends one JSON line per processor to a local time-series file
+and redraws a table of rates computed from the previous poll. Processors are
+listed in config order, which follows the order flow, so the stage where input
+rates drop or the DLQ grows is the bottleneck.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from src.atlas_client import get_client, log_calls
+from src.config import get_config
+from stream_processors_config import kafka_stream_processor, stream_processors
+
+config = get_config()
+
+PROJECT_ID = config["ATLAS_PROJECT_ID"]
+STREAM_INSTANCE_NAME = config["STREAM_PROCESSOR_INSTANCE_NAME"]
+API_PATH = f"/groups/{PROJECT_ID}/streams/{STREAM_INSTANCE_NAME}"
+
+# Series recorded per processor, from the processor's stats
+STAT_FIELDS = {
+    "input_count": "inputMessageCount",
+    "input_bytes": "inputMessageSize",
+    "output_count": "outputMessageCount",
+    "output_bytes": "outputMessageSize",
+    "dlq_count": "dlqMessageCount",
+    "dlq_bytes": "dlqMessageSize",
+}
+
+
+def fetch_stats(client, name):
+    """One sample of a processor's counters (only its state if they can't be read)"""
+    response = client.get(f"{API_PATH}/processor/{name}")
+    if response.status_code != 200:
+        return {"processor": name, "state": f"HTTP {response.status_code}"}
+    body = response.json()
+    stats = body.get("stats") or {}
+    sample = {"processor": name, "state": body.get("state", "")}
+    for field, stat in STAT_FIELDS.items():
+        sample[field] = stats.get(stat, 0) or 0
+    return sample
+
+
+def poll(client, pool, names):
+    polled_at = time.time()
+    samples = list(pool.map(lambda name: fetch_stats(client, name), names))
+    for sample in samples:
+        sample["time"] = datetime.fromtimestamp(polled_at, timezone.utc).isoformat()
+    return polled_at, samples
+
+
+def rates(sample, previous, elapsed):
+    """Per-second rates and deltas of a sample against the previous one"""
+    if previous is None or "input_count" not in sample or "input_count" not in previous:
+        return None
+    delta = {field: sample[field] - previous[field] for field in STAT_FIELDS}
+    return {
+        "in_per_sec": delta["input_count"] / elapsed,
+        "out_per_sec": delta["output_count"] / elapsed,
+        "in_bytes_per_sec": delta["input_bytes"] / elapsed,
+        "out_bytes_per_sec": delta["output_bytes"] / elapsed,
+        "input_delta": delta["input_count"],
+        "dlq_delta": delta["dlq_count"],
+    }
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def render(samples, previous, elapsed, clear):
+    width = max(len("processor"), *(len(s["processor"]) for s in samples))
+    lines = [
+        f"Stream processor stats at {datetime.now().strftime('%H:%M:%S')}"
+        + (f" (rates over {elapsed:.1f}s)" if elapsed else ""),
+        "",
+        f"{'processor':<{width}}  {'state':<9}{'in/s':>9}{'out/s':>9}"
+        f"{'in B/s':>11}{'out B/s':>11}{'DLQ':>8}{'DLQ +':>7}{'in +':>9}",
+    ]
+    for sample in samples:
+        name = sample["processor"]
+        r = rates(sample, previous.get(name), elapsed) if elapsed else None
+        if r is None:
+            lines.append(
+                f"{name:<{width}}  {sample['state']:<9}{'-':>9}{'-':>9}{'-':>11}{'-':>11}"
+                f"{sample.get('dlq_count', '-'):>8}{'-':>7}{'-':>9}"
+            )
+            continue
+        flag = "  <- DLQ growing" if r["dlq_delta"] > 0 else ""
+        lines.append(
+            f"{name:<{width}}  {sample['state']:<9}{r['in_per_sec']:>9.1f}{r['out_per_sec']:>9.1f}"
+            f"{format_bytes(r['in_bytes_per_sec']):>11}{format_bytes(r['out_bytes_per_sec']):>11}"
+            f"{sample['dlq_count']:>8}{r['dlq_delta']:>+7}{r['input_delta']:>+9}{flag}"
+        )
+    if clear:
+        sys.stdout.write("\033[H\033[2J")
+    print("\n".join(lines), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch stream processor throughput and DLQ growth")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between polls")
+    parser.add_argument(
+        "--output", default="processor_stats.jsonl", help="Time-series file samples are appended to"
+    )
+    parser.add_argument(
+        "--processor", action="append", help="Only watch this processor (can be given more than once)"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=0, help="Stop after this many polls (0 runs until interrupted)"
+    )
+    parser.add_argument(
+        "--log-api-calls",
+        action="store_true",
+        help="Also log every Atlas API call's latency (retries and failures are always logged)",
+    )
+    args = parser.parse_args()
+    # Per-call lines every poll would scroll the table away, so they are opt-in here
+    log_calls(logging.INFO if args.log_api_calls else logging.WARNING)
+
+    names = [p["name"] for p in stream_processors + [kafka_stream_processor]]
+    if args.processor:
+        names = [name for name in names if name in args.processor]
+        if not names:
+            print("None of the given processors are in stream_processors_config.py")
+            sys.exit(1)
+
+    client = get_client()
+    clear = sys.stdout.isatty()
+    previous, previous_time = {}, None
+    polls = 0
+    try:
+        with ThreadPoolExecutor(max_workers=len(names)) as pool, open(args.output, "a") as out:
+            while True:
+                polled_at, samples = poll(client, pool, names)
+                for sample in samples:
+                    out.write(json.dumps(sample) + "\n")
+                out.flush()
+                elapsed = polled_at - previous_time if previous_time else None
+                render(samples, previous, elapsed, clear)
+                previous = {s["processor"]: s for s in samples}
+                previous_time = polled_at
+                polls += 1
+                if args.iterations and polls >= args.iterations:
+                    break
+                time.sleep(max(0, args.interval - (time.time() - polled_at)))
+    except KeyboardInterrupt:
+        pass
+    print(f"\nSamples written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()